@@ -0,0 +1,175 @@
+"""周报生成链路端到端压测（离线，不访问真实 DeepSeek）。
+
+    python benchmarks/bench_report_pipeline.py --levels 1 4 16 --requests 64
+    python benchmarks/bench_report_pipeline.py --latency-ms 50 --json out.json --assert-p95-ms 500
+
+分阶段统计 prompt 构建 / LLM 调用 / 校验 / 写回 的 p50 / p95 / p99 与吞吐，
+并报告 mock 模拟的前缀缓存命中率（输入 token 中命中缓存的比例）与每份合法周报的付费调用数
+（含本地修复后仍缺字段时的补全请求）。
+"""
+from __future__ import annotations
+import argparse, asyncio, contextlib, io, json, os, pathlib, sys, tempfile, time
+import datetime as dt
+from typing import Dict, List
+
+HERE = pathlib.Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE))
+sys.path.insert(0, str(HERE.parent / "src"))
+
+from mock_deepseek import MockConfig, start_mock_server
+
+PHASES = ["prompt", "llm", "validate", "write", "total"]
+
+
+def _pct(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    s = sorted(values)
+    return s[min(len(s) - 1, max(0, int(round(q / 100 * len(s) + 0.5)) - 1))]
+
+
+def _seed(n_users: int) -> dt.date:
+    """每个用户写一整周打卡并聚合出 weekly_summary，返回该周周一。"""
+    from database.db_adapter import insert_events_bulk
+    from metrics.compute_metrics import aggregate_all_users
+
+    week = dt.date(2024, 1, 1)
+    rows = ({"user_id": u, "date": week + dt.timedelta(days=d), "sleep_hours": 7.0,
+             "steps": 8000 + 100 * d, "mood_score": 4, "exercise_minutes": 30,
+             "veggie_servings": 4, "water_ml": 1500, "alcohol": 0}
+            for u in range(1, n_users + 1) for d in range(7))
+    insert_events_bulk(rows)
+    aggregate_all_users()
+    return week
+
+
+async def _run_level(level: int, n_requests: int, n_users: int,
+                     week: dt.date) -> Dict[str, object]:
+    from agent.call_local_llm import acall_llm, DeepSeekError
+    from agent.feedback_agent import (_summary_of_week, _build_report_prompt,
+                                      _finish_report, _report_json, _write_back)
+    from agent.prompt_templates import SYSTEM_PROMPT
+
+    timings: Dict[str, List[float]] = {p: [] for p in PHASES}
+    errors = {"llm": 0, "invalid": 0}
+    sem = asyncio.Semaphore(level)
+
+    async def one(i: int) -> None:
+        uid = i % n_users + 1
+        async with sem:
+            t0 = time.perf_counter()
+            prompt = _build_report_prompt(_summary_of_week(uid, week), uid)
+            t1 = time.perf_counter()
+            try:
+                resp = await acall_llm(prompt, system_prompt=SYSTEM_PROMPT, json_mode=True)
+            except DeepSeekError:
+                errors["llm"] += 1
+                timings["llm"].append(time.perf_counter() - t1)
+                return
+            t2 = time.perf_counter()
+            try:
+                ok = await _finish_report(prompt, resp)       # 本地修复 + 必要时的补全请求
+            except DeepSeekError:
+                ok = None
+            t3 = time.perf_counter()
+            if not ok:
+                errors["invalid"] += 1
+            else:
+                _write_back(week, _report_json(ok), uid)
+            t4 = time.perf_counter()
+
+        timings["prompt"].append(t1 - t0)
+        timings["llm"].append(t2 - t1)
+        timings["validate"].append(t3 - t2)
+        if ok:
+            timings["write"].append(t4 - t3)
+            timings["total"].append(t4 - t0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n_requests)))
+    wall = time.perf_counter() - start
+
+    return {
+        "concurrency": level,
+        "requests": n_requests,
+        "wall_s": wall,
+        "throughput_rps": n_requests / wall,
+        "errors": errors,
+        "phases_ms": {p: {f"p{q}": _pct(v, q) * 1000 for q in (50, 95, 99)}
+                      for p, v in timings.items()},
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--levels", type=int, nargs="+", default=[1, 4, 16])
+    ap.add_argument("--requests", type=int, default=64, help="每个并发级别的请求数")
+    ap.add_argument("--users", type=int, default=32)
+    ap.add_argument("--latency-ms", type=float, default=200.0)
+    ap.add_argument("--jitter-ms", type=float, default=30.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--malformed-rate", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--json", help="把结果写成 JSON（CI 留档 / 对比）")
+    ap.add_argument("--assert-p95-ms", type=float,
+                    help="任一并发级别 total p95 超过该值则退出码 1")
+    a = ap.parse_args()
+
+    server = start_mock_server(MockConfig(
+        latency_ms=a.latency_ms, jitter_ms=a.jitter_ms, error_rate=a.error_rate,
+        malformed_rate=a.malformed_rate, seed=a.seed))
+    tmp = tempfile.mkdtemp(prefix="hc-bench-")
+    # 必须在导入项目模块之前设置
+    os.environ.update({
+        "HC_DB_PATH": os.path.join(tmp, "bench.sqlite"),
+        "DEEPSEEK_ENDPOINT": server.endpoint,
+        "DEEPSEEK_API_KEY": os.environ.get("DEEPSEEK_API_KEY", "mock-key"),
+        "DEEPSEEK_MAX_CONCURRENCY": str(max(a.levels)),
+        "DEEPSEEK_RATE_PER_SEC": "1000000",
+        "DEEPSEEK_RATE_BURST": str(max(a.levels)),
+        "LLM_CACHE": "0",
+    })
+
+    week = _seed(a.users)
+    results = []
+    for level in a.levels:
+        before = (server.prompt_tokens, server.cache_hit_tokens, server.requests)
+        with contextlib.redirect_stdout(io.StringIO()):       # 屏蔽逐次调用日志
+            r = asyncio.run(_run_level(level, a.requests, a.users, week))
+        prompt = server.prompt_tokens - before[0]
+        r["cache_hit_ratio"] = (server.cache_hit_tokens - before[1]) / prompt if prompt else 0.0
+        ok = r["requests"] - r["errors"]["llm"] - r["errors"]["invalid"]
+        r["calls_per_report"] = (server.requests - before[2]) / ok if ok else float("nan")
+        results.append(r)
+
+    print(f"mock latency {a.latency_ms:.0f}±{a.jitter_ms:.0f} ms, "
+          f"error {a.error_rate:.0%}, malformed {a.malformed_rate:.0%}")
+    print(f"{'conc':>4} {'rps':>8} {'err':>5} {'cache':>6} {'calls':>6}  " +
+          "  ".join(f"{p:>21}" for p in PHASES))
+    print(f"{'':>4} {'':>8} {'':>5} {'hit':>6} {'/ok':>6}  " +
+          "  ".join(f"{'p50/p95/p99 ms':>21}" for _ in PHASES))
+    for r in results:
+        errs = r["errors"]["llm"] + r["errors"]["invalid"]
+        cells = []
+        for p in PHASES:
+            ph = r["phases_ms"][p]
+            cells.append(f"{ph['p50']:6.1f}/{ph['p95']:6.1f}/{ph['p99']:6.1f}")
+        print(f"{r['concurrency']:>4} {r['throughput_rps']:>8.1f} {errs:>5} "
+              f"{r['cache_hit_ratio']:>6.0%} {r['calls_per_report']:>6.2f}  " +
+              "  ".join(f"{c:>21}" for c in cells))
+
+    if a.json:
+        pathlib.Path(a.json).write_text(json.dumps(results, indent=2))
+    server.shutdown()
+
+    if a.assert_p95_ms is not None:
+        worst = max(r["phases_ms"]["total"]["p95"] for r in results)
+        if worst > a.assert_p95_ms:
+            print(f"FAIL: total p95 {worst:.1f} ms > {a.assert_p95_ms:.1f} ms")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
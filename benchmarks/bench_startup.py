@@ -0,0 +1,171 @@
+"""冷启动 / 首屏耗时基准：每个场景在全新子进程里跑，统计中位数，便于长期跟踪。
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 7 --json startup.json --assert-ms import_db=400
+    python benchmarks/bench_startup.py --serve          # 另测 streamlit run 到 /healthz 就绪
+
+场景：
+    import_db        import database.db_adapter（不应建连、不应执行 DDL）
+    first_query      已是最新结构的库上首个查询（只读一次 PRAGMA user_version）
+    migrate_fresh    空库上首个查询（完整跑一遍迁移）
+    import_dashboard import ui.dashboard（需 streamlit），并列出被顺带导入的重模块
+    first_paint      streamlit AppTest 跑完 src/ui/app.py 一次（需 streamlit）
+"""
+from __future__ import annotations
+import time
+
+T0 = time.perf_counter()            # 子进程模式下尽早取起点，import 耗时都算进去
+
+import argparse, json, os, pathlib, shutil, socket, statistics, subprocess, sys, tempfile
+import urllib.request
+from typing import Dict, List, Optional
+
+HERE = pathlib.Path(__file__).resolve().parent
+SRC = HERE.parent / "src"
+
+SCENARIOS = ["import_db", "first_query", "migrate_fresh", "import_dashboard", "first_paint"]
+# 首屏不该需要的模块：只有画图 / 生成周报时才加载
+HEAVY = ["pandas", "numpy", "httpx", "pydantic", "altair", "agent.call_local_llm", "agent.report_schema"]
+
+
+# ─────────────────────── 子进程 ───────────────────────
+def _child(scenario: str) -> Dict[str, object]:
+    sys.path.insert(0, str(SRC))
+    out: Dict[str, object] = {}
+    if scenario == "import_db":
+        import database.db_adapter  # noqa: F401
+        out["db_created"] = pathlib.Path(os.environ["HC_DB_PATH"]).exists()
+    elif scenario in ("first_query", "migrate_fresh"):
+        from database.db_adapter import get_profile
+        t = time.perf_counter()
+        get_profile(1)
+        out["query_ms"] = (time.perf_counter() - t) * 1000
+    elif scenario == "import_dashboard":
+        import ui.dashboard  # noqa: F401
+    elif scenario == "first_paint":
+        from streamlit.testing.v1 import AppTest
+        at = AppTest.from_file(str(SRC / "ui" / "app.py"), default_timeout=60).run()
+        out["exceptions"] = [str(e.value) for e in at.exception]
+    out["heavy_loaded"] = [m for m in HEAVY if m in sys.modules]
+    out["elapsed_ms"] = (time.perf_counter() - T0) * 1000
+    return out
+
+
+# ─────────────────────── 父进程 ───────────────────────
+def _has_streamlit() -> bool:
+    import importlib.util
+    return importlib.util.find_spec("streamlit") is not None
+
+
+def _run_child(scenario: str, db_path: str) -> Dict[str, object]:
+    env = {**os.environ, "HC_DB_PATH": db_path, "PYTHONPATH": str(SRC)}
+    t = time.perf_counter()
+    res = subprocess.run([sys.executable, __file__, "--child", scenario], env=env,
+                         capture_output=True, text=True, check=True)
+    wall = (time.perf_counter() - t) * 1000
+    data = json.loads(res.stdout.strip().splitlines()[-1])
+    data["wall_ms"] = wall                           # 含解释器启动
+    return data
+
+
+def _bench(scenario: str, repeat: int, tmp: pathlib.Path) -> Dict[str, object]:
+    migrated = tmp / "migrated.sqlite"
+    if not migrated.exists():
+        _run_child("first_query", str(migrated))     # 预先迁移好，供 first_query 等场景复用
+    runs = []
+    for i in range(repeat):
+        if scenario in ("import_db", "migrate_fresh"):
+            db = tmp / f"fresh-{scenario}-{i}.sqlite"
+        else:
+            db = migrated
+        runs.append(_run_child(scenario, str(db)))
+    summary = {k: statistics.median(r[k] for r in runs)
+               for k in ("wall_ms", "elapsed_ms", "query_ms") if k in runs[0]}
+    summary["heavy_loaded"] = sorted({m for r in runs for m in r["heavy_loaded"]})
+    for k in ("db_created", "exceptions"):
+        if k in runs[0]:
+            summary[k] = runs[-1][k]
+    return summary
+
+
+def _serve_ready(tmp: pathlib.Path, timeout: float = 60.0) -> Optional[float]:
+    """streamlit run 从启动到 /_stcore/health 返回 ok 的毫秒数。"""
+    if shutil.which("streamlit") is None:
+        return None
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    env = {**os.environ, "HC_DB_PATH": str(tmp / "migrated.sqlite")}
+    t = time.perf_counter()
+    proc = subprocess.Popen(["streamlit", "run", str(SRC / "ui" / "app.py"),
+                             "--server.headless", "true", "--server.port", str(port)],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - t < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health",
+                                            timeout=1) as r:
+                    if r.status == 200:
+                        return (time.perf_counter() - t) * 1000
+            except OSError:
+                time.sleep(0.05)
+        return None
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--scenarios", nargs="+", default=SCENARIOS, choices=SCENARIOS)
+    ap.add_argument("--serve", action="store_true", help="另测 streamlit run 的服务就绪时间")
+    ap.add_argument("--json", help="把结果写成 JSON（CI 留档 / 对比）")
+    ap.add_argument("--assert-ms", nargs="*", default=[], metavar="SCENARIO=MS",
+                    help="某场景 wall 中位数超过阈值则退出码 1")
+    a = ap.parse_args()
+
+    if a.child:
+        print(json.dumps(_child(a.child)))
+        return 0
+
+    tmp = pathlib.Path(tempfile.mkdtemp(prefix="hc-startup-"))
+    results: Dict[str, Dict[str, object]] = {}
+    for sc in a.scenarios:
+        if sc in ("import_dashboard", "first_paint") and not _has_streamlit():
+            print(f"skip {sc}: streamlit not installed")
+            continue
+        results[sc] = _bench(sc, a.repeat, tmp)
+    if a.serve:
+        results["serve_ready"] = {"wall_ms": _serve_ready(tmp)}
+
+    print(f"{'scenario':<18}{'wall ms':>10}{'in-proc ms':>12}  heavy modules loaded")
+    for sc, r in results.items():
+        wall = r.get("wall_ms")
+        inproc = r.get("elapsed_ms")
+        print(f"{sc:<18}{wall if wall is None else f'{wall:.0f}':>10}"
+              f"{'' if inproc is None else f'{inproc:.0f}':>12}  "
+              f"{', '.join(r.get('heavy_loaded', [])) or '-'}")
+        if r.get("db_created"):
+            print(f"  WARN: {sc} created the database file at import time")
+        if r.get("exceptions"):
+            print(f"  WARN: {sc} raised {r['exceptions']}")
+
+    if a.json:
+        pathlib.Path(a.json).write_text(json.dumps(results, indent=2))
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    failed = False
+    for spec in a.assert_ms:
+        sc, ms = spec.split("=")
+        wall = results.get(sc, {}).get("wall_ms")
+        if wall is not None and wall > float(ms):
+            print(f"FAIL: {sc} {wall:.0f} ms > {float(ms):.0f} ms")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
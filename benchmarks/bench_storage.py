@@ -0,0 +1,140 @@
+"""存储后端对比：同一份合成长历史分别在 SQLite 与 DuckDB 上跑周聚合与范围扫描。
+
+    python benchmarks/bench_storage.py --users 200 --days 1460
+    python benchmarks/bench_storage.py --users 1000 --days 730 --repeat 5 --json out.json
+
+场景：
+    agg_all        所有 (用户, 周) 一次性重算（历史回填 / 口径变更）
+    agg_recent     每个用户最近 4 周（调度器日常增量）
+    scan_user      单用户全量历史（数值列）
+    scan_month     全体用户某一个月（数值列）
+    agg_after_write 写入一条事件后再算该用户最近一周（DuckDB 含镜像增量同步）
+DuckDB 额外报告首次整库镜像耗时（之后只按 user_events_version 重载变化的用户）。
+"""
+from __future__ import annotations
+import argparse, json, os, pathlib, random, statistics, sys, tempfile, time
+import datetime as dt
+from typing import Callable, Dict, List
+
+HERE = pathlib.Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "src"))
+
+SCENARIOS = ["agg_all", "agg_recent", "scan_user", "scan_month", "agg_after_write"]
+
+
+def _seed(n_users: int, n_days: int, seed: int) -> dt.date:
+    """每个用户 n_days 天的随机打卡（约 5% 缺失日），返回首日。"""
+    from database.db_adapter import insert_events_bulk
+    rng = random.Random(seed)
+    first = dt.date(2020, 1, 6)
+
+    def rows():
+        for u in range(1, n_users + 1):
+            for d in range(n_days):
+                if rng.random() < 0.05:
+                    continue
+                yield {"user_id": u, "date": first + dt.timedelta(days=d),
+                       "sleep_hours": round(rng.uniform(4.5, 9.5), 1),
+                       "steps": rng.randint(500, 20000), "mood_score": rng.randint(1, 5),
+                       "exercise_minutes": rng.randint(0, 120),
+                       "veggie_servings": rng.randint(0, 8), "water_ml": rng.randint(500, 3000),
+                       "alcohol": int(rng.random() < 0.1)}
+    insert_events_bulk(rows(), chunk_size=20000)
+    return first
+
+
+def _time(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return {"median_ms": statistics.median(samples), "min_ms": min(samples)}
+
+
+def _run_backend(name: str, n_users: int, n_days: int, first: dt.date,
+                 repeat: int) -> Dict[str, object]:
+    from database.backend import make_backend
+    from database.db_adapter import _POOL, insert_event
+
+    backend = make_backend(_POOL, name)
+    last = first + dt.timedelta(days=n_days - 1)
+    n_weeks = n_days // 7
+    all_weeks = [(u, first + dt.timedelta(weeks=w))
+                 for u in range(1, n_users + 1) for w in range(n_weeks)]
+    recent = [(u, first + dt.timedelta(weeks=w))
+              for u in range(1, n_users + 1) for w in range(n_weeks - 4, n_weeks)]
+    month = last.replace(day=1)
+    cols = ["user_id", "date", "sleep_hours", "steps", "mood_score", "exercise_minutes"]
+
+    out: Dict[str, object] = {"backend": name}
+    if name == "duckdb":
+        t0 = time.perf_counter()
+        backend.sync()
+        out["mirror_ms"] = (time.perf_counter() - t0) * 1000
+
+    def agg(weeks):
+        with _POOL.reader() as conn:
+            return backend.weekly_aggregates(conn, weeks)
+
+    counter = iter(range(10 ** 9))
+
+    def agg_after_write():
+        uid = next(counter) % n_users + 1
+        insert_event(user_id=uid, date=last, steps=random.randint(0, 20000))
+        agg([(uid, first + dt.timedelta(weeks=n_weeks - 1))])
+
+    cases = {
+        "agg_all":         lambda: agg(all_weeks),
+        "agg_recent":      lambda: agg(recent),
+        "scan_user":       lambda: backend.scan("events", 1, cols),
+        "scan_month":      lambda: backend.scan("events", columns=cols, start=month, end=last),
+        "agg_after_write": agg_after_write,
+    }
+    out["rows"] = {"agg_all": len(agg(all_weeks)),
+                   "scan_month": len(backend.scan("events", columns=cols, start=month,
+                                                  end=last))}
+    out["scenarios"] = {k: _time(fn, repeat) for k, fn in cases.items()}
+    if name == "duckdb":
+        out["sync_stats"] = dict(backend.stats)
+        backend.duck.close()
+    return out
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--days", type=int, default=1460, help="每个用户的历史天数")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--backends", nargs="+", default=["sqlite", "duckdb"])
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--json", help="把结果写成 JSON（CI 留档 / 对比）")
+    a = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="hc-bench-")
+    os.environ["HC_DB_PATH"] = os.path.join(tmp, "bench.sqlite")   # 必须在导入项目模块之前设置
+
+    t0 = time.perf_counter()
+    first = _seed(a.users, a.days, a.seed)
+    print(f"seeded {a.users} users × {a.days} days in {time.perf_counter() - t0:.1f}s")
+
+    results = [_run_backend(b, a.users, a.days, first, a.repeat) for b in a.backends]
+
+    print(f"{'scenario':<16}" + "".join(f"{r['backend']:>14}" for r in results))
+    for s in SCENARIOS:
+        print(f"{s:<16}" + "".join(f"{r['scenarios'][s]['median_ms']:>11.1f} ms"
+                                   for r in results))
+    for r in results:
+        if "mirror_ms" in r:
+            print(f"{r['backend']} initial mirror: {r['mirror_ms']:.0f} ms")
+    if len({json.dumps(r["rows"]) for r in results}) > 1:
+        print(f"WARN: backends disagree on row counts: {[r['rows'] for r in results]}")
+
+    if a.json:
+        pathlib.Path(a.json).write_text(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
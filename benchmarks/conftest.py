@@ -0,0 +1,53 @@
+"""pytest-benchmark 基准套件（test_bench_*.py）的公共夹具：临时库 + 确定性合成负载。
+
+    pytest benchmarks                                  # 跑一遍，打印各用例耗时
+    pytest benchmarks --benchmark-save=baseline        # 在参考机器上保存基线（.benchmarks/<机器>/）
+    pytest benchmarks --benchmark-compare              # 与最近保存的基线比较，任一用例中位数
+                                                       # 变慢超过 REGRESSION_THRESHOLD 即失败
+    pytest benchmarks --benchmark-compare=0001 --benchmark-compare-fail=min:10%   # 指定基线 / 阈值
+
+规模：HC_BENCH_USERS（默认 20）× HC_BENCH_YEARS（默认 2），比较基线时两边规模须一致。
+需要 pytest-benchmark（pip install pytest-benchmark）；未安装时整个目录跳过。
+"""
+from __future__ import annotations
+import os, pathlib, sys, tempfile
+
+import pytest
+
+HERE = pathlib.Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "src"))
+sys.path.insert(0, str(HERE))
+
+# 须在导入 database.* 之前：DB_PATH 在 db_adapter 导入时确定
+_TMP = pathlib.Path(tempfile.mkdtemp(prefix="hc-bench-"))
+os.environ["HC_DB_PATH"] = str(_TMP / "bench.sqlite")
+
+BENCH_USERS = int(os.getenv("HC_BENCH_USERS", "20"))
+BENCH_YEARS = float(os.getenv("HC_BENCH_YEARS", "2"))
+BENCH_SEED  = 0
+REGRESSION_THRESHOLD = "min:25%"      # 与基线比较时的默认失败条件
+
+try:
+    import pytest_benchmark  # noqa: F401
+except ImportError:          # 可选依赖
+    collect_ignore_glob = ["test_bench_*.py"]
+
+
+def pytest_configure(config):
+    """--benchmark-compare 未显式给 --benchmark-compare-fail 时套用默认阈值。
+
+    不写进 pytest.ini 的 addopts：不比较时 pytest-benchmark 会因缺少对比对象直接报错。"""
+    opt = config.option
+    if getattr(opt, "benchmark_compare", None) and not getattr(opt, "benchmark_compare_fail", None):
+        from pytest_benchmark.utils import parse_compare_fail
+        opt.benchmark_compare_fail = [parse_compare_fail(REGRESSION_THRESHOLD)]
+
+
+@pytest.fixture(scope="session")
+def workload():
+    """N 用户 × M 年的合成库（含修改），已完成一次全量增量聚合。"""
+    from workload import load
+    from metrics.compute_metrics import aggregate_all_users
+    info = load(BENCH_USERS, BENCH_YEARS, BENCH_SEED)
+    aggregate_all_users()
+    return info
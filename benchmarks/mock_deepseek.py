@@ -0,0 +1,202 @@
+"""本地 DeepSeek chat-completions 替身：离线压测 / CI 用。
+
+    python benchmarks/mock_deepseek.py --port 8799 --latency-ms 300 --error-rate 0.05
+    export DEEPSEEK_ENDPOINT=http://127.0.0.1:8799/v1/chat/completions
+
+支持：可配置延迟与抖动、SSE 流式、HTTP 错误注入、畸形 JSON 注入、usage 字段，
+以及按 64 token 为单位的前缀缓存模拟（usage 中的 prompt_cache_hit / miss_tokens）。
+"""
+from __future__ import annotations
+import argparse, hashlib, json, random, threading, time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+_REPORT = {
+    "summary": "本周睡眠稳定、步数达标 🎉，情绪略有波动，继续保持运动节奏。",
+    "action_items": [
+        {"goal": "早睡", "target": "23:00 前入睡", "period_weeks": 2,
+         "motivation": "睡得好，白天才更有劲 💪"},
+        {"goal": "多走路", "target": "每日 9 000 步", "period_weeks": 4,
+         "motivation": "每一步都算数 🔥"},
+        {"goal": "多喝水", "target": "每日 1 800 ml", "period_weeks": 3,
+         "motivation": "水润一整天 💧"},
+    ],
+}
+
+
+CACHE_UNIT_TOKENS = 64                # DeepSeek 前缀缓存的存储单位
+_CHARS_PER_TOKEN  = 2                 # 与下面 usage 的粗略换算一致
+
+
+def _malformed(text: str, rng: random.Random, json_mode: bool = False) -> str:
+    """常见的模型输出畸形：前置废话 / 代码块 / 截断 / 尾逗号 / 条目数不对。
+    JSON 模式下输出总是 JSON 本身，只剩截断与条目数不对两类。"""
+    kinds = ["truncate", "two_items"]
+    if not json_mode:
+        kinds += ["prose", "fence", "trailing_comma"]
+    kind = rng.choice(kinds)
+    if kind == "prose":
+        return "好的，以下是本周反馈：\n" + text
+    if kind == "fence":
+        return f"```json\n{text}\n```"
+    if kind == "truncate":
+        return text[: len(text) * 2 // 3]
+    if kind == "trailing_comma":
+        return text[:-2] + ",]}"
+    bad = dict(_REPORT, action_items=_REPORT["action_items"][:2])
+    return json.dumps(bad, ensure_ascii=False)
+
+
+@dataclass
+class MockConfig:
+    latency_ms: float = 300.0        # 非流式总延迟 / 流式首包延迟
+    jitter_ms: float = 50.0
+    chunk_delay_ms: float = 10.0     # 流式相邻 chunk 间隔
+    chunk_chars: int = 8
+    error_rate: float = 0.0          # 返回 500 / 429 的比例
+    malformed_rate: float = 0.0      # 返回畸形 JSON 的比例
+    seed: int | None = None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "MockServer"
+
+    def log_message(self, *args) -> None:       # 静默
+        pass
+
+    def _sleep(self, ms: float) -> None:
+        cfg, rng = self.server.cfg, self.server.rng
+        time.sleep(max(0.0, ms + rng.uniform(-cfg.jitter_ms, cfg.jitter_ms)) / 1000)
+
+    def _send_json(self, status: int, body: dict) -> None:
+        raw = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_POST(self) -> None:
+        cfg, rng = self.server.cfg, self.server.rng
+        req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        prompt_chars = sum(len(m.get("content", "")) for m in req.get("messages", []))
+        cache_hit = self.server.prefix_hit(req.get("messages", []))
+
+        with self.server.lock:
+            self.server.requests += 1
+            fail = rng.random() < cfg.error_rate
+            bad = rng.random() < cfg.malformed_rate
+
+        if fail:
+            self._sleep(cfg.latency_ms / 4)
+            status = rng.choice([429, 500])
+            self._send_json(status, {"error": {"message": f"mock {status}"}})
+            return
+
+        content = json.dumps(_REPORT, ensure_ascii=False)
+        if bad:
+            json_mode = (req.get("response_format") or {}).get("type") == "json_object"
+            content = _malformed(content, rng, json_mode)
+        prompt_tokens = prompt_chars // _CHARS_PER_TOKEN
+        cache_hit = min(cache_hit, prompt_tokens)      # 角色标记也计入了前缀
+        usage = {"prompt_tokens": prompt_tokens,
+                 "prompt_cache_hit_tokens": cache_hit,
+                 "prompt_cache_miss_tokens": prompt_tokens - cache_hit,
+                 "completion_tokens": len(content) // 2,
+                 "total_tokens": (prompt_chars + len(content)) // 2}
+
+        if not req.get("stream"):
+            self._sleep(cfg.latency_ms)
+            self._send_json(200, {
+                "id": "mock", "object": "chat.completion", "model": req.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.close_connection = True
+        self._sleep(cfg.latency_ms)
+        try:
+            for i in range(0, len(content), cfg.chunk_chars):
+                chunk = {"choices": [{"index": 0,
+                                      "delta": {"content": content[i:i + cfg.chunk_chars]}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(cfg.chunk_delay_ms / 1000)
+            final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                     "usage": usage}
+            self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+        except (BrokenPipeError, ConnectionResetError):
+            pass                                    # 客户端提前中止
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256         # 默认 5，高并发下会出现 1s SYN 重传毛刺
+
+    def __init__(self, addr: Tuple[str, int], cfg: MockConfig):
+        super().__init__(addr, _Handler)
+        self.cfg = cfg
+        self.rng = random.Random(cfg.seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cache_hit_tokens = 0
+        self._prefixes: set = set()
+
+    def prefix_hit(self, messages: list) -> int:
+        """与此前请求逐字相同的最长前缀（按整单位计）的 token 数，并登记本次前缀。"""
+        text = "".join(f"<{m.get('role')}>{m.get('content', '')}" for m in messages)
+        unit = CACHE_UNIT_TOKENS * _CHARS_PER_TOKEN
+        digests = [hashlib.sha1(text[:n].encode()).digest()
+                   for n in range(unit, len(text) + 1, unit)]
+        with self.lock:
+            hit = 0
+            for d in digests:
+                if d not in self._prefixes:
+                    break
+                hit += CACHE_UNIT_TOKENS
+            self._prefixes.update(digests)
+            self.prompt_tokens += len(text) // _CHARS_PER_TOKEN
+            self.cache_hit_tokens += hit
+        return hit
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+
+def start_mock_server(cfg: MockConfig | None = None, host: str = "127.0.0.1",
+                      port: int = 0) -> MockServer:
+    """后台线程启动；port=0 自动分配端口，用 server.endpoint 取地址。"""
+    server = MockServer((host, port), cfg or MockConfig())
+    threading.Thread(target=server.serve_forever, name="mock-deepseek",
+                     daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock DeepSeek chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--chunk-delay-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    a = parser.parse_args()
+
+    srv = MockServer((a.host, a.port), MockConfig(
+        latency_ms=a.latency_ms, jitter_ms=a.jitter_ms, chunk_delay_ms=a.chunk_delay_ms,
+        error_rate=a.error_rate, malformed_rate=a.malformed_rate, seed=a.seed))
+    print(f"mock DeepSeek listening on {srv.endpoint}")
+    srv.serve_forever()
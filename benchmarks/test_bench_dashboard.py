@@ -0,0 +1,42 @@
+"""仪表盘 / 周报的数据准备基准：图表长表、日粒度降采样、prompt 表格。"""
+from __future__ import annotations
+import datetime as dt
+
+import pytest
+
+from database import db_adapter as db
+
+
+@pytest.fixture(scope="module")
+def summary_row(workload):
+    with db.read_conn() as conn:
+        return dict(conn.execute("SELECT * FROM weekly_summary WHERE user_id = 1 "
+                                 "ORDER BY week_start DESC LIMIT 1;").fetchone())
+
+
+@pytest.mark.benchmark(group="prep")
+def test_week_group_long(benchmark, workload):
+    pytest.importorskip("streamlit")
+    from ui.dashboard import GROUP_HIGH, _week_group_long
+    df_week = db.fetch_recent_summaries(limit=26, user_id=1)
+    benchmark(_week_group_long, df_week, GROUP_HIGH)
+
+
+@pytest.mark.benchmark(group="prep")
+def test_daily_points_lttb(benchmark, workload):
+    """全部历史的逐日步数降到 240 点（仪表盘"全部"范围的单张日粒度图）。"""
+    series = db.get_series(1)
+    first, last = series.bounds()
+    benchmark(series.points, "steps", first, last + dt.timedelta(days=1), 240)
+
+
+@pytest.mark.benchmark(group="prep")
+def test_to_markdown_table(benchmark, summary_row):
+    from agent.feedback_agent import _to_markdown_table
+    benchmark(_to_markdown_table, summary_row)
+
+
+@pytest.mark.benchmark(group="prep")
+def test_to_trend_table(benchmark, summary_row):
+    from agent.feedback_agent import _to_trend_table
+    benchmark(_to_trend_table, summary_row)
@@ -0,0 +1,132 @@
+"""存储与聚合层基准：写入、仪表盘读取（缓存命中 / 穿透）、增量聚合。"""
+from __future__ import annotations
+import datetime as dt, itertools, threading
+
+import pytest
+
+from database import db_adapter as db
+from metrics.compute_metrics import aggregate_last_full_week, aggregate_unprocessed_weeks
+
+NEW_USER = 10_000                       # insert_event_new 专用：不与合成用户重叠
+WRITERS  = 8                            # insert_event_concurrent：并发写入线程数 × 每线程条数
+PER_WRITER = 25
+
+
+def _last_full_week(workload) -> dt.date:
+    last = workload["last"]
+    return last - dt.timedelta(days=last.weekday() + 7)
+
+
+# ─────────────────────── 写入 ───────────────────────
+@pytest.mark.benchmark(group="write")
+def test_insert_event_new_day(benchmark, workload):
+    """逐日新增：连击状态 O(1) 维护 + 各触发器。"""
+    days = (dt.date(2000, 1, 1) + dt.timedelta(days=i) for i in itertools.count())
+    benchmark(lambda: db.insert_event(NEW_USER, date=next(days), sleep_hours=7.5,
+                                      steps=8000, mood_score=4, exercise_minutes=30))
+
+
+@pytest.mark.benchmark(group="write")
+def test_insert_event_update(benchmark, workload):
+    """同一天重复提交（upsert 改值）。"""
+    steps = itertools.cycle([6000, 9000])
+    day = _last_full_week(workload)
+    benchmark(lambda: db.insert_event(1, date=day, steps=next(steps)))
+
+
+@pytest.mark.benchmark(group="write")
+def test_insert_event_concurrent(benchmark, workload):
+    """WRITERS 个线程同时打卡（每条等提交）：写队列把同时到达的写入合并为一次提交。"""
+    rounds = itertools.count()
+
+    def run():
+        base = dt.date(1990, 1, 1) + dt.timedelta(days=PER_WRITER * next(rounds))
+        def writer(uid):
+            for i in range(PER_WRITER):
+                db.insert_event(uid, date=base + dt.timedelta(days=i), steps=8000, mood_score=4)
+        threads = [threading.Thread(target=writer, args=(NEW_USER + 1 + t,)) for t in range(WRITERS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    benchmark.pedantic(run, rounds=10)
+
+
+# ─────────────────────── 仪表盘读取 ───────────────────────
+@pytest.mark.benchmark(group="read")
+def test_get_streak_cached(benchmark, workload):
+    benchmark(db.get_streak, 1)
+
+
+@pytest.mark.benchmark(group="read")
+def test_get_streak_uncached(benchmark, workload):
+    benchmark(db._get_streak.uncached, 1, dt.date.today())
+
+
+@pytest.mark.benchmark(group="read")
+def test_fetch_recent_summaries_cached(benchmark, workload):
+    benchmark(db.fetch_recent_summaries, 4, 1)
+
+
+@pytest.mark.benchmark(group="read")
+def test_fetch_recent_summaries_uncached(benchmark, workload):
+    benchmark(db.fetch_recent_summaries.uncached, 26, 1)
+
+
+@pytest.mark.benchmark(group="read")
+def test_fetch_events_of_week_cached(benchmark, workload):
+    benchmark(db.fetch_events_of_week, _last_full_week(workload), 1)
+
+
+@pytest.mark.benchmark(group="read")
+def test_fetch_events_of_week_uncached(benchmark, workload):
+    benchmark(db.fetch_events_of_week.uncached, _last_full_week(workload), 1)
+
+
+@pytest.mark.benchmark(group="read")
+def test_fetch_live_week_uncached(benchmark, workload):
+    benchmark(db.fetch_live_week.uncached, 1)
+
+
+@pytest.mark.benchmark(group="read")
+def test_fetch_rollups_uncached(benchmark, workload):
+    benchmark(db.fetch_rollups.uncached, "month", 1)
+
+
+# ─────────────────────── 增量聚合 ───────────────────────
+@pytest.mark.benchmark(group="aggregate")
+def test_aggregate_unprocessed_weeks_one_dirty(benchmark, workload):
+    """改 8 周前的一天后的增量聚合：重算 1 周 + 其后 8 周的趋势 + 所在月 / 季汇总。
+
+    每轮改同一天，工作量固定，轮次之间才可比。"""
+    day = _last_full_week(workload) - dt.timedelta(weeks=8)
+    mood = itertools.cycle([2, 4])
+
+    def dirty_one_day():
+        db.insert_event(2, date=day, mood_score=next(mood))
+        return (2,), {}
+
+    benchmark.pedantic(aggregate_unprocessed_weeks, setup=dirty_one_day,
+                       rounds=50, iterations=1, warmup_rounds=2)
+
+
+@pytest.mark.benchmark(group="aggregate")
+def test_aggregate_unprocessed_weeks_idle(benchmark, workload):
+    """没有脏周时的页面内兜底聚合（每次渲染仪表盘都会走一遍）。"""
+    aggregate_unprocessed_weeks(3)
+    benchmark(aggregate_unprocessed_weeks, 3)
+
+
+@pytest.mark.benchmark(group="aggregate")
+def test_aggregate_last_full_week(benchmark, workload):
+    """上周 7 天齐全的用户：整周重算 + 写回 + 趋势。"""
+    ws = _last_full_week(workload)
+    with db.read_conn() as conn:
+        row = conn.execute("SELECT user_id FROM events WHERE date >= ? AND date < ? "
+                           "GROUP BY user_id HAVING COUNT(*) = 7 ORDER BY user_id LIMIT 1;",
+                           (ws, ws + dt.timedelta(days=7))).fetchone()
+    if row is None:
+        pytest.skip("合成数据里没有上周 7 天齐全的用户")
+    assert aggregate_last_full_week(row[0])
+    benchmark(aggregate_last_full_week, row[0])
@@ -0,0 +1,166 @@
+"""确定性合成负载：N 个用户 × M 年的 events 打卡记录，带缺勤、补录修改与离群值。
+
+    python benchmarks/workload.py --users 50 --years 2 --out events.csv   # 导出 CSV（db_adapter import 可导入）
+    python benchmarks/workload.py --users 50 --years 2 --load             # 直接写入 HC_DB_PATH 指向的库
+
+同一 (seed, users, years, end) 生成的数据完全相同；end 缺省为今天，"上一完整周"总落在数据内。
+每个用户有各自的基线（睡眠 / 步数 / 情绪 / 运动 / 饮酒习惯）与打卡坚持度，在此之上叠加：
+    - 周末效应：步数偏少、睡眠偏多；步数随季节缓慢起伏
+    - 缺勤：日常漏打卡（按坚持度）+ 每年 1–2 段 3–14 天的连续空白（出差 / 假期）
+    - 缺字段：少量记录只填了部分指标
+    - 离群值：约 0.5% 的记录出现极端但仍在 ingest._RANGES 内的数值（马拉松、通宵、补觉）
+    - 补录修改：约 2% 的已有日子事后改了部分指标（走 insert_event 的 upsert 路径）
+"""
+from __future__ import annotations
+import argparse, csv, math, pathlib, random, sys, time
+import datetime as dt
+from typing import Any, Dict, Iterator, List, Optional
+
+HERE = pathlib.Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "src"))
+
+FIELDS = ["user_id", "date", "sleep_hours", "steps", "mood_score", "exercise_minutes",
+          "veggie_servings", "water_ml", "screen_hours", "alcohol", "caffeine"]
+
+MISSING_FIELD_RATE = 0.03
+OUTLIER_RATE       = 0.005
+EDIT_RATE          = 0.02
+
+
+def _persona(rng: random.Random) -> Dict[str, float]:
+    return {
+        "adherence": rng.uniform(0.75, 0.98),        # 日常打卡概率
+        "sleep":     rng.gauss(7.1, 0.6),
+        "steps":     rng.uniform(3000, 12000),
+        "mood":      rng.uniform(2.5, 4.2),
+        "exercise":  rng.uniform(5, 60),
+        "veggie":    rng.uniform(1, 5),
+        "water":     rng.uniform(1000, 2600),
+        "screen":    rng.uniform(2, 8),
+        "drinker":   rng.uniform(0, 0.3),
+        "coffee":    rng.uniform(0.1, 0.9),
+    }
+
+
+def _gaps(rng: random.Random, first: dt.date, n_days: int) -> set:
+    """每年 1–2 段 3–14 天的连续空白。"""
+    out = set()
+    for _ in range(max(1, round(n_days / 365 * rng.uniform(1, 2)))):
+        start = rng.randrange(n_days)
+        out.update(range(start, min(n_days, start + rng.randint(3, 14))))
+    return out
+
+
+def _clip(v: float, lo: float, hi: float) -> float:
+    return min(hi, max(lo, v))
+
+
+def _day(rng: random.Random, p: Dict[str, float], day: dt.date) -> Dict[str, Any]:
+    weekend = day.weekday() >= 5
+    season = 1 + 0.15 * math.sin(2 * math.pi * day.timetuple().tm_yday / 365)
+    row = {
+        "sleep_hours":      round(_clip(rng.gauss(p["sleep"] + (0.7 if weekend else 0), 0.8), 3, 12), 1),
+        "steps":            int(_clip(rng.gauss(p["steps"] * season * (0.7 if weekend else 1),
+                                                p["steps"] * 0.3), 0, 40000)),
+        "mood_score":       int(_clip(round(rng.gauss(p["mood"], 0.8)), 1, 5)),
+        "exercise_minutes": int(_clip(rng.gauss(p["exercise"], p["exercise"] * 0.6), 0, 240)),
+        "veggie_servings":  int(_clip(round(rng.gauss(p["veggie"], 1.2)), 0, 10)),
+        "water_ml":         int(_clip(rng.gauss(p["water"], 400), 200, 5000)) // 50 * 50,
+        "screen_hours":     round(_clip(rng.gauss(p["screen"], 1.5), 0, 16), 1),
+        "alcohol":          int(rng.random() < p["drinker"] * (2 if weekend else 1)),
+        "caffeine":         int(rng.random() < p["coffee"]),
+    }
+    if rng.random() < OUTLIER_RATE:
+        field, value = rng.choice([("steps", rng.randint(45000, 120000)),
+                                   ("sleep_hours", rng.choice([0.5, 1.5, 13.0, 15.5])),
+                                   ("exercise_minutes", rng.randint(240, 600)),
+                                   ("water_ml", rng.randint(6000, 12000))])
+        row[field] = value
+    if rng.random() < MISSING_FIELD_RATE:
+        for field in rng.sample(sorted(row), rng.randint(1, 4)):
+            row[field] = None
+    return row
+
+
+def generate(n_users: int, years: float, seed: int = 0,
+             end: Optional[dt.date] = None) -> Iterator[Dict[str, Any]]:
+    """按 (user_id, date) 顺序产出 events 行（dict，列见 FIELDS）。"""
+    end = end or dt.date.today()
+    n_days = int(round(years * 365))
+    first = end - dt.timedelta(days=n_days - 1)
+    for uid in range(1, n_users + 1):
+        rng = random.Random(f"{seed}:{uid}")         # 每个用户独立的随机流：增减用户不影响其他用户
+        p = _persona(rng)
+        gaps = _gaps(rng, first, n_days)
+        for i in range(n_days):
+            if i in gaps or rng.random() > p["adherence"]:
+                continue
+            day = first + dt.timedelta(days=i)
+            yield {"user_id": uid, "date": day, **_day(rng, p, day)}
+
+
+def edits(rows: List[Dict[str, Any]], seed: int = 0,
+          rate: float = EDIT_RATE) -> List[Dict[str, Any]]:
+    """对已有行的事后修改：每条只带 user_id / date 与 1–2 个改动的指标。"""
+    rng = random.Random(f"{seed}:edits")
+    tweak = {   # 在原值附近改（补录 / 手误更正）；原值为空时相当于补填
+        "sleep_hours":      lambda v: round(_clip((v or 7) + rng.uniform(-1.5, 1.5), 0, 24), 1),
+        "steps":            lambda v: int((v or 6000) * rng.uniform(0.6, 1.4)),
+        "mood_score":       lambda v: int(_clip((v or 3) + rng.choice([-1, 1]), 1, 5)),
+        "exercise_minutes": lambda v: int((v or 20) * rng.uniform(0.5, 2)),
+    }
+    out = []
+    for row in rows:
+        if rng.random() >= rate:
+            continue
+        fields = rng.sample(sorted(tweak), rng.randint(1, 2))
+        out.append({"user_id": row["user_id"], "date": row["date"],
+                    **{f: tweak[f](row[f]) for f in fields}})
+    return out
+
+
+def load(n_users: int, years: float, seed: int = 0,
+         end: Optional[dt.date] = None) -> Dict[str, Any]:
+    """批量写入合成数据并逐条应用修改，返回规模信息。写入 HC_DB_PATH 指向的库。"""
+    from database.db_adapter import insert_event, insert_events_bulk
+    rows = list(generate(n_users, years, seed, end))
+    errors: list = []
+    n = insert_events_bulk(rows, chunk_size=20000, errors=errors)
+    changes = edits(rows, seed)
+    for e in changes:
+        insert_event(**e)
+    return {"users": n_users, "rows": n, "rejected": len(errors), "edits": len(changes),
+            "first": min(r["date"] for r in rows), "last": max(r["date"] for r in rows)}
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--years", type=float, default=2)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--end", type=dt.date.fromisoformat, help="最后一天（YYYY-MM-DD），缺省为今天")
+    ap.add_argument("--out", help="导出 CSV 路径")
+    ap.add_argument("--load", action="store_true", help="写入 HC_DB_PATH 指向的库")
+    a = ap.parse_args()
+    if not a.out and not a.load:
+        ap.error("需要 --out 或 --load")
+
+    t0 = time.perf_counter()
+    if a.out:
+        with open(a.out, "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=FIELDS)
+            w.writeheader()
+            n = 0
+            for row in generate(a.users, a.years, a.seed, a.end):
+                w.writerow(row)
+                n += 1
+        print(f"wrote {n} rows to {a.out}")
+    if a.load:
+        print(load(a.users, a.years, a.seed, a.end))
+    print(f"done in {time.perf_counter() - t0:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+from __future__ import annotations
+import asyncio, datetime as dt, random, sys, time, uuid
+from typing import List, Optional, Tuple
+
+from agent import llm_cache
+from agent.call_local_llm import acall_llm, DEFAULT_MODEL
+from agent.feedback_agent import (REPORT_TEMPERATURE, _finish_report, _prepare_report,
+                                  _report_json, _validate_llm_output, _write_back_many)
+from agent.prompt_templates import SYSTEM_PROMPT
+from database.db_adapter import read_conn, write_conn
+from telemetry.instrument import inc
+
+# 周报补生成：找出 suggestions 为空 / 不合法的周，限并发批量生成，断点续跑
+
+WORKERS       = 4
+MAX_ATTEMPTS  = 3
+BACKOFF_BASE  = 1.0          # 秒；第 n 次重试等待 BASE * 2^(n-1) + 抖动
+BATCH_SIZE    = 20           # 攒够多少条结果写一次库
+PROGRESS_EVERY = 10
+
+Target = Tuple[int, dt.date]
+
+def find_missing_reports(revalidate: bool = True) -> List[Target]:
+    """suggestions 为空的周；revalidate=True 时连同已有但校验不过的一起返回。"""
+    with read_conn() as c:
+        rows = c.execute(
+            "SELECT user_id, week_start, suggestions FROM weekly_summary "
+            "ORDER BY user_id, week_start;"
+        ).fetchall()
+    out = []
+    for r in rows:
+        raw = r["suggestions"]
+        if not raw or not raw.strip() or (revalidate and not _validate_llm_output(raw, repair=False)):
+            out.append((r["user_id"], r["week_start"]))
+    return out
+
+
+def _open_run(run_id: Optional[str], revalidate: bool) -> Tuple[str, List[Target]]:
+    """续跑指定 / 最近一次未完成的任务；都没有则新建任务并登记全部目标。"""
+    with write_conn() as c:
+        if run_id is None:
+            row = c.execute(
+                "SELECT run_id FROM report_backfill WHERE status = 'pending' "
+                "ORDER BY updated_at DESC LIMIT 1;"
+            ).fetchone()
+            run_id = row["run_id"] if row else None
+
+        if run_id is None:
+            run_id = dt.datetime.now().strftime("%Y%m%d%H%M%S-") + uuid.uuid4().hex[:6]
+            c.executemany(
+                "INSERT INTO report_backfill (run_id, user_id, week_start) "
+                "VALUES (?, ?, ?);",
+                [(run_id, uid, ws) for uid, ws in find_missing_reports(revalidate)]
+            )
+
+        pending = [(r["user_id"], r["week_start"]) for r in c.execute(
+            "SELECT user_id, week_start FROM report_backfill "
+            "WHERE run_id = ? AND status = 'pending' ORDER BY user_id, week_start;",
+            (run_id,))]
+    return run_id, pending
+
+
+class _Progress:
+    def __init__(self, total: int):
+        self.total, self.done, self.failed = total, 0, 0
+        self.t0 = time.perf_counter()
+
+    def tick(self, ok: bool) -> None:
+        if ok:
+            self.done += 1
+        else:
+            self.failed += 1
+        n = self.done + self.failed
+        if n % PROGRESS_EVERY == 0 or n == self.total:
+            elapsed = time.perf_counter() - self.t0
+            rate = n / elapsed if elapsed else 0.0
+            eta = (self.total - n) / rate if rate else float("inf")
+            print(f"[backfill] {n}/{self.total}  ok={self.done} failed={self.failed}  "
+                  f"{rate:.2f} reports/s  ETA {eta:.0f}s", flush=True)
+
+
+async def _generate_one(uid: int, ws: dt.date, max_attempts: int) -> Tuple[Optional[str], int, str]:
+    """返回 (合法 JSON 或 None, 尝试次数, 最后错误)。读库 / 写缓存在线程里做，不占事件循环。"""
+    prepared = await asyncio.to_thread(_prepare_report, uid, ws, True)
+    if prepared is None:
+        return None, 0, "weekly_summary row vanished"
+    _, prompt, key, report = prepared
+    if report:
+        return _report_json(report), 0, ""
+
+    err = ""
+    for attempt in range(1, max_attempts + 1):
+        try:
+            resp = (await acall_llm(prompt, model=DEFAULT_MODEL,
+                                    temperature=REPORT_TEMPERATURE,
+                                    system_prompt=SYSTEM_PROMPT, json_mode=True)).strip()
+            report = await _finish_report(prompt, resp)
+            if report:
+                resp = _report_json(report)
+                await asyncio.to_thread(llm_cache.put, key, DEFAULT_MODEL, resp)
+                return resp, attempt, ""
+            err = "validation failed"
+        except Exception as e:
+            err = f"{type(e).__name__}: {e}"
+        inc("report_attempt_failures_total", mode="backfill")
+        if attempt < max_attempts:
+            inc("report_retries_total", mode="backfill")
+            delay = BACKOFF_BASE * 2 ** (attempt - 1)
+            await asyncio.sleep(delay + random.uniform(0, delay / 2))
+    return None, max_attempts, err[:500]
+
+
+async def abackfill_reports(run_id: Optional[str] = None,
+                            workers: int = WORKERS,
+                            max_attempts: int = MAX_ATTEMPTS,
+                            batch_size: int = BATCH_SIZE,
+                            revalidate: bool = True) -> Tuple[str, int, int]:
+    """执行 / 续跑补生成任务，返回 (run_id, 成功数, 失败数)。"""
+    run_id, pending = _open_run(run_id, revalidate)
+    print(f"[backfill] run {run_id}: {len(pending)} weeks pending")
+    progress = _Progress(len(pending))
+    sem = asyncio.Semaphore(workers)
+    ok_buf: List[Tuple[int, dt.date, str, int]] = []
+    fail_buf: List[Tuple[int, dt.date, int, str]] = []
+
+    def _flush(ok: List[Tuple[int, dt.date, str, int]],
+               fail: List[Tuple[int, dt.date, int, str]]) -> None:
+        if not ok and not fail:
+            return
+        # 结果与检查点同一事务落库：中断后续跑不会重复生成
+        with write_conn() as c:
+            _write_back_many([(uid, ws, js) for uid, ws, js, _ in ok])
+            c.executemany(
+                "UPDATE report_backfill SET status='done', attempts=?, error=NULL, "
+                "updated_at=CURRENT_TIMESTAMP "
+                "WHERE run_id=? AND user_id=? AND week_start=?;",
+                [(n, run_id, uid, ws) for uid, ws, _, n in ok])
+            c.executemany(
+                "UPDATE report_backfill SET status='failed', attempts=?, error=?, "
+                "updated_at=CURRENT_TIMESTAMP "
+                "WHERE run_id=? AND user_id=? AND week_start=?;",
+                [(n, e, run_id, uid, ws) for uid, ws, n, e in fail])
+
+    async def worker(uid: int, ws: dt.date) -> None:
+        async with sem:
+            js, attempts, err = await _generate_one(uid, ws, max_attempts)
+        if js is not None:
+            ok_buf.append((uid, ws, js, attempts))
+        else:
+            fail_buf.append((uid, ws, attempts, err))
+        progress.tick(js is not None)
+        if len(ok_buf) + len(fail_buf) >= batch_size:
+            # 先取走当前批次再进线程落库，期间完成的结果进新缓冲，不会丢也不会重复写
+            ok, fail = ok_buf[:], fail_buf[:]
+            ok_buf.clear()
+            fail_buf.clear()
+            await asyncio.to_thread(_flush, ok, fail)
+
+    try:
+        await asyncio.gather(*(worker(uid, ws) for uid, ws in pending))
+    finally:
+        _flush(ok_buf, fail_buf)
+    return run_id, progress.done, progress.failed
+
+
+def backfill_reports(**kwargs) -> Tuple[str, int, int]:
+    return asyncio.run(abackfill_reports(**kwargs))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="为缺少 / 不合法 suggestions 的周补生成周报")
+    parser.add_argument("--run-id", help="续跑指定任务；缺省续跑最近未完成任务或新建")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--no-revalidate", action="store_true",
+                        help="只处理 suggestions 为空的周，不校验已有内容")
+    args = parser.parse_args()
+
+    rid, ok, failed = backfill_reports(run_id=args.run_id, workers=args.workers,
+                                       max_attempts=args.max_attempts,
+                                       batch_size=args.batch_size,
+                                       revalidate=not args.no_revalidate)
+    print(f"[backfill] run {rid} finished: ok={ok} failed={failed}")
+    sys.exit(0 if failed == 0 else 1)
@@ -1,68 +1,302 @@
 from __future__ import annotations
-import os, json, requests, time
-from typing import List, Dict
-from dotenv import load_dotenv
+import os, json, time, asyncio, threading, weakref, queue
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Dict, Iterator, List, Sequence, TypeVar
 
-load_dotenv()
+import httpx
 
-DEESEEK_ENDPOINT = "https://api.deepseek.com/v1/chat/completions"
+import config  # noqa: F401  —— 读取 DEEPSEEK_* 之前先加载 .env
+from telemetry.instrument import inc, observe, timer
+
+# 可指向本地 mock（benchmarks/mock_deepseek.py）做离线压测
+DEESEEK_ENDPOINT = os.getenv("DEEPSEEK_ENDPOINT",
+                             "https://api.deepseek.com/v1/chat/completions")
 DEFAULT_MODEL    = "deepseek-chat"        # 可以使用reasoner
 
 _API_KEY_ENV = "DEEPSEEK_API_KEY"         # 写到 .env / shell 里：export DEEPSEEK_API_KEY=xxx
 
+# 连接池 / 并发 / 限速，均可用环境变量覆盖
+MAX_CONCURRENCY = int(os.getenv("DEEPSEEK_MAX_CONCURRENCY", "8"))
+RATE_PER_SEC    = float(os.getenv("DEEPSEEK_RATE_PER_SEC", "5"))
+RATE_BURST      = int(os.getenv("DEEPSEEK_RATE_BURST", "10"))
+KEEPALIVE_SEC   = 60
+# JSON 输出模式（response_format=json_object）；接口不支持时设 DEEPSEEK_JSON_MODE=0 关闭
+JSON_MODE       = os.getenv("DEEPSEEK_JSON_MODE", "1") != "0"
+
+T = TypeVar("T")
+
 class DeepSeekError(RuntimeError):
     ...
 
-def _build_messages(prompt: str, system: str | None = None) -> List[Dict]:
+def _build_messages(prompt: str, system: str | None = None,
+                    followup: Sequence[Dict] | None = None) -> List[Dict]:
+    """followup：接在首轮 user 消息之后的多轮消息（如针对上次输出的补全请求），
+    前面的 system + user 保持不变，仍可命中前缀缓存。"""
     msgs = []
     if system:
         msgs.append({"role": "system", "content": system})
     msgs.append({"role": "user", "content": prompt})
+    msgs.extend(followup or ())
     return msgs
 
-def call_local_llm(
-        prompt: str,
-        model: str = DEFAULT_MODEL,
-        temperature: float = 0.7,
-        max_tokens: int | None = None,
-        system_prompt: str | None = None,
-        timeout: int = 60,
-) -> str:
-
-    api_key = os.getenv(_API_KEY_ENV)
-    if not api_key:
-        raise DeepSeekError(f"环境变量 {_API_KEY_ENV} 未设置")
 
+def _build_payload(prompt: str, model: str, temperature: float, stream: bool,
+                   max_tokens: int | None, system_prompt: str | None,
+                   json_mode: bool, followup: Sequence[Dict] | None) -> Dict[str, Any]:
     payload = {
         "model": model,
         "temperature": temperature,
-        "stream": False,
-        "messages": _build_messages(prompt, system_prompt),
+        "stream": stream,
+        "messages": _build_messages(prompt, system_prompt, followup),
     }
     if max_tokens:
         payload["max_tokens"] = max_tokens
+    if json_mode and JSON_MODE:
+        payload["response_format"] = {"type": "json_object"}
+    return payload
+
+
+class TokenBucket:
+    """令牌桶限速：平均 rate 次/秒，允许 capacity 次突发。"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity,
+                                   self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
 
-    t0 = time.time()
-    resp = requests.post(
-        DEESEEK_ENDPOINT,
-        headers=headers,
-        data=json.dumps(payload),
-        timeout=timeout,
-    )
-    latency = time.time() - t0
+class DeepSeekClient:
+    """绑定到单个事件循环的异步客户端：httpx 连接池 keep-alive + 并发上限 + 令牌桶。"""
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY,
+                 rate_per_sec: float = RATE_PER_SEC, burst: int = RATE_BURST):
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_concurrency,
+                                max_keepalive_connections=max_concurrency,
+                                keepalive_expiry=KEEPALIVE_SEC),
+        )
+        self._sem = asyncio.Semaphore(max_concurrency)
+        self._bucket = TokenBucket(rate_per_sec, burst)
+
+    @staticmethod
+    def _headers() -> Dict[str, str]:
+        api_key = os.getenv(_API_KEY_ENV)
+        if not api_key:
+            raise DeepSeekError(f"环境变量 {_API_KEY_ENV} 未设置")
+        return {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        }
+
+    async def chat(self, payload: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        headers = self._headers()
+        async with self._sem:
+            await self._bucket.acquire()
+            resp = await self._http.post(DEESEEK_ENDPOINT, headers=headers,
+                                         content=json.dumps(payload), timeout=timeout)
+        if resp.status_code != 200:
+            inc("llm_errors_total", status=resp.status_code, mode="chat")
+            raise DeepSeekError(
+                f"DeepSeek API {resp.status_code}: {resp.text[:200]}")
+        return resp.json()
+
+    async def stream_chat(self, payload: Dict[str, Any],
+                          timeout: float) -> AsyncIterator[Dict[str, Any]]:
+        """SSE 流：逐个产出 chunk JSON；提前退出迭代即关闭连接。"""
+        headers = self._headers()
+        async with self._sem:
+            await self._bucket.acquire()
+            async with self._http.stream("POST", DEESEEK_ENDPOINT, headers=headers,
+                                         content=json.dumps(payload),
+                                         timeout=timeout) as resp:
+                if resp.status_code != 200:
+                    inc("llm_errors_total", status=resp.status_code, mode="stream")
+                    body = (await resp.aread()).decode("utf-8", "replace")
+                    raise DeepSeekError(f"DeepSeek API {resp.status_code}: {body[:200]}")
+                async for line in resp.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue                      # 空行 / SSE 注释 / keep-alive
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    yield json.loads(data)
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+
+# 每个事件循环一个客户端（httpx / asyncio 原语不能跨循环复用）
+_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, DeepSeekClient]" = \
+    weakref.WeakKeyDictionary()
+
+def get_client() -> DeepSeekClient:
+    loop = asyncio.get_running_loop()
+    client = _CLIENTS.get(loop)
+    if client is None:
+        client = _CLIENTS[loop] = DeepSeekClient()
+    return client
+
+
+async def acall_llm(
+        prompt: str,
+        model: str = DEFAULT_MODEL,
+        temperature: float = 0.7,
+        max_tokens: int | None = None,
+        system_prompt: str | None = None,
+        timeout: int = 60,
+        json_mode: bool = False,
+        followup: Sequence[Dict] | None = None,
+) -> str:
+    payload = _build_payload(prompt, model, temperature, False, max_tokens,
+                             system_prompt, json_mode, followup)
 
-    if resp.status_code != 200:
-        raise DeepSeekError(
-            f"DeepSeek API {resp.status_code}: {resp.text[:200]}")
+    with timer("llm_request_seconds", model=model, mode="chat"):
+        data = await get_client().chat(payload, timeout)
 
-    data = resp.json()
     content = data["choices"][0]["message"]["content"]
-    print(f"DeepSeek {model} {len(prompt)}→{len(content)} tokens, "
-          f"{latency*1000:.0f} ms")
+    usage = data.get("usage")
+    _record_usage(model, usage)
+    if not usage:                        # 兼容不返回 usage 的服务：退而记字符数
+        inc("llm_chars_total", len(prompt), model=model, kind="prompt")
+        inc("llm_chars_total", len(content), model=model, kind="completion")
 
     return content.strip()
+
+
+# prompt_cache_hit / miss：DeepSeek 上下文前缀缓存命中与未命中的输入 token
+_USAGE_KINDS = ("prompt_tokens", "completion_tokens",
+                "prompt_cache_hit_tokens", "prompt_cache_miss_tokens")
+
+def _record_usage(model: str, usage: Dict[str, Any] | None) -> None:
+    """按 API 返回的 usage 字段累计真实 token 数。"""
+    if not usage:
+        return
+    for kind in _USAGE_KINDS:
+        if usage.get(kind):
+            inc("llm_tokens_total", usage[kind], model=model, kind=kind[:-7])
+
+
+async def astream_llm(
+        prompt: str,
+        model: str = DEFAULT_MODEL,
+        temperature: float = 0.7,
+        max_tokens: int | None = None,
+        system_prompt: str | None = None,
+        timeout: int = 60,
+        json_mode: bool = False,
+        followup: Sequence[Dict] | None = None,
+) -> AsyncIterator[str]:
+    """流式调用：逐段产出增量文本。"""
+    payload = _build_payload(prompt, model, temperature, True, max_tokens,
+                             system_prompt, json_mode, followup)
+
+    t0 = time.perf_counter()
+    first = None
+    with timer("llm_request_seconds", model=model, mode="stream"):
+        # aclosing：调用方提前停止时逐层关闭，HTTP 响应与连接当场归还连接池
+        async with aclosing(get_client().stream_chat(payload, timeout)) as chunks:
+            async for chunk in chunks:
+                _record_usage(model, chunk.get("usage"))       # 末尾 chunk 携带 usage
+                choices = chunk.get("choices") or [{}]
+                delta = (choices[0].get("delta") or {}).get("content")
+                if delta:
+                    if first is None:
+                        first = time.perf_counter() - t0
+                        observe("llm_first_token_seconds", first, model=model)
+                    yield delta
+
+
+async def abatch_call_llm(prompts: Sequence[str], **kwargs: Any) -> List[str | BaseException]:
+    """并发调用多个 prompt，结果按输入顺序返回；单条失败以异常对象占位。"""
+    return await asyncio.gather(*(acall_llm(p, **kwargs) for p in prompts),
+                                return_exceptions=True)
+
+
+# ───────────── 同步入口：共用一个后台事件循环，保证连接池跨调用复用 ─────────────
+_BG_LOOP: asyncio.AbstractEventLoop | None = None
+_BG_LOCK = threading.Lock()
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _BG_LOOP
+    with _BG_LOCK:
+        if _BG_LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="deepseek-loop",
+                             daemon=True).start()
+            _BG_LOOP = loop
+    return _BG_LOOP
+
+def run_sync(coro: Awaitable[T]) -> T:
+    """在后台事件循环上执行协程并阻塞等待结果（供 Streamlit 等同步代码使用）。"""
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result()
+
+
+_STREAM_END = object()
+STREAM_STOP_GRACE_SEC = 1.0     # 调用方提前停止后，等流在下一个 chunk 处自行收尾的时间
+
+def stream_local_llm(prompt: str, **kwargs: Any) -> Iterator[str]:
+    """astream_llm 的同步版本；调用方停止迭代（或 close）即结束请求、关闭连接。
+
+    先让后台协程在下一个 chunk 处正常退出（逐层 aclose）；直接取消读取中的
+    流式响应会让 httpcore 的连接停在 ACTIVE 状态，连接池被慢慢占满。
+    流卡住超过 STREAM_STOP_GRACE_SEC 才退回到取消。"""
+    q: "queue.Queue[Any]" = queue.Queue()
+    stop = threading.Event()
+
+    async def _pump() -> None:
+        try:
+            async with aclosing(astream_llm(prompt, **kwargs)) as deltas:
+                async for delta in deltas:
+                    q.put(delta)
+                    if stop.is_set():
+                        break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            q.put(e)
+        finally:
+            q.put(_STREAM_END)
+
+    fut = asyncio.run_coroutine_threadsafe(_pump(), _background_loop())
+    try:
+        while True:
+            item = q.get()
+            if item is _STREAM_END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        try:
+            fut.result(STREAM_STOP_GRACE_SEC)
+        except Exception:
+            fut.cancel()
+
+
+def call_local_llm(
+        prompt: str,
+        model: str = DEFAULT_MODEL,
+        temperature: float = 0.7,
+        max_tokens: int | None = None,
+        system_prompt: str | None = None,
+        timeout: int = 60,
+        json_mode: bool = False,
+) -> str:
+    return run_sync(acall_llm(prompt, model=model, temperature=temperature,
+                              max_tokens=max_tokens, system_prompt=system_prompt,
+                              timeout=timeout, json_mode=json_mode))
@@ -1,19 +1,26 @@
 from __future__ import annotations
 import json, datetime as dt, pathlib, sys, traceback
-from typing import Dict, Any
+import asyncio
+from contextlib import closing
+from typing import Dict, Any, Iterable, Iterator, List, Tuple
 
-from agent.call_local_llm import call_local_llm    # 也可以用你已有的llm封装
-from database.db_adapter import _get_conn
-from agent.prompt_templates import build_prompt
-from agent.report_schema import WeeklyReport
-from database.db_adapter import get_profile
-from agent.prompt_templates import SYSTEM_INSTRUCT, WHO_GUIDE
+from agent.call_local_llm import acall_llm, run_sync, stream_local_llm, DEFAULT_MODEL    # 也可以用你已有的llm封装
+from agent import llm_cache
+from agent.stream_parser import ReportStreamParser, SchemaViolation
+from telemetry.instrument import inc, timed
+from database.db_adapter import read_conn, write_conn, submit_write
+from database.db_adapter import get_profile, DEFAULT_USER_ID, TREND_WINDOWS
+from agent.prompt_templates import SYSTEM_PROMPT
+from agent.token_budget import Section, fit, user_budget
 
-import re
 from typing import Optional
-from agent.report_schema import WeeklyReport
+from pydantic import ValidationError
+from agent.json_repair import RepairError, repair_json
+from agent.report_schema import ACTION_ITEMS, SUMMARY_MAX, ActionItem, WeeklyReport
 
-RETRY_LIMIT = 2
+RETRY_LIMIT = 2                 # 整段请求次数上限
+FIXUP_LIMIT = 1                 # 每次整段请求后，针对缺失 / 不合法字段的补全请求次数
+REPORT_TEMPERATURE = 0.7
 
 def _personal_context(p: dict) -> str:
     if not p:
@@ -26,10 +33,27 @@ def _personal_context(p: dict) -> str:
         f"- 职业: {p.get('occupation','--')}"
     )
 
-def _latest_summary() -> Dict[str, Any]:
-    with _get_conn() as c:
+def _personal_brief(p: dict) -> str:
+    """超预算时的精简档案：只留与建议相关的性别 / 年龄 / BMI。"""
+    if not p:
+        return "（用户未填写档案）"
+    bmi = round(p["weight_kg"] / (p["height_cm"]/100)**2, 1)
+    return f"- {p.get('gender','--')}，{p.get('age','--')} 岁，BMI {bmi}"
+
+def _latest_summary(user_id: int = DEFAULT_USER_ID) -> Dict[str, Any]:
+    with read_conn() as c:
         row = c.execute(
-            "SELECT * FROM weekly_summary ORDER BY week_start DESC LIMIT 1"
+            "SELECT * FROM weekly_summary WHERE user_id = ? "
+            "ORDER BY week_start DESC LIMIT 1",
+            (user_id,)
+        ).fetchone()
+    return dict(row) if row else {}
+
+def _summary_of_week(user_id: int, week_start: dt.date) -> Dict[str, Any]:
+    with read_conn() as c:
+        row = c.execute(
+            "SELECT * FROM weekly_summary WHERE user_id = ? AND week_start = ?",
+            (user_id, week_start)
         ).fetchone()
     return dict(row) if row else {}
 
@@ -46,80 +70,324 @@ def _to_markdown_table(row: Dict[str, Any]) -> str:
     )
     return md
 
-def _fill_defaults(data: dict, default_weeks: int = 4) -> dict:
-    for it in data.get("action_items", []):
-        if not it.get("period_weeks") and not it.get("by_date"):
-            it["period_weeks"] = default_weeks
-    return data
+_TREND_LABELS = {
+    "avg_sleep":      ("平均睡眠 (h)", ".1f"),
+    "total_steps":    ("总步数", ",.0f"),
+    "mood_avg":       ("平均情绪", ".1f"),
+    "exercise_total": ("运动时长 (min)", ".0f"),
+    "veggie_avg":     ("日均蔬果 (份)", ".1f"),
+    "water_total":    ("总饮水 (ml)", ".0f"),
+    "alcohol_days":   ("饮酒天数", ".0f"),
+}
+
+def _to_trend_table(row: Dict[str, Any], windows=TREND_WINDOWS) -> str:
+    """周环比 + 滚动均值表；历史不足（趋势列全空）时返回空串。"""
+    def cell(v, fmt, sign=""):
+        return "--" if v is None else f"{v:{sign}{fmt}}"
 
-_JSON_RE = re.compile(r"\{.*\}", re.S)          # 贪婪匹配首段 JSON
+    lines = []
+    for m, (label, fmt) in _TREND_LABELS.items():
+        wow = row.get(f"{m}_wow")
+        mas = [row.get(f"{m}_ma{w}") for w in windows]
+        if wow is None and all(v is None for v in mas):
+            continue
+        lines.append(f"| {label} | {cell(wow, fmt, '+')} | "
+                     + " | ".join(cell(v, fmt) for v in mas) + " |")
+    if not lines:
+        return ""
+    head = ("| 指标 | 周环比 | " + " | ".join(f"近 {w} 周均值" for w in windows)
+            + " |\n|------|------|" + "------|" * len(windows) + "\n")
+    return head + "\n".join(lines) + "\n"
 
-def _validate_llm_output(raw: str) -> Optional[WeeklyReport]:
+def _check_report(raw: str, repair: bool = True) -> Tuple[Optional[WeeklyReport], Any]:
+    """本地修复 + schema 校验，返回 (合法报告或 None, 修复后的数据)；完全无法解析时数据为 None。
+    repair=False 只接受本身就合法的 JSON（检查已落库的内容）。"""
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError:
+        if not repair:
+            inc("report_validation_failures_total", reason="JSONDecodeError")
+            return None, None
+        try:
+            data = repair_json(raw)             # 围栏 / 前后废话 / 尾逗号 / 截断
+            inc("report_local_repairs_total")
+        except RepairError as e:
+            print("validation error:", e)
+            inc("report_validation_failures_total", reason=type(e).__name__)
+            return None, None
     try:
-        m = _JSON_RE.search(raw)
-        if not m:
-            raise ValueError("no JSON found")
-        data = json.loads(m.group())
+        return WeeklyReport.model_validate(data), data
+    except ValidationError as e:
+        print("validation error:", "; ".join(
+            f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+        inc("report_validation_failures_total", reason=type(e).__name__)
+        return None, data
+
+
+def _validate_llm_output(raw: str, repair: bool = True) -> Optional[WeeklyReport]:
+    return _check_report(raw, repair)[0]
 
-        for it in data.get("action_items", []):
-            if not it.get("period_weeks") and not it.get("by_date"):
-                it["period_weeks"] = 4
 
-        return WeeklyReport.parse_obj(data)
+def _report_json(report: WeeklyReport) -> str:
+    """写库 / 进缓存的规范 JSON：存修复、补全后的结果，而不是模型原文。"""
+    return report.model_dump_json(exclude_none=True)
 
-    except Exception as e:
-        print("validation error:", e)
+
+def _valid_parts(data: Any) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """拆出已经合法的部分：summary（不合法为 None）与合法的行动项（至多 ACTION_ITEMS 条）。"""
+    if not isinstance(data, dict):
+        return None, []
+    summary = data.get("summary")
+    if not (isinstance(summary, str) and 0 < len(summary) <= SUMMARY_MAX):
+        summary = None
+    items = data.get("action_items")
+    valid = []
+    for it in items if isinstance(items, list) else []:
+        try:
+            valid.append(ActionItem.model_validate(it).model_dump(exclude_none=True))
+        except ValidationError:
+            continue
+    return summary, valid[:ACTION_ITEMS]
+
+
+def _merge(summary: Optional[str], items: List[Dict[str, Any]]) -> Optional[WeeklyReport]:
+    if summary is None or len(items) < ACTION_ITEMS:
         return None
+    return WeeklyReport.model_validate({"summary": summary, "action_items": items})
+
+
+def _fixup_messages(raw: str, summary: Optional[str],
+                    items: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """补全请求：把上次输出作为 assistant 轮次，只要求缺失 / 不合法的字段。"""
+    asks = []
+    if summary is None:
+        asks.append(f'"summary"（≤ {SUMMARY_MAX} 字）')
+    if len(items) < ACTION_ITEMS:
+        asks.append(f'"action_items"（只写还缺的 {ACTION_ITEMS - len(items)} 条，不要重复已有目标）')
+    kept = {k: v for k, v in (("summary", summary), ("action_items", items)) if v}
+    return [
+        {"role": "assistant", "content": raw},
+        {"role": "user", "content":
+            "上一条回复不完整或不符合结构。已保留的合法部分：\n"
+            f"{json.dumps(kept, ensure_ascii=False)}\n"
+            f"请只补全 {'、'.join(asks)}，只回复一段只含这些键的 JSON。"},
+    ]
+
+
+async def _finish_report(prompt: str, raw: str) -> Optional[WeeklyReport]:
+    """校验一次模型输出：先本地修复；仍缺字段时只针对缺失部分发补全请求，不整段重来。"""
+    report, data = _check_report(raw)
+    if report is not None or data is None:
+        return report
+    summary, items = _valid_parts(data)
+    for _ in range(FIXUP_LIMIT):
+        report = _merge(summary, items)         # 多余的行动项在本地截掉即可
+        if report is not None:
+            return report
+        inc("report_fixup_requests_total")
+        patch = await acall_llm(prompt, model=DEFAULT_MODEL, temperature=REPORT_TEMPERATURE,
+                                system_prompt=SYSTEM_PROMPT, json_mode=True,
+                                followup=_fixup_messages(raw, summary, items))
+        try:
+            new_summary, new_items = _valid_parts(repair_json(patch))
+        except RepairError as e:
+            print("fix-up unparsable:", e)
+            continue
+        summary = summary or new_summary
+        goals = {it["goal"] for it in items}    # 模型常把已有条目再写一遍
+        items = (items + [it for it in new_items if it["goal"] not in goals])[:ACTION_ITEMS]
+    return _merge(summary, items)
+
+
+@timed("prompt_build_seconds")
+def _build_report_prompt(row: Dict[str, Any], user_id: int) -> str:
+    """user 消息：只含按用户 / 按周变化的内容，静态说明全在 SYSTEM_PROMPT。
+
+    档案放在最前（同一用户逐周不变，可继续延长缓存前缀）；超出 token 预算时
+    先把趋势表缩到最短窗口再省略，然后精简档案，本周统计始终完整保留。"""
+    profile = get_profile(user_id)
+    sections = [
+        Section("个人档案", [_personal_context(profile), _personal_brief(profile)],
+                priority=1),
+        Section("本周统计", [_to_markdown_table(row)], priority=2),
+        Section("近期趋势", [_to_trend_table(row), _to_trend_table(row, TREND_WINDOWS[:1]), ""],
+                priority=0),
+    ]
+    return fit(sections, user_budget(SYSTEM_PROMPT))
+
 
+def _prepare_report(user_id: int, week_start: dt.date | None, use_cache: bool
+                    ) -> Optional[Tuple[Dict[str, Any], str, str, Optional[WeeklyReport]]]:
+    """生成前的准备：读周汇总 / 档案拼 prompt、查缓存。
 
-def generate_weekly_report() -> bool:
-    row = _latest_summary()
+    返回 (周汇总行, prompt, 缓存键, 缓存命中的报告或 None)；该周没有汇总时返回 None。
+    全是同步 SQLite 读，协程里经 asyncio.to_thread 调用，不占用事件循环。"""
+    row = (_summary_of_week(user_id, week_start) if week_start
+           else _latest_summary(user_id))
     if not row:
+        return None
+    prompt = _build_report_prompt(row, user_id)
+    key = llm_cache.cache_key(prompt, DEFAULT_MODEL, REPORT_TEMPERATURE, SYSTEM_PROMPT)
+    cached = llm_cache.get(key) if use_cache else None
+    return row, prompt, key, (_validate_llm_output(cached) if cached else None)
+
+
+def _save_report(key: str, week_start: dt.date | str, llm_resp: str, user_id: int) -> None:
+    """新生成的合法输出写入缓存并写回周汇总（同步，等到提交；协程里经 asyncio.to_thread 调用）。"""
+    llm_cache.put(key, DEFAULT_MODEL, llm_resp)
+    _write_back(week_start, llm_resp, user_id)
+
+
+async def agenerate_weekly_report(user_id: int = DEFAULT_USER_ID,
+                                  week_start: dt.date | None = None,
+                                  use_cache: bool = True) -> bool:
+    """异步生成并写回某用户某周（缺省最新一周）的周报；use_cache=False 强制调用模型。
+
+    读库 / 写回都放到线程里，批量并发生成时各协程的数据库操作不会互相排队等事件循环。"""
+    prepared = await asyncio.to_thread(_prepare_report, user_id, week_start, use_cache)
+    if prepared is None:
         print("No weekly_summary row found.")
         return False
-
-    stat_table_md = _to_markdown_table(row)
-    personal_md   = _personal_context(get_profile())
-    prompt = (
-        f"{SYSTEM_INSTRUCT}\n\n"
-        "## 个人档案\n"
-        f"{personal_md}\n\n"
-        "## 本周统计\n"
-        f"{stat_table_md}\n\n"
-        "## WHO 指南\n"
-        f"{WHO_GUIDE}\n"
-    )
+    row, prompt, key, report = prepared
+    if report:
+        await asyncio.to_thread(_write_back, row["week_start"], _report_json(report), user_id)
+        print("✓ weekly report served from cache.")
+        return True
 
     for attempt in range(1, RETRY_LIMIT + 1):
         try:
-            llm_resp = call_local_llm(prompt).strip()
-            report   = _validate_llm_output(llm_resp)
+            llm_resp = (await acall_llm(prompt, model=DEFAULT_MODEL,
+                                        temperature=REPORT_TEMPERATURE,
+                                        system_prompt=SYSTEM_PROMPT, json_mode=True)).strip()
+            report   = await _finish_report(prompt, llm_resp)
             if report:
-                _write_back(row["week_start"], llm_resp)
+                await asyncio.to_thread(_save_report, key, row["week_start"],
+                                        _report_json(report), user_id)
                 print("✓ weekly report saved.")
                 return True
             raise ValueError("validation failed")
         except Exception as e:
             print(f"attempt {attempt}/{RETRY_LIMIT} failed:", e)
+            inc("report_attempt_failures_total", mode="chat")
             if attempt == RETRY_LIMIT:
                 traceback.print_exc()
+            else:
+                inc("report_retries_total", mode="chat")
     return False
 
 
-def _write_back(week_start: dt.date | str, suggestions_json: str) -> None:
+def generate_weekly_report(user_id: int = DEFAULT_USER_ID,
+                           use_cache: bool = True) -> bool:
+    return run_sync(agenerate_weekly_report(user_id, use_cache=use_cache))
+
+
+def stream_weekly_report(user_id: int = DEFAULT_USER_ID,
+                         use_cache: bool = True,
+                         week_start: dt.date | None = None) -> Iterator[Tuple[str, Any]]:
+    """流式生成某周（缺省最新一周）周报，逐步产出事件供前端增量渲染：
+
+    ("summary", str) / ("action_item", dict) / ("repair", 第几次) / ("retry", 第几次) / ("done", bool)
+    流中一旦违反 WeeklyReport schema 立即中止连接，已收到的部分本地修复、只补缺失字段
+    （产出 "repair"，之前的事件仍有效）；修不好才整段重试（"retry"，之前的事件作废）。
+    """
+    prepared = _prepare_report(user_id, week_start, use_cache)
+    if prepared is None:
+        print("No weekly_summary row found.")
+        yield ("done", False)
+        return
+
+    row, prompt, key, report = prepared
+    if report:
+        cached = _report_json(report)
+        yield from ReportStreamParser().feed(cached)
+        _write_back(row["week_start"], cached, user_id)
+        yield ("done", True)
+        return
+
+    for attempt in range(1, RETRY_LIMIT + 1):
+        parser = ReportStreamParser()
+        shown: List[str] = []                   # 已产出的事件类型（抛错那一批不算）
+        try:
+            try:
+                with closing(stream_local_llm(prompt, model=DEFAULT_MODEL,
+                                              temperature=REPORT_TEMPERATURE,
+                                              system_prompt=SYSTEM_PROMPT,
+                                              json_mode=True)) as deltas:
+                    # JSON 闭合后仍读完流：末尾 chunk 才带 usage（真实 token 计数）
+                    for delta in deltas:
+                        for ev in parser.feed(delta):
+                            shown.append(ev[0])
+                            yield ev
+                parser.finish()
+                report = _validate_llm_output(parser.text())
+                if report is None:
+                    raise SchemaViolation("validation failed")
+            except SchemaViolation as e:
+                # 已收到的部分本地修复，只补缺失的字段；已展示的摘要 / 卡片保留
+                print("stream schema violation:", e)
+                report = run_sync(_finish_report(prompt, parser.buf))
+                if report is None:
+                    raise
+                yield ("repair", attempt)
+                if "summary" not in shown:
+                    yield ("summary", report.summary)
+                items = report.model_dump(exclude_none=True)["action_items"]
+                for it in items[shown.count("action_item"):]:
+                    yield ("action_item", it)
+            _save_report(key, row["week_start"], _report_json(report), user_id)
+            print("✓ weekly report saved.")
+            yield ("done", True)
+            return
+        except Exception as e:
+            print(f"attempt {attempt}/{RETRY_LIMIT} failed:", e)
+            inc("report_attempt_failures_total", mode="stream")
+            if attempt < RETRY_LIMIT:
+                inc("report_retries_total", mode="stream")
+                yield ("retry", attempt)
+    yield ("done", False)
+
+
+async def agenerate_weekly_reports(
+        targets: Iterable[Tuple[int, dt.date | None]]) -> List[bool]:
+    """批量并发生成：targets = [(user_id, week_start 或 None), ...]；
+    并发与限速由 DeepSeek 客户端统一控制。"""
+    return list(await asyncio.gather(
+        *(agenerate_weekly_report(uid, ws) for uid, ws in targets)))
+
+
+def generate_weekly_reports(targets: Iterable[Tuple[int, dt.date | None]]) -> List[bool]:
+    return run_sync(agenerate_weekly_reports(list(targets)))
+
+
+def _as_week_start(week_start: dt.date | str) -> dt.date:
     if isinstance(week_start, dt.datetime):
-        week_start = week_start.date()
+        return week_start.date()
     if isinstance(week_start, str):
-        week_start = dt.datetime.strptime(week_start, "%Y-%m-%d").date()
+        return dt.datetime.strptime(week_start, "%Y-%m-%d").date()
+    return week_start
+
+def _write_back(week_start: dt.date | str, suggestions_json: str,
+                user_id: int = DEFAULT_USER_ID) -> None:
+    week_start = _as_week_start(week_start)
+
+    # 经写队列：并发生成的多份周报写回合并提交
+    submit_write(lambda c: c.execute(
+        "UPDATE weekly_summary SET suggestions = ? "
+        "WHERE user_id = ? AND week_start = ?",
+        (suggestions_json, user_id, week_start)
+    ))
 
-    with _get_conn() as c:
-        c.execute(
-            "UPDATE weekly_summary SET suggestions = ? WHERE week_start = ?",
-            (suggestions_json, week_start)
+def _write_back_many(items: Iterable[Tuple[int, dt.date, str]]) -> None:
+    """批量写回 [(user_id, week_start, suggestions_json), ...]，单个事务。"""
+    with write_conn() as c:
+        c.executemany(
+            "UPDATE weekly_summary SET suggestions = ? "
+            "WHERE user_id = ? AND week_start = ?",
+            [(js, uid, ws) for uid, ws, js in items]
         )
-        c.commit()
 
 # uick test
 if __name__ == "__main__":
-    ok = generate_weekly_report()
+    uid = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_USER_ID
+    ok = generate_weekly_report(uid)
     sys.exit(0 if ok else 1)
@@ -0,0 +1,84 @@
+from __future__ import annotations
+import json, re
+from typing import Any, List, Tuple
+
+# 模型输出的本地修复：代码块围栏 / 前后废话 / 尾逗号 / 截断，全部在本地完成，不额外调用模型。
+# 截断时回退到最近一个完整的值，再补齐未闭合的括号；被截掉的字段交给 schema 校验报缺失，
+# 由调用方只针对这些字段发起补全请求。
+
+_FENCE = re.compile(r"^\s*```[a-zA-Z]*\s*|\s*```\s*$")
+_CLOSE = {"{": "}", "[": "]"}
+
+
+class RepairError(ValueError):
+    ...
+
+
+def _scan(text: str) -> Tuple[str, List[str], List[Tuple[int, List[str]]], bool]:
+    """从首个 { 起扫描：删除尾逗号，顶层对象闭合即停。
+
+    返回 (清理后的文本, 未闭合括号栈, 安全截断点 [(位置, 当时的栈)], 是否完整闭合)。"""
+    out: List[str] = []
+    stack: List[str] = []
+    safe: List[Tuple[int, List[str]]] = []
+    in_str = esc = False
+    for ch in text[text.index("{"):]:
+        if in_str:
+            out.append(ch)
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+            continue
+        if ch == '"':
+            in_str = True
+        elif ch in "{[":
+            stack.append(ch)
+            out.append(ch)
+            safe.append((len(out), list(stack)))
+            continue
+        elif ch in "}]":
+            while out and (out[-1].isspace() or out[-1] == ","):   # 尾逗号
+                out.pop()
+            if not stack or _CLOSE[stack[-1]] != ch:
+                raise RepairError(f"unbalanced {ch!r}")
+            stack.pop()
+            out.append(ch)
+            if not stack:
+                return "".join(out), stack, safe, True
+            safe.append((len(out), list(stack)))
+            continue
+        elif ch == ",":
+            safe.append((len(out), list(stack)))
+        out.append(ch)
+    return "".join(out), stack, safe, False
+
+
+def _close(prefix: str, stack: List[str]) -> str:
+    prefix = prefix.rstrip().rstrip(",")
+    return prefix + "".join(_CLOSE[b] for b in reversed(stack))
+
+
+def repair_json(raw: str) -> Any:
+    """尽量从模型输出中还原出一个 JSON 对象；完全无法解析时抛 RepairError。"""
+    text = _FENCE.sub("", raw.strip())
+    if "{" not in text:
+        raise RepairError("no JSON object found")
+    cleaned, stack, safe, closed = _scan(text)
+    if closed:
+        try:
+            return json.loads(cleaned)
+        except json.JSONDecodeError as e:
+            raise RepairError(f"invalid JSON: {e}") from None
+    # 截断：从最近的安全点往前试，直到补齐括号后能解析；
+    # 数组里只写了一半的对象整条丢弃（缺字段的记录比缺一条记录更难发现）
+    for pos, st in reversed(safe):
+        if "[" in st and "{" in st[st.index("["):]:
+            continue
+        try:
+            return json.loads(_close(cleaned[:pos], st))
+        except json.JSONDecodeError:
+            continue
+    raise RepairError("truncated JSON could not be recovered")
@@ -0,0 +1,95 @@
+from __future__ import annotations
+import hashlib, json, os, re, threading, time
+from typing import Dict, Optional
+
+from database.db_adapter import read_conn, write_conn
+
+# LLM 响应缓存：同一 (模型, 温度, system, 规范化 prompt) 直接复用上次合法输出
+CACHE_ENABLED     = os.getenv("LLM_CACHE", "1") != "0"                  # 全局开关 / 旁路
+CACHE_TTL_SEC     = int(os.getenv("LLM_CACHE_TTL_SEC", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000"))
+
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+_stats_lock = threading.Lock()
+
+
+def _bump(name: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += n
+
+
+_BLANK_RUN = re.compile(r"\n{3,}")
+
+def normalize_prompt(text: str) -> str:
+    """统一换行、去行尾空白、压缩多余空行，避免无意义差异打散缓存。"""
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = "\n".join(line.rstrip() for line in text.split("\n"))
+    return _BLANK_RUN.sub("\n\n", text).strip()
+
+
+def cache_key(prompt: str, model: str, temperature: float,
+              system_prompt: str | None = None) -> str:
+    blob = json.dumps({
+        "model": model,
+        "temperature": round(float(temperature), 4),
+        "system": normalize_prompt(system_prompt or ""),
+        "prompt": normalize_prompt(prompt),
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def get(key: str) -> Optional[str]:
+    """命中返回缓存内容并刷新 LRU 时间；过期视为未命中。"""
+    if not CACHE_ENABLED:
+        return None
+    now = time.time()
+    with read_conn() as c:
+        row = c.execute("SELECT response, created_at FROM llm_cache WHERE key = ?",
+                        (key,)).fetchone()
+    if row is None or now - row["created_at"] > CACHE_TTL_SEC:
+        _bump("misses")
+        return None
+    with write_conn() as c:
+        c.execute("UPDATE llm_cache SET last_access = ?, hits = hits + 1 "
+                  "WHERE key = ?", (now, key))
+    _bump("hits")
+    return row["response"]
+
+
+def put(key: str, model: str, response: str) -> None:
+    """写入缓存；超过容量时按 last_access 淘汰最久未用的条目。"""
+    if not CACHE_ENABLED:
+        return
+    now = time.time()
+    with write_conn() as c:
+        c.execute(
+            "INSERT INTO llm_cache (key, model, response, created_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET response=excluded.response, "
+            "model=excluded.model, created_at=excluded.created_at, "
+            "last_access=excluded.last_access;",
+            (key, model, response, now, now)
+        )
+        c.execute("DELETE FROM llm_cache WHERE created_at < ?;",
+                  (now - CACHE_TTL_SEC,))
+        n, = c.execute("SELECT COUNT(*) FROM llm_cache;").fetchone()
+        if n > CACHE_MAX_ENTRIES:
+            cur = c.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY last_access LIMIT ?);",
+                (n - CACHE_MAX_ENTRIES,)
+            )
+            _bump("evictions", cur.rowcount)
+
+
+def stats() -> Dict[str, int]:
+    """进程内命中 / 未命中 / 淘汰计数 + 当前条目数。"""
+    with read_conn() as c:
+        n, = c.execute("SELECT COUNT(*) FROM llm_cache;").fetchone()
+    with _stats_lock:
+        return dict(_stats, entries=n)
+
+
+def clear() -> None:
+    with write_conn() as c:
+        c.execute("DELETE FROM llm_cache;")
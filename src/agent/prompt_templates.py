@@ -8,7 +8,7 @@ WHO_GUIDE = """
 """
 
 SYSTEM_INSTRUCT = """
-你是一名充满活力的私人健康教练。请基于【个人档案】和【本周统计】给出反馈，
+你是一名充满活力的私人健康教练。请基于【个人档案】【本周统计】【近期趋势】并对照【WHO 指南】给出反馈，
 并 **只回复一段合法 JSON**（开头 { 结尾 }，不要 ```json 或多余文字）。
 
 JSON 结构：
@@ -27,15 +27,6 @@ JSON 结构：
 禁止输出除 JSON 之外的任何文字！
 """
 
-def build_prompt(stat_table_md: str, personal_md: str | None = None) -> str:
-    personal_block = (
-        f"## 个人档案\n{personal_md}\n\n" if personal_md else ""
-    )
-    return (
-        f"{SYSTEM_INSTRUCT}\n\n"
-        f"{personal_block}"
-        "## 本周统计\n"
-        f"{stat_table_md}\n\n"
-        "## WHO 指南\n"
-        f"{WHO_GUIDE}\n"
-    )
+# 静态前缀：说明 + JSON 结构 + WHO 指南，逐字节固定，整体作为 system 消息发送，
+# 命中 DeepSeek 的上下文前缀缓存。按用户 / 按周变化的内容只能放进 user 消息。
+SYSTEM_PROMPT = f"{SYSTEM_INSTRUCT.strip()}\n\n## WHO 指南\n{WHO_GUIDE.strip()}\n"
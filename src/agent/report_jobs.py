@@ -0,0 +1,140 @@
+from __future__ import annotations
+import datetime as dt, os, socket, threading, time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent.feedback_agent import stream_weekly_report, _as_week_start
+from database.db_adapter import read_conn, write_conn
+
+# 周报生成任务：同一 (用户, 周) 同时只有一个在跑，其余请求挂到在途任务上
+#   - report_jobs 表记录 queued / running / done / failed，租约防止跨进程重复调用
+#   - 本进程内的在途任务另存一份流式进度，前端轮询时可先展示已生成的部分
+
+LEASE_SEC   = 180                # 需大于单次生成（含重试）的最长耗时
+RENEW_SEC   = LEASE_SEC // 3
+JOB_WORKERS = int(os.getenv("REPORT_JOB_WORKERS", "4"))
+
+TERMINAL = ("done", "failed")
+
+Key = Tuple[int, dt.date]
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+_EXECUTOR = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="report-job")
+_lock = threading.Lock()
+_inflight: Dict[Key, Future] = {}
+_progress: Dict[Key, List[Tuple[str, Any]]] = {}
+
+
+def _now() -> dt.datetime:
+    return dt.datetime.now().replace(microsecond=0)
+
+
+def _claim(key: Key, force: bool) -> bool:
+    """抢占 (用户, 周) 的生成权：已有有效租约的在途任务、或已完成且非 force 时返回 False。
+
+    判断与抢占在同一条条件 UPSERT 里完成，多个进程同时抢只有一个能改到行。"""
+    now = _now()
+    with write_conn() as c:
+        cur = c.execute(
+            "INSERT INTO report_jobs (user_id, week_start, status, attempts, "
+            "lease_owner, lease_until) VALUES (?, ?, 'queued', 1, ?, ?) "
+            "ON CONFLICT(user_id, week_start) DO UPDATE SET status='queued', "
+            "attempts=attempts+1, error=NULL, lease_owner=excluded.lease_owner, "
+            "lease_until=excluded.lease_until, updated_at=CURRENT_TIMESTAMP "
+            "WHERE NOT (report_jobs.status IN ('queued', 'running') "
+            "           AND COALESCE(report_jobs.lease_until, '') > ?) "
+            "  AND (report_jobs.status <> 'done' OR ?);",
+            (*key, _OWNER, now + dt.timedelta(seconds=LEASE_SEC), now, force))
+        return cur.rowcount == 1
+
+
+def _update(key: Key, status: str, error: Optional[str] = None) -> None:
+    lease = None if status in TERMINAL else _now() + dt.timedelta(seconds=LEASE_SEC)
+    with write_conn() as c:
+        c.execute(
+            "UPDATE report_jobs SET status=?, error=?, lease_until=?, "
+            "updated_at=CURRENT_TIMESTAMP "
+            "WHERE user_id=? AND week_start=? AND lease_owner=?;",
+            (status, error, lease, *key, _OWNER))
+
+
+def _run(key: Key) -> bool:
+    user_id, week_start = key
+    _update(key, "running")
+    renewed, ok = time.monotonic(), False
+    try:
+        for kind, payload in stream_weekly_report(user_id, week_start=week_start):
+            with _lock:
+                if kind == "retry":
+                    _progress[key] = []
+                _progress[key].append((kind, payload))
+            if kind == "done":
+                ok = payload
+            elif time.monotonic() - renewed > RENEW_SEC:
+                _update(key, "running")              # 续租
+                renewed = time.monotonic()
+        _update(key, "done" if ok else "failed",
+                None if ok else "generation failed, see server log")
+    except Exception as e:
+        _update(key, "failed", f"{type(e).__name__}: {e}"[:500])
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+            _progress.pop(key, None)          # 结束后状态以 report_jobs 表为准
+    return ok
+
+
+def submit_report_job(user_id: int, week_start: dt.date | str,
+                      force: bool = False) -> Dict[str, Any]:
+    """提交（或挂靠到在途的）周报任务，立即返回任务状态，不阻塞调用方。
+
+    force=True 时即使该周已生成过也重新生成；但在途任务始终复用，不会重复调用模型。
+    """
+    key = (user_id, _as_week_start(week_start))
+    with _lock:
+        fut = _inflight.get(key)
+        if (fut is None or fut.done()) and _claim(key, force):
+            _progress[key] = []
+            _inflight[key] = _EXECUTOR.submit(_run, key)
+    return get_report_job(user_id, key[1])
+
+
+def get_report_job(user_id: int, week_start: dt.date | str) -> Dict[str, Any]:
+    """{status, error, attempts, updated_at, events}；无记录时 status 为 None。
+
+    租约已过期仍处于 queued / running 的任务（所属进程崩溃）按 failed 返回，可重新提交。
+    events 为本进程内的流式进度（summary / action_item / repair / retry / done）。
+    """
+    key = (user_id, _as_week_start(week_start))
+    with read_conn() as c:
+        row = c.execute(
+            "SELECT status, error, attempts, lease_until, updated_at FROM report_jobs "
+            "WHERE user_id = ? AND week_start = ?;", key).fetchone()
+    with _lock:
+        events = list(_progress.get(key, []))
+    if row is None:
+        return {"status": None, "error": None, "attempts": 0, "updated_at": None,
+                "events": events}
+
+    status, error = row["status"], row["error"]
+    if status not in TERMINAL and (row["lease_until"] is None
+                                   or row["lease_until"] < _now()):
+        status, error = "failed", "lease expired"
+    return {"status": status, "error": error, "attempts": row["attempts"],
+            "updated_at": row["updated_at"], "events": events}
+
+
+def wait_report_job(user_id: int, week_start: dt.date | str,
+                    timeout: float = LEASE_SEC, poll_sec: float = 0.5) -> bool:
+    """阻塞等待任务结束（CLI / 脚本用）；前端应轮询 get_report_job。"""
+    key = (user_id, _as_week_start(week_start))
+    with _lock:
+        fut = _inflight.get(key)
+    if fut is not None:
+        fut.result(timeout=timeout)
+    deadline = time.monotonic() + timeout
+    while True:
+        status = get_report_job(*key)["status"]
+        if status in TERMINAL or time.monotonic() > deadline:
+            return status == "done"
+        time.sleep(poll_sec)
@@ -1,5 +1,14 @@
-from typing import List, Optional
-from pydantic import BaseModel, Field
+import re
+from typing import Any, List, Optional
+
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+ACTION_ITEMS         = 3
+SUMMARY_MAX          = 200
+DEFAULT_PERIOD_WEEKS = 4
+PERIOD_WEEKS_RANGE   = (1, 8)           # 与 SYSTEM_INSTRUCT 中的约定一致
+
+_INT = re.compile(r"-?\d+(\.\d+)?")
 
 class ActionItem(BaseModel):
     goal: str
@@ -8,16 +17,35 @@ class ActionItem(BaseModel):
     period_weeks: Optional[int] = None
     motivation: Optional[str] = None
 
-class WeeklyReport(BaseModel):
-    summary: str = Field(max_length=200)
-    action_items: List[ActionItem]
+    @field_validator("target", mode="before")
+    @classmethod
+    def _target_text(cls, v: Any) -> Any:
+        return str(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else v
 
+    @field_validator("period_weeks", mode="before")
     @classmethod
-    def __get_validators__(cls):
-        yield cls.check_len
-
-    @staticmethod
-    def check_len(v):
-        if len(v["action_items"]) != 3:
-            raise ValueError("need exactly 3 action_items")
-        return v
+    def _coerce_weeks(cls, v: Any) -> Any:
+        """"2"、"2 周"、2.0、12 等常见写法统一成区间内的整数周。"""
+        if v is None or v == "" or isinstance(v, bool):
+            return None
+        if isinstance(v, str):
+            m = _INT.search(v)
+            if not m:
+                return None
+            v = m.group()
+        try:
+            weeks = round(float(v))
+        except (TypeError, ValueError):
+            return None
+        lo, hi = PERIOD_WEEKS_RANGE
+        return min(max(weeks, lo), hi)
+
+    @model_validator(mode="after")
+    def _default_period(self) -> "ActionItem":
+        if not self.period_weeks and not self.by_date:
+            self.period_weeks = DEFAULT_PERIOD_WEEKS
+        return self
+
+class WeeklyReport(BaseModel):
+    summary: str = Field(min_length=1, max_length=SUMMARY_MAX)
+    action_items: List[ActionItem] = Field(min_length=ACTION_ITEMS, max_length=ACTION_ITEMS)
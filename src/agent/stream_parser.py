@@ -0,0 +1,190 @@
+from __future__ import annotations
+import json, re
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent.report_schema import ACTION_ITEMS, SUMMARY_MAX, ActionItem
+
+# 流式增量解析 WeeklyReport JSON：
+#   - summary 字符串一闭合就产出 ("summary", str)
+#   - action_items 中每个对象一闭合就产出 ("action_item", dict)
+#   - 一旦能确定违反 schema 立即抛 SchemaViolation，调用方可提前中止并重试
+
+Event = Tuple[str, Any]
+
+_FENCE_PREFIX = re.compile(r"(`{1,3}(j(s(on?)?)?)?)?")     # 允许 ```json 前缀
+
+
+class SchemaViolation(ValueError):
+    ...
+
+
+class ReportStreamParser:
+
+    def __init__(self, expected_items: int = ACTION_ITEMS, summary_max: int = SUMMARY_MAX):
+        self.expected_items = expected_items
+        self.summary_max = summary_max
+
+        self.buf = ""
+        self._i = 0
+        self._start: Optional[int] = None      # 顶层 { 位置
+        self._end: Optional[int] = None        # 顶层 } 位置
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._str_start = 0
+        self._expect_key = False
+        self._key: Optional[str] = None        # 当前顶层 key
+        self._val_start: Optional[int] = None  # 当前顶层 value 起点
+        self._item_start: Optional[int] = None
+
+        self.summary: Optional[str] = None
+        self.items: List[Dict[str, Any]] = []
+        self._seen_items_key = False
+
+    # ------------------------------------------------------------------
+    @property
+    def done(self) -> bool:
+        return self._end is not None
+
+    def text(self) -> str:
+        """已接收的完整 JSON 文本（去掉代码块围栏等前后缀）。"""
+        if self._start is None:
+            return ""
+        end = self._end + 1 if self._end is not None else len(self.buf)
+        return self.buf[self._start:end]
+
+    def feed(self, chunk: str) -> List[Event]:
+        events: List[Event] = []
+        self.buf += chunk
+        buf = self.buf
+        while self._i < len(buf) and not self.done:
+            i, ch = self._i, buf[self._i]
+            self._i += 1
+
+            if self._start is None:
+                if ch == "{":
+                    self._start, self._depth, self._expect_key = i, 1, True
+                elif not _FENCE_PREFIX.fullmatch(buf[:i + 1].strip()):
+                    raise SchemaViolation(f"unexpected text before JSON: {buf[:i + 1]!r}")
+                continue
+
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+                    self._on_string_end(i, events)
+                continue
+
+            if ch.isspace():
+                continue
+            if ch == '"':
+                self._in_str, self._str_start = True, i
+                if self._depth == 1 and not self._expect_key:
+                    self._val_start = i
+                elif self._depth == 2 and self._key == "action_items":
+                    raise SchemaViolation("action_items must contain objects")
+                continue
+
+            if self._depth == 1:
+                self._on_top_level_char(i, ch, events)
+            else:
+                self._on_nested_char(i, ch, events)
+        return events
+
+    def finish(self) -> Dict[str, Any]:
+        """流结束时的最终校验，返回完整报告字典。"""
+        if not self.done:
+            raise SchemaViolation("truncated JSON")
+        if self.summary is None:
+            raise SchemaViolation("missing summary")
+        if len(self.items) != self.expected_items:
+            raise SchemaViolation(f"need exactly {self.expected_items} action_items, "
+                                  f"got {len(self.items)}")
+        return {"summary": self.summary, "action_items": self.items}
+
+    # ------------------------------------------------------------------
+    def _on_string_end(self, i: int, events: List[Event]) -> None:
+        if self._depth != 1:
+            return
+        if self._expect_key:
+            self._key = json.loads(self.buf[self._str_start:i + 1])
+            self._expect_key = False
+        else:
+            self._close_value(i + 1, events)
+
+    def _on_top_level_char(self, i: int, ch: str, events: List[Event]) -> None:
+        if self._expect_key:
+            if ch == "}" and self._key is None:         # 空对象
+                self._end, self._depth = i, 0
+                return
+            raise SchemaViolation(f"expected key at {i}, got {ch!r}")
+        if ch == ":":
+            return
+        if ch in ",}":
+            if self._val_start is not None:             # 数字 / true / null 等原子值
+                self._close_value(i, events)
+            if ch == ",":
+                self._expect_key = True
+            else:
+                self._end, self._depth = i, 0
+            return
+        if ch in "{[":
+            if self._key == "action_items" and ch != "[":
+                raise SchemaViolation("action_items must be an array")
+            self._val_start = i
+            self._depth += 1
+            return
+        if self._val_start is None:
+            self._val_start = i
+
+    def _on_nested_char(self, i: int, ch: str, events: List[Event]) -> None:
+        in_items = self._key == "action_items"
+        if ch in "{[":
+            self._depth += 1
+            if in_items and self._depth == 3:
+                if ch != "{":
+                    raise SchemaViolation("action_items must contain objects")
+                self._item_start = i
+        elif ch in "}]":
+            self._depth -= 1
+            if in_items and self._depth == 2 and self._item_start is not None:
+                self._close_item(i + 1, events)
+            elif self._depth == 1:
+                self._close_value(i + 1, events)
+        elif in_items and self._depth == 2 and ch != ",":
+            raise SchemaViolation("action_items must contain objects")
+
+    def _close_value(self, end: int, events: List[Event]) -> None:
+        raw = self.buf[self._val_start:end]
+        self._val_start = None
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise SchemaViolation(f"bad value for {self._key!r}: {e}") from None
+
+        if self._key == "summary":
+            if not isinstance(value, str):
+                raise SchemaViolation("summary must be a string")
+            if len(value) > self.summary_max:
+                raise SchemaViolation(f"summary longer than {self.summary_max}")
+            self.summary = value
+            events.append(("summary", value))
+        elif self._key == "action_items":
+            if len(value) != self.expected_items:
+                raise SchemaViolation(f"need exactly {self.expected_items} action_items, "
+                                      f"got {len(value)}")
+
+    def _close_item(self, end: int, events: List[Event]) -> None:
+        raw = self.buf[self._item_start:end]
+        self._item_start = None
+        if len(self.items) >= self.expected_items:
+            raise SchemaViolation(f"more than {self.expected_items} action_items")
+        try:                                    # 规范化后的条目（period_weeks 已补默认 / 取整）
+            item = ActionItem.model_validate(json.loads(raw)).model_dump(exclude_none=True)
+        except Exception as e:
+            raise SchemaViolation(f"invalid action_item: {e}") from None
+        self.items.append(item)
+        events.append(("action_item", item))
@@ -0,0 +1,81 @@
+"""Prompt token 估算与预算：可变上下文按段落逐级压缩，直到放进配置的上限。
+
+    REPORT_PROMPT_TOKEN_BUDGET=1200         # 单次请求输入 token 上限（system + user）
+    DEEPSEEK_TOKENIZER=/path/tokenizer.json  # 可选：用官方分词器精确计数（pip install tokenizers）
+
+未配置分词器时按 DeepSeek 文档的换算估算：中文字符 ≈ 0.6 token，其余字符 ≈ 0.3 token。
+"""
+from __future__ import annotations
+import functools, math, os, re
+from dataclasses import dataclass
+from typing import List, Sequence
+
+from telemetry.instrument import inc, observe
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("REPORT_PROMPT_TOKEN_BUDGET", "1200"))
+MESSAGE_OVERHEAD    = 4                  # 每条消息的角色 / 分隔符开销（估计值）
+
+CJK_TOKEN   = 0.6
+OTHER_TOKEN = 0.3
+_CJK = re.compile(r"[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")  # 中日文字符与全角标点
+
+
+@functools.lru_cache(maxsize=1)
+def _tokenizer():
+    path = os.getenv("DEEPSEEK_TOKENIZER")
+    if not path:
+        return None
+    try:
+        from tokenizers import Tokenizer
+    except ImportError as e:                # 可选依赖
+        raise RuntimeError("DEEPSEEK_TOKENIZER 需要安装 tokenizers：pip install tokenizers") from e
+    return Tokenizer.from_file(path)
+
+
+def count_tokens(text: str) -> int:
+    tok = _tokenizer()
+    if tok is not None:
+        return len(tok.encode(text, add_special_tokens=False).ids)
+    cjk = len(_CJK.findall(text))
+    return math.ceil(cjk * CJK_TOKEN + (len(text) - cjk) * OTHER_TOKEN)
+
+
+@functools.lru_cache(maxsize=8)
+def user_budget(system_prompt: str, total: int = PROMPT_TOKEN_BUDGET) -> int:
+    """扣掉固定 system 前缀后留给 user 消息的 token 数。"""
+    return total - count_tokens(system_prompt) - 2 * MESSAGE_OVERHEAD
+
+
+@dataclass
+class Section:
+    """user 消息中的一段可变上下文。variants 从完整到精简排列，可省略的段落以 "" 结尾。"""
+    title: str
+    variants: List[str]
+    priority: int = 0                    # 超预算时 priority 小的先压缩
+    level: int = 0                       # 当前使用的 variants 下标
+
+    def render(self) -> str:
+        body = self.variants[self.level].strip()
+        return f"## {self.title}\n{body}\n\n" if body else ""
+
+
+def render(sections: Sequence[Section]) -> str:
+    return "".join(s.render() for s in sections).rstrip() + "\n"
+
+
+def fit(sections: Sequence[Section], budget: int) -> str:
+    """逐步压缩优先级最低且还有更短写法的段落，直到估算 token ≤ budget。
+
+    全部压到最短仍超出时照常返回，计数 prompt_over_budget_total 并记下超出的 token 数。"""
+    text = render(sections)
+    while count_tokens(text) > budget:
+        candidates = [s for s in sections if s.level < len(s.variants) - 1]
+        if not candidates:
+            inc("prompt_over_budget_total")
+            observe("prompt_over_budget_tokens", count_tokens(text) - budget)
+            break
+        sec = min(candidates, key=lambda s: s.priority)
+        sec.level += 1
+        inc("prompt_sections_trimmed_total", section=sec.title)
+        text = render(sections)
+    return text
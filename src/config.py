@@ -0,0 +1,10 @@
+# 进程级配置入口：唯一调用 load_dotenv 的地方。
+# database.db_adapter 与 agent.call_local_llm 在读取任何环境变量之前导入本模块，
+# Streamlit / 调度器 / CLI 无论从哪个入口启动都只加载一次 .env（已存在的环境变量优先）。
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).resolve().parents[1]           # 仓库根路径
+
+load_dotenv(ROOT_DIR / ".env")
@@ -0,0 +1,346 @@
+"""存储后端：读写连接、周聚合、范围扫描的统一入口，各模块不再直接依赖具体引擎。
+
+    HC_STORAGE=sqlite        # 默认：全部在 SQLite 内完成
+    HC_STORAGE=duckdb        # 聚合 / 范围扫描改由 DuckDB 向量化引擎执行（pip install duckdb）
+    HC_DUCKDB_PATH=...       # 可选：DuckDB 镜像落盘路径，缺省为进程内存
+
+事务写入与点查始终走 SQLite：增量聚合的脏周表、读缓存的 user_data_version、快照脏分区
+都依赖 SQLite 触发器与 WAL。DuckDB 后端在内存里维护 events 的列式镜像，
+按 user_events_version 只重载有变化的用户，多进程各自维护镜像也不会互相抢占变更记录。
+"""
+from __future__ import annotations
+import datetime as dt, json, os, threading
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+from database.pool import ConnectionPool
+
+if TYPE_CHECKING:                            # pandas 只在实际扫描 / 同步镜像时导入
+    import pandas as pd
+
+Week = Tuple[int, dt.date]
+
+# 周指标：(输出列, SQL 聚合表达式)；两种方言共用
+WEEKLY_AGGS: List[Tuple[str, str]] = [
+    ("avg_sleep",      "COALESCE(AVG(e.sleep_hours), 0)"),
+    ("total_steps",    "COALESCE(SUM(e.steps), 0)"),
+    ("mood_avg",       "COALESCE(AVG(e.mood_score), 0)"),
+    ("exercise_total", "COALESCE(SUM(e.exercise_minutes), 0)"),
+    ("veggie_avg",     "COALESCE(AVG(e.veggie_servings), 0)"),
+    ("water_total",    "COALESCE(SUM(e.water_ml), 0)"),
+    ("alcohol_days",   "COALESCE(SUM(e.alcohol), 0)"),
+]
+
+# 表 → 范围扫描所依据的日期列
+SCAN_TABLES = {"events": "date", "weekly_summary": "week_start",
+               "monthly_summary": "period_start", "quarterly_summary": "period_start"}
+
+# 分析型 events 扫描的列：两种后端都能给出（DuckDB 镜像只含日期与数值列，不含备注等文本列）
+EVENT_SCAN_COLS = ("user_id", "date", "sleep_hours", "veggie_servings", "high_fat_meals",
+                   "water_ml", "exercise_minutes", "steps", "mood_score", "screen_hours",
+                   "alcohol", "caffeine")
+
+
+def _agg_sql(scope: str, join: str, key: str, having: str = "") -> str:
+    aggs = ",\n       ".join(f"{expr} AS {name}" for name, expr in WEEKLY_AGGS)
+    return f"""
+SELECT w.user_id                AS user_id,
+       w.{key} AS {key},
+       COUNT(DISTINCT e.date)   AS n_days,
+       {aggs}
+FROM {scope} AS w
+JOIN events AS e
+  ON e.user_id = w.user_id AND {join}
+GROUP BY w.user_id, w.{key}
+{having};
+"""
+
+
+def _weekly_agg_sql(scope: str, join: str) -> str:
+    """只保留 7 天齐全的周（与原有聚合口径一致）；join 为 e 与 w 的方言相关连接条件。"""
+    return _agg_sql(scope, join, "week_start", "HAVING COUNT(DISTINCT e.date) = 7")
+
+
+def _period_agg_sql(scope: str, join: str) -> str:
+    """月 / 季汇总：与周聚合同一组指标，不要求整期齐全。"""
+    return _agg_sql(scope, join, "period_start")
+
+
+def _scan_sql(table: str, columns: Optional[Sequence[str]], user_id: Optional[int],
+              start: Optional[dt.date], end: Optional[dt.date]) -> Tuple[str, list]:
+    col = SCAN_TABLES[table]
+    where, params = [], []
+    if user_id is not None:
+        where.append("user_id = ?")
+        params.append(user_id)
+    if start is not None:
+        where.append(f"{col} >= ?")
+        params.append(start)
+    if end is not None:
+        where.append(f"{col} < ?")
+        params.append(end)
+    sql = f"SELECT {','.join(columns) if columns else '*'} FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql + f" ORDER BY user_id, {col};", params
+
+
+class StorageBackend:
+    """后端接口。reader / writer 给出 SQLite 连接（系统记录库），
+    weekly_aggregates / scan 为可替换的分析执行引擎。"""
+
+    name = "base"
+
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+
+    def reader(self):
+        return self.pool.reader()
+
+    def writer(self):
+        return self.pool.writer()
+
+    def weekly_aggregates(self, conn, weeks: Sequence[Week]) -> List[Dict[str, Any]]:
+        """给定 (user_id, week_start) 列表，返回 7 天齐全的周的聚合行（dict）。
+
+        conn 为调用方当前的 SQLite 连接：写事务内调用时需看到同一事务里的改动。"""
+        raise NotImplementedError
+
+    def period_aggregates(self, conn, periods: Sequence[Week],
+                          months: int) -> List[Dict[str, Any]]:
+        """给定 (user_id, period_start) 与每期月数，返回有数据的期的汇总行（含 n_days）。"""
+        raise NotImplementedError
+
+    def scan(self, table: str, user_id: Optional[int] = None,
+             columns: Optional[Sequence[str]] = None,
+             start: Optional[dt.date] = None, end: Optional[dt.date] = None) -> pd.DataFrame:
+        """按日期列的范围扫描，end 为开区间。"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        self.pool.close_all()
+
+
+class SQLiteBackend(StorageBackend):
+    name = "sqlite"
+
+    def weekly_aggregates(self, conn, weeks: Sequence[Week]) -> List[Dict[str, Any]]:
+        if not weeks:
+            return []
+        # 目标周整体作为一个 JSON 参数传入：读连接是 query_only，不能建临时表
+        scope = ("(SELECT json_extract(value, '$[0]') AS user_id, "
+                 "json_extract(value, '$[1]') AS week_start FROM json_each(?))")
+        payload = json.dumps(sorted({(u, str(w)) for u, w in weeks}))
+        # 按主键 (user_id, date) 做区间查找
+        rows = conn.execute(_weekly_agg_sql(
+            scope, "e.date >= w.week_start AND e.date < date(w.week_start, '+7 days')"),
+            (payload,))
+        return [dict(r) for r in rows]
+
+    def period_aggregates(self, conn, periods: Sequence[Week],
+                          months: int) -> List[Dict[str, Any]]:
+        if not periods:
+            return []
+        scope = ("(SELECT json_extract(value, '$[0]') AS user_id, "
+                 "json_extract(value, '$[1]') AS period_start FROM json_each(?))")
+        payload = json.dumps(sorted({(u, str(p)) for u, p in periods}))
+        rows = conn.execute(_period_agg_sql(
+            scope, f"e.date >= w.period_start "
+                   f"AND e.date < date(w.period_start, '+{int(months)} months')"),
+            (payload,))
+        return [dict(r) for r in rows]
+
+    def scan(self, table, user_id=None, columns=None, start=None, end=None) -> pd.DataFrame:
+        import pandas as pd
+        sql, params = _scan_sql(table, columns, user_id, start, end)
+        col = SCAN_TABLES[table]
+        with self.reader() as conn:
+            return pd.read_sql_query(sql, conn, params=params,
+                                     parse_dates=[col] if not columns or col in columns
+                                     else None)
+
+
+def _duckdb():
+    try:
+        import duckdb
+    except ImportError as e:                # 可选依赖
+        raise RuntimeError("HC_STORAGE=duckdb 需要安装 duckdb：pip install duckdb") from e
+    return duckdb
+
+
+_DUCK_TYPES = {"INTEGER": "BIGINT", "REAL": "DOUBLE", "DATE": "DATE"}
+_LOAD_CHUNK = 500                            # 每次按多少个用户从 SQLite 拉取
+
+
+class DuckDBBackend(StorageBackend):
+    """events 的 DuckDB 列式镜像：每次分析查询前比对 user_events_version，只重载变化的用户。
+
+    镜像只含数值列与日期（文本备注类列不参与分析），另存物化的 week_start，
+    周聚合因此是 (user_id, week_start) 上的等值哈希连接而非区间连接。"""
+
+    name = "duckdb"
+
+    def __init__(self, pool: ConnectionPool, path: Optional[str] = None):
+        super().__init__(pool)
+        self.duck = _duckdb().connect(path or ":memory:")
+        self._lock = threading.RLock()       # DuckDB 连接不支持多线程并发使用
+        self._cols: List[str] = []
+        # 写事务内重载的用户 → 事务内看到的版本；提交后才记入 mirror_version，回滚则丢弃（下次重载）
+        self._pending: Dict[int, int] = {}
+        self.stats = {"syncs": 0, "users_reloaded": 0, "rows_loaded": 0}
+
+    # ---------------------------- 镜像同步 ----------------------------
+    def _ensure_mirror(self, conn) -> None:
+        if self._cols:
+            return
+        info = [r for r in conn.execute("PRAGMA table_info(events);").fetchall()
+                if (r["type"] or "").upper() in _DUCK_TYPES]
+        self._cols = [r["name"] for r in info]
+        cols = ", ".join(f"{r['name']} {_DUCK_TYPES[r['type'].upper()]}" for r in info)
+        self.duck.execute(f"CREATE TABLE IF NOT EXISTS events ({cols}, week_start DATE);")
+        self.duck.execute("CREATE TABLE IF NOT EXISTS mirror_version "
+                          "(user_id BIGINT PRIMARY KEY, version BIGINT);")
+
+    def _fetch(self, conn, ids: List[int]) -> pd.DataFrame:
+        import pandas as pd
+        # 原始元组 + 文本日期：跳过 sqlite3.Row 与 DATE 转换器的逐行 Python 开销，类型转换交给 DuckDB
+        sel = ",".join("CAST(date AS TEXT) AS date" if c == "date" else c for c in self._cols)
+        cur = conn.cursor()
+        cur.row_factory = None
+        rows = cur.execute(f"SELECT {sel} FROM events WHERE user_id IN "
+                           f"({','.join('?' * len(ids))});", ids).fetchall()
+        return pd.DataFrame(rows, columns=self._cols)
+
+    def sync(self, conn=None) -> int:
+        """把 SQLite 中有变化的用户整用户重载进镜像，返回重载用户数。"""
+        if conn is None:
+            with self.pool.reader() as c:
+                return self.sync(c)
+        in_tx = self.pool._writer_owner == threading.get_ident()
+        with self._lock:
+            self._ensure_mirror(conn)
+            current = dict(conn.execute(
+                "SELECT user_id, version FROM user_events_version;").fetchall())
+            seen = dict(self.duck.execute(
+                "SELECT user_id, version FROM mirror_version;").fetchall())
+            if in_tx:                        # 同一事务里已重载过的用户不再重复重载
+                seen.update(self._pending)
+            changed = [u for u, v in current.items() if seen.get(u) != v]
+            changed += [u for u in seen if u not in current]
+            if not changed:
+                return 0
+
+            load = ",".join("CAST(date AS DATE)" if c == "date" else c for c in self._cols)
+            self.duck.execute("BEGIN;")
+            try:
+                for i in range(0, len(changed), _LOAD_CHUNK):
+                    ids = changed[i:i + _LOAD_CHUNK]
+                    chunk = self._fetch(conn, ids)
+                    id_list = ",".join(str(int(u)) for u in ids)
+                    self.duck.execute(f"DELETE FROM events WHERE user_id IN ({id_list});")
+                    self.duck.execute(f"DELETE FROM mirror_version WHERE user_id IN ({id_list});")
+                    if len(chunk):
+                        self.duck.register("_chunk", chunk)
+                        self.duck.execute(
+                            f"INSERT INTO events SELECT {load}, "
+                            "CAST(date_trunc('week', CAST(date AS DATE)) AS DATE) FROM _chunk;")
+                        self.duck.unregister("_chunk")
+                    versions = [(u, current[u]) for u in ids if u in current]
+                    if in_tx:
+                        # 读到的是未提交数据：等事务结束再决定是否记版本
+                        self._pending.update(versions)
+                        self.pool.on_tx_end(self._tx_ended)
+                    else:
+                        for u in ids:        # 已按提交后的数据重载，事务内的记录作废
+                            self._pending.pop(u, None)
+                        if versions:
+                            self.duck.executemany("INSERT INTO mirror_version VALUES (?, ?);",
+                                                  versions)
+                    self.stats["rows_loaded"] += len(chunk)
+                self.duck.execute("COMMIT;")
+            except BaseException:
+                self.duck.execute("ROLLBACK;")
+                raise
+            self.stats["syncs"] += 1
+            self.stats["users_reloaded"] += len(changed)
+            return len(changed)
+
+    def _tx_ended(self, committed: bool) -> None:
+        """写事务结束：提交时把事务内重载的用户版本记入 mirror_version，回滚时丢弃。"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if not committed or not pending:
+                return
+            id_list = ",".join(str(int(u)) for u in pending)
+            self.duck.execute(f"DELETE FROM mirror_version WHERE user_id IN ({id_list});")
+            self.duck.executemany("INSERT INTO mirror_version VALUES (?, ?);",
+                                  list(pending.items()))
+
+    # ---------------------------- 分析查询 ----------------------------
+    def weekly_aggregates(self, conn, weeks: Sequence[Week]) -> List[Dict[str, Any]]:
+        if not weeks:
+            return []
+        with self._lock:
+            self.sync(conn)
+            import pandas as pd
+            scope = pd.DataFrame(sorted(set(weeks)), columns=["user_id", "week_start"])
+            self.duck.register("agg_scope", scope)
+            try:
+                cur = self.duck.execute(_weekly_agg_sql(
+                    "(SELECT user_id, CAST(week_start AS DATE) AS week_start FROM agg_scope)",
+                    "e.week_start = w.week_start"))
+                names = [d[0] for d in cur.description]
+                return [dict(zip(names, r)) for r in cur.fetchall()]
+            finally:
+                self.duck.unregister("agg_scope")
+
+    def period_aggregates(self, conn, periods: Sequence[Week],
+                          months: int) -> List[Dict[str, Any]]:
+        if not periods:
+            return []
+        with self._lock:
+            self.sync(conn)
+            import pandas as pd
+            scope = pd.DataFrame(sorted(set(periods)), columns=["user_id", "period_start"])
+            self.duck.register("agg_scope", scope)
+            try:
+                cur = self.duck.execute(_period_agg_sql(
+                    "(SELECT user_id, CAST(period_start AS DATE) AS period_start FROM agg_scope)",
+                    f"e.date >= w.period_start "
+                    f"AND e.date < w.period_start + INTERVAL {int(months)} MONTH"))
+                names = [d[0] for d in cur.description]
+                return [dict(zip(names, r)) for r in cur.fetchall()]
+            finally:
+                self.duck.unregister("agg_scope")
+
+    def scan(self, table, user_id=None, columns=None, start=None, end=None) -> pd.DataFrame:
+        self._ensure_cols()
+        # 只镜像 events 的数值列；其余表 / 列（月 / 季汇总是小的预计算表）仍在 SQLite 上扫描
+        if table != "events" or not columns or not set(columns) <= set(self._cols):
+            return SQLiteBackend.scan(self, table, user_id, columns, start, end)
+        import pandas as pd
+        sql, params = _scan_sql(table, columns, user_id, start, end)
+        with self._lock:
+            self.sync()
+            df = self.duck.execute(sql, params).df()
+        if "date" in df:
+            df["date"] = pd.to_datetime(df["date"])
+        return df
+
+    def _ensure_cols(self) -> None:
+        if not self._cols:
+            with self.pool.reader() as conn, self._lock:
+                self._ensure_mirror(conn)
+
+    def close(self) -> None:
+        with self._lock:
+            self.duck.close()
+        super().close()
+
+
+def make_backend(pool: ConnectionPool, name: Optional[str] = None) -> StorageBackend:
+    name = (name or os.getenv("HC_STORAGE", "sqlite")).lower()
+    if name == "sqlite":
+        return SQLiteBackend(pool)
+    if name == "duckdb":
+        return DuckDBBackend(pool, os.getenv("HC_DUCKDB_PATH"))
+    raise ValueError(f"unknown storage backend: {name}")
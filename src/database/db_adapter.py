@@ -1,175 +1,413 @@
+from __future__ import annotations
+import config  # noqa: F401  —— 先加载 .env，下面的 HC_* 环境变量才生效
 import os
 import sqlite3
 import datetime as dt
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Tuple, Any
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Any
 
-import pandas as pd
+from database.pool import ConnectionPool
+from database.backend import EVENT_SCAN_COLS, StorageBackend, make_backend
+from database.read_cache import ReadCache, read_events_version
+from database.write_queue import WriteQueue
+from database.migrations import (migrate, _table_columns, DEFAULT_USER_ID,
+                                 WEEKLY_METRICS, TREND_WINDOWS, TREND_COLS, ROLLUPS,
+                                 LIVE_METRICS)
+from database.ingest import EVENT_COLUMNS, check_range, iter_valid_rows
 
-ROOT_DIR     = Path(__file__).resolve().parents[2]       # 仓库根路径
+if TYPE_CHECKING:                # pandas / numpy 在首次取 DataFrame / 图表数组时才导入
+    import pandas as pd
+    from database.series_store import SeriesStore, UserSeries
+
+ROOT_DIR     = config.ROOT_DIR                         # 仓库根路径
 DATA_DIR     = ROOT_DIR / "data"
-DB_PATH      = DATA_DIR / "db.sqlite"
+DB_PATH      = Path(os.getenv("HC_DB_PATH", DATA_DIR / "db.sqlite"))   # 压测 / CI 可指向临时库
 DATE_FMT_SQL = "%Y-%m-%d"
 
-DATA_DIR.mkdir(parents=True, exist_ok=True)
-
-def _get_conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, detect_types=sqlite3.PARSE_DECLTYPES,
-                           check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL;")
-    return conn
-
-
-def _ensure_schema() -> None:
-    """首次运行时建表。"""
-    create_events_sql = """
-    CREATE TABLE IF NOT EXISTS events (
-        date            DATE PRIMARY KEY,
-        sleep_hours     REAL,
-        sleep_start     TEXT,
-        sleep_end       TEXT,
-        veggie_servings INTEGER,
-        high_fat_meals  INTEGER,
-        water_ml        INTEGER,
-        exercise_minutes INTEGER,
-        steps           INTEGER,
-        mood_score      INTEGER,
-        mood_note       TEXT,
-        screen_hours    REAL,
-        alcohol         INTEGER,
-        caffeine        INTEGER,
-        created_at      TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );"""
-
-    create_weekly_sql = """
-    CREATE TABLE IF NOT EXISTS weekly_summary (
-        week_start      DATE PRIMARY KEY,
-        avg_sleep       REAL,
-        total_steps     INTEGER,
-        mood_avg        REAL,
-        exercise_total  INTEGER,
-    
-        veggie_avg      REAL,   
-        water_total     INTEGER,
-        alcohol_days    INTEGER,
-    
-        suggestions     TEXT,
-        created_at      TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );"""
-
-    create_profile_sql = """
-    CREATE TABLE IF NOT EXISTS user_profile (
-        id          INTEGER PRIMARY KEY CHECK (id = 1),
-        name        TEXT,
-        gender      TEXT CHECK (gender IN ('男','女','其他')),
-        age         INTEGER,
-        height_cm   INTEGER,
-        weight_kg   REAL,
-        occupation  TEXT,
-        updated_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-    """
+DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+
+# 导入时不建连、不执行 DDL：首次建写连接时按 PRAGMA user_version 补跑缺失的迁移
+_POOL = ConnectionPool(DB_PATH, on_connect=migrate)
+# 存储后端：HC_STORAGE=duckdb 时聚合 / 范围扫描走 DuckDB，读写连接仍是 SQLite
+BACKEND: StorageBackend = make_backend(_POOL)
+# 仪表盘读缓存：HC_READ_CACHE=0 关闭（排查数据问题时用）
+_READ_CACHE = ReadCache(_POOL, enabled=os.getenv("HC_READ_CACHE", "1") != "0")
+# 打卡 / 档案 / 周报写回走写后台队列，由写线程组提交；HC_WRITE_QUEUE=0 时在调用线程直接写
+_WRITES = WriteQueue(_POOL, enabled=os.getenv("HC_WRITE_QUEUE", "1") != "0")
+# 日粒度指标数组：仪表盘图表直接切片，不再每次渲染查 SQL 建 DataFrame；首次取图表数据时创建
+_SERIES: Optional[SeriesStore] = None
+
+
+def _series_store() -> SeriesStore:
+    global _SERIES
+    if _SERIES is None:
+        from database.series_store import SeriesStore
+        _SERIES = SeriesStore(_POOL, _READ_CACHE)
+    return _SERIES
+
+
+@contextmanager
+def read_conn() -> Iterator[sqlite3.Connection]:
+    """当前线程复用的只读连接。"""
+    with BACKEND.reader() as conn:
+        yield conn
+
 
-    with _get_conn() as conn:
-        conn.execute(create_events_sql)
-        conn.execute(create_weekly_sql)
-        conn.execute(create_profile_sql)
-        conn.commit()
+@contextmanager
+def write_conn() -> Iterator[sqlite3.Connection]:
+    """全局唯一写连接，退出时自动提交 / 异常回滚。"""
+    with BACKEND.writer() as conn:
+        yield conn
 
-_ensure_schema()
 
-def insert_event(**kwargs: Any) -> None:
+def submit_write(fn: Callable[[sqlite3.Connection], Any],
+                 durability: Optional[str] = None) -> Future:
+    """经写队列执行 fn(写连接)，与其他待写操作合并为一个事务提交。
+
+    durability 见 write_queue.DURABILITY，缺省 HC_WRITE_DURABILITY；除 async 外等到提交才返回，
+    fn 抛出的异常在此处重新抛出（同批其他写入不受影响）。返回的 Future 结果为 fn 的返回值。"""
+    return _WRITES.write(fn, durability)
+
+
+def flush_writes() -> None:
+    """等待已入队（含 async）的写入全部提交。"""
+    _WRITES.flush()
+
+
+def insert_event(user_id: int = DEFAULT_USER_ID, durability: Optional[str] = None,
+                 **kwargs: Any) -> Future:
+    for col, v in kwargs.items():        # 与批量导入同一套范围：越界值既不入库也不进日粒度数组
+        check_range(col, v)
     cols = ",".join(kwargs.keys())
     placeholders = ",".join(["?"] * len(kwargs))
     update_clause = ",".join([f"{c}=excluded.{c}" for c in kwargs.keys()])
 
-    sql = (f"INSERT INTO events ({cols}) VALUES ({placeholders}) "
-           f"ON CONFLICT(date) DO UPDATE SET {update_clause};")
+    sql = (f"INSERT INTO events (user_id,{cols}) VALUES (?,{placeholders}) "
+           f"ON CONFLICT(user_id, date) DO UPDATE SET {update_clause};")
+
+    values = [user_id] + list(kwargs.values())
+    day = _to_date(kwargs["date"])
+    store = _SERIES                      # 尚未创建时无需原地更新
 
-    values = list(kwargs.values())
-    with _get_conn() as conn:
+    def _write(conn: sqlite3.Connection) -> Tuple[int, int]:
+        before = read_events_version(conn, user_id) if store else 0
+        is_new = conn.execute("SELECT 1 FROM events WHERE user_id = ? AND date = ?",
+                              (user_id, day)).fetchone() is None
         conn.execute(sql, values)
-        conn.commit()
+        if is_new:
+            _streak_on_insert(conn, user_id, day)
+        return before, read_events_version(conn, user_id) if store else 0
 
+    def _apply(fut: Future) -> None:     # 提交后（写线程或调用线程）原地更新日粒度数组
+        if fut.exception() is None:
+            store.apply(user_id, day, kwargs, *fut.result())
+
+    fut = _WRITES.submit(_write, durability)
+    if store is not None:
+        fut.add_done_callback(_apply)
+    if (durability or _WRITES.durability) != "async":
+        fut.result()
+    return fut
+
+
+# 预编译一次的批量 upsert：导入文件缺失的列用 COALESCE 保留库中原值
+_BULK_COLS = ["user_id", "date"] + list(EVENT_COLUMNS)
+_BULK_UPSERT_SQL = (
+    f"INSERT INTO events ({','.join(_BULK_COLS)}) "
+    f"VALUES ({','.join('?' * len(_BULK_COLS))}) "
+    f"ON CONFLICT(user_id, date) DO UPDATE SET "
+    + ",".join(f"{c}=COALESCE(excluded.{c}, events.{c})" for c in EVENT_COLUMNS)
+    + ";"
+)
+
+
+def insert_events_bulk(rows: Iterable[Dict[str, Any]],
+                       user_id: int = DEFAULT_USER_ID,
+                       chunk_size: int = 5000,
+                       errors: list | None = None) -> int:
+    """批量导入事件：校验 → executemany 分块事务；返回写入行数。
+
+    行中可带 user_id 列，缺省归 user_id；不合法行跳过并记入 errors。
+    受影响的周由 events 触发器标记为脏，导入结束后按用户重建一次连击状态。
+    """
+    errors = [] if errors is None else errors
+    written = 0
+    users = set()
+    chunk: List[tuple] = []
+
+    def _flush() -> None:
+        with write_conn() as conn:
+            conn.executemany(_BULK_UPSERT_SQL, chunk)
+        chunk.clear()
+
+    for row in iter_valid_rows(rows, user_id, errors):
+        chunk.append(tuple(row[c] for c in _BULK_COLS))
+        users.add(row["user_id"])
+        if len(chunk) >= chunk_size:
+            written += len(chunk)
+            _flush()
+    if chunk:
+        written += len(chunk)
+        _flush()
+
+    if users:
+        with write_conn() as conn:
+            for uid in users:
+                rebuild_streak_state(uid, conn)
+    return written
+
+
+def _to_date(v: Any) -> dt.date:
+    if isinstance(v, dt.datetime):
+        return v.date()
+    if isinstance(v, dt.date):
+        return v
+    return dt.datetime.strptime(str(v)[:10], DATE_FMT_SQL).date()
+
+
+def list_users() -> List[int]:
+    """有档案或有打卡记录的全部用户。"""
+    with read_conn() as conn:
+        rows = conn.execute(
+            "SELECT user_id FROM user_profile "
+            "UNION SELECT DISTINCT user_id FROM events ORDER BY 1;"
+        ).fetchall()
+    return [r[0] for r in rows]
 
-def get_streak() -> Tuple[int, int, int]:
-    today = dt.date.today()
-    with _get_conn() as conn:
-        # 连续天数：从今天开始向前回溯
-        streak = 0
-        cursor = conn.cursor()
-        while True:
-            d = today - dt.timedelta(days=streak)
-            cursor.execute("SELECT 1 FROM events WHERE date = ?", (d,))
-            if cursor.fetchone():
-                streak += 1
-            else:
-                break
 
-        # 本月信息
-        first_day = today.replace(day=1)
-        next_month = (first_day + dt.timedelta(days=32)).replace(day=1)
-        month_days = (next_month - first_day).days
+# ─────────────────────── 连击状态（物化） ───────────────────────
+def _streak_on_insert(conn: sqlite3.Connection, user_id: int, day: dt.date) -> None:
+    """新日期写入后 O(1) 维护连击状态；补录到当前区间之前则整体重建。"""
+    st = conn.execute("SELECT run_start, run_end, current_len, longest "
+                      "FROM streak_state WHERE user_id = ?", (user_id,)).fetchone()
+    if st is None:
+        rebuild_streak_state(user_id, conn)   # 首次：含刚写入的这一行
+        return
 
-        cursor.execute(
-            "SELECT COUNT(*) FROM events "
-            "WHERE date >= ? AND date < ?;",
-            (first_day, next_month)
-        )
-        month_filled, = cursor.fetchone()
+    conn.execute(
+        "INSERT INTO streak_month_fill (user_id, month, filled) VALUES (?, ?, 1) "
+        "ON CONFLICT(user_id, month) DO UPDATE SET filled = filled + 1;",
+        (user_id, day.strftime("%Y-%m"))
+    )
 
-    return streak, month_days, month_filled
+    run_start, run_end = st["run_start"], st["run_end"]
+    length, longest = st["current_len"], st["longest"]
+    if run_end is None or day > run_end + dt.timedelta(days=1):
+        run_start, run_end, length = day, day, 1
+    elif day == run_end + dt.timedelta(days=1):
+        run_end, length = day, length + 1
+    else:
+        # 补录历史日期：可能把两段连击接上，走一次全量重建
+        _rebuild_runs(conn, user_id)
+        return
 
+    conn.execute(
+        "UPDATE streak_state SET run_start=?, run_end=?, current_len=?, "
+        "longest=?, updated_at=CURRENT_TIMESTAMP WHERE user_id = ?;",
+        (run_start, run_end, length, max(longest, length), user_id)
+    )
 
-def fetch_recent_summaries(limit: int = 4) -> pd.DataFrame:
+
+def _rebuild_runs(conn: sqlite3.Connection, user_id: int) -> None:
+    run_start = run_end = None
+    length = longest = 0
+    for (d,) in conn.execute("SELECT date FROM events WHERE user_id = ? "
+                             "ORDER BY date;", (user_id,)):
+        d = _to_date(d)
+        if run_end is not None and d == run_end + dt.timedelta(days=1):
+            run_end, length = d, length + 1
+        else:
+            run_start, run_end, length = d, d, 1
+        longest = max(longest, length)
+
+    conn.execute(
+        "INSERT INTO streak_state (user_id, run_start, run_end, current_len, longest) "
+        "VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT(user_id) DO UPDATE SET run_start=excluded.run_start, "
+        "run_end=excluded.run_end, current_len=excluded.current_len, "
+        "longest=excluded.longest, updated_at=CURRENT_TIMESTAMP;",
+        (user_id, run_start, run_end, length, longest)
+    )
+
+
+def rebuild_streak_state(user_id: int = DEFAULT_USER_ID,
+                         conn: sqlite3.Connection | None = None) -> None:
+    """全量重建某用户的连击状态与每月打卡数；批量补录 / 删除事件后调用。"""
+    if conn is None:
+        with write_conn() as c:
+            rebuild_streak_state(user_id, c)
+        return
+
+    conn.execute("DELETE FROM streak_month_fill WHERE user_id = ?;", (user_id,))
+    conn.execute(
+        "INSERT INTO streak_month_fill (user_id, month, filled) "
+        "SELECT user_id, strftime('%Y-%m', date), COUNT(*) FROM events "
+        "WHERE user_id = ? GROUP BY strftime('%Y-%m', date);",
+        (user_id,)
+    )
+    _rebuild_runs(conn, user_id)
+
+
+def _run_length_until(conn: sqlite3.Connection, user_id: int, day: dt.date) -> int:
+    """day 之后还有更晚的连击区间时的兜底：单次查询向前数连续天数。"""
+    streak = 0
+    for (d,) in conn.execute("SELECT date FROM events WHERE user_id = ? AND date <= ? "
+                             "ORDER BY date DESC;", (user_id, day)):
+        if _to_date(d) != day - dt.timedelta(days=streak):
+            break
+        streak += 1
+    return streak
+
+
+def get_streak(user_id: int = DEFAULT_USER_ID) -> Tuple[int, int, int]:
+    """返回 (连续打卡天数, 本月天数, 本月已打卡天数)，读物化状态 O(1)。"""
+    return _get_streak(user_id, dt.date.today())
+
+
+@_READ_CACHE.cached
+def _get_streak(user_id: int, today: dt.date) -> Tuple[int, int, int]:
+    first_day = today.replace(day=1)
+    next_month = (first_day + dt.timedelta(days=32)).replace(day=1)
+    month_days = (next_month - first_day).days
+
+    with read_conn() as conn:
+        st = conn.execute(
+            "SELECT run_start, run_end, "
+            "(SELECT filled FROM streak_month_fill "
+            " WHERE user_id = s.user_id AND month = ?) AS filled "
+            "FROM streak_state AS s WHERE user_id = ?;",
+            (today.strftime("%Y-%m"), user_id)
+        ).fetchone()
+    if st is None:
+        rebuild_streak_state(user_id)
+        return _get_streak(user_id, today)
+
+    run_start, run_end = st["run_start"], st["run_end"]
+    if run_end is None or today > run_end:
+        streak = 0
+    elif today >= run_start:
+        streak = (today - run_start).days + 1
+    else:
+        # 当前区间整体在未来（提前打卡），今天所在区间需要单独数
+        with read_conn() as conn:
+            streak = _run_length_until(conn, user_id, today)
+
+    return streak, month_days, st["filled"] or 0
+
+
+@_READ_CACHE.cached
+def fetch_recent_summaries(limit: int = 4,
+                           user_id: int = DEFAULT_USER_ID) -> pd.DataFrame:
 
     sql = ("SELECT week_start, avg_sleep, total_steps, mood_avg, "
-           "exercise_total, suggestions "
+           "exercise_total, suggestions, "
+           f"{','.join(TREND_COLS)} "
            "FROM weekly_summary "
+           "WHERE user_id = ? "
            "ORDER BY week_start DESC "
            "LIMIT ?;")
 
-    with _get_conn() as conn:
-        df = pd.read_sql_query(sql, conn, params=(limit,))
+    import pandas as pd
+    with read_conn() as conn:
+        df = pd.read_sql_query(sql, conn, params=(user_id, limit))
     return df
 
-def fetch_events_of_week(week_start: dt.date) -> pd.DataFrame:
-    with _get_conn() as conn:
-        df = pd.read_sql_query(
-            "SELECT * FROM events WHERE date >= ? AND date < ? ORDER BY date",
-            conn,
-            params=(week_start, week_start + dt.timedelta(days=7)),
-            parse_dates=["date"],
-        )
-    return df
+@_READ_CACHE.cached
+def fetch_live_week(user_id: int = DEFAULT_USER_ID,
+                    week_start: Optional[dt.date] = None) -> dict:
+    """某周（缺省为最近有记录的一周）的实时汇总，写入时由触发器维护，不扫描 events。
+
+    指标列与 weekly_summary 同名，另带 days_covered 与 status（7 天齐全为 final，否则 provisional）；
+    无数据时返回 {}。"""
+    sql, params = "SELECT * FROM weekly_live WHERE user_id = ?", [user_id]
+    if week_start is not None:
+        sql += " AND week_start = ?"
+        params.append(week_start)
+    with read_conn() as conn:
+        row = conn.execute(sql + " ORDER BY week_start DESC LIMIT 1;", params).fetchone()
+    return dict(row) if row else {}
+
+@_READ_CACHE.cached
+def fetch_rollups(grain: str = "month", user_id: int = DEFAULT_USER_ID,
+                  since: Optional[dt.date] = None) -> pd.DataFrame:
+    """月 / 季汇总（grain="month" / "quarter"），按 period_start 升序；since 为含端点的起始日。"""
+    table, _ = ROLLUPS[grain]
+    return BACKEND.scan(table, user_id, start=since)
+
+@_READ_CACHE.cached
+def fetch_events_of_week(week_start: dt.date,
+                         user_id: int = DEFAULT_USER_ID) -> pd.DataFrame:
+    """某周的逐日数值指标（EVENT_SCAN_COLS）；HC_STORAGE=duckdb 时在 DuckDB 镜像上扫描。"""
+    return BACKEND.scan("events", user_id, columns=EVENT_SCAN_COLS, start=week_start,
+                        end=week_start + dt.timedelta(days=7))
 
-def upsert_profile(**kwargs):
+def upsert_profile(user_id: int = DEFAULT_USER_ID, durability: Optional[str] = None, **kwargs):
     cols = ", ".join(kwargs.keys())
     placeholders = ", ".join("?" for _ in kwargs)
-    sql = f"INSERT INTO user_profile (id,{cols}) VALUES (1,{placeholders}) " \
-          f"ON CONFLICT(id) DO UPDATE SET " + ", ".join(f"{c}=excluded.{c}" for c in kwargs)
-    with _get_conn() as c:
-        c.execute(sql, list(kwargs.values()))
-        c.commit()
-
-def get_profile() -> dict:
-    with _get_conn() as c:
-        row = c.execute("SELECT * FROM user_profile WHERE id=1").fetchone()
+    sql = f"INSERT INTO user_profile (user_id,{cols}) VALUES (?,{placeholders}) " \
+          f"ON CONFLICT(user_id) DO UPDATE SET " + ", ".join(f"{c}=excluded.{c}" for c in kwargs)
+    return submit_write(lambda c: c.execute(sql, [user_id] + list(kwargs.values())).rowcount,
+                        durability)
+
+@_READ_CACHE.cached
+def get_profile(user_id: int = DEFAULT_USER_ID) -> dict:
+    with read_conn() as c:
+        row = c.execute("SELECT * FROM user_profile WHERE user_id = ?",
+                        (user_id,)).fetchone()
     return dict(row) if row else {}
 
+def get_series(user_id: int = DEFAULT_USER_ID) -> UserSeries:
+    """该用户的日粒度指标数组（进程内共享，只读使用）。"""
+    return _series_store().get(user_id)
+
+
+def read_cache_stats() -> Dict[str, Any]:
+    """读缓存命中统计：hits / misses / probes（data_version 探测）/ user_checks。"""
+    return {**_READ_CACHE.snapshot(),
+            "series": _SERIES.snapshot() if _SERIES is not None else None}
+
+
+def write_queue_stats() -> Dict[str, Any]:
+    """写队列统计：ops / batches / failed / rejected / max_batch / pending。"""
+    return _WRITES.snapshot()
+
 if __name__ == "__main__":
-    """简单 CLI：python -m database.db_adapter show-events"""
+    """简单 CLI：python -m database.db_adapter show-events [--user 1]
+               python -m database.db_adapter import backfill.csv [--user 1]"""
     import argparse
+    import time
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("cmd", choices=["show-events", "show-sum"])
+    parser.add_argument("cmd", choices=["show-events", "show-sum", "import"])
+    parser.add_argument("path", nargs="?", help="import: CSV / JSONL / Parquet 文件")
+    parser.add_argument("--user", type=int, default=DEFAULT_USER_ID)
+    parser.add_argument("--format", choices=["csv", "jsonl", "parquet"])
+    parser.add_argument("--chunk-size", type=int, default=5000)
     args = parser.parse_args()
 
     if args.cmd == "show-events":
-        with _get_conn() as c:
-            df = pd.read_sql_query("SELECT * FROM events ORDER BY date DESC", c)
+        import pandas as pd
+        with read_conn() as c:
+            df = pd.read_sql_query("SELECT * FROM events WHERE user_id = ? "
+                                   "ORDER BY date DESC", c, params=(args.user,))
         print(df)
 
     elif args.cmd == "show-sum":
-        print(fetch_recent_summaries())
+        print(fetch_recent_summaries(user_id=args.user))
+
+    elif args.cmd == "import":
+        from database.ingest import iter_records
+        if not args.path:
+            parser.error("import 需要文件路径")
+        errs: list = []
+        t0 = time.perf_counter()
+        n = insert_events_bulk(iter_records(args.path, args.format),
+                               user_id=args.user, chunk_size=args.chunk_size,
+                               errors=errs)
+        elapsed = time.perf_counter() - t0
+        print(f"imported {n} rows in {elapsed:.2f}s "
+              f"({n / max(elapsed, 1e-9):,.0f} rows/s), rejected {len(errs)}")
+        for lineno, reason in errs[:20]:
+            print(f"  row {lineno}: {reason}")
@@ -0,0 +1,151 @@
+# 批量导入：CSV / JSONL / Parquet 流式读取 + 行级校验（不碰数据库）
+from __future__ import annotations
+import csv
+import datetime as dt
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+DATE_FMT = "%Y-%m-%d"
+
+_TRUE = {"1", "true", "t", "yes", "y", "是"}
+_FALSE = {"0", "false", "f", "no", "n", "否", ""}
+
+
+def _to_bool(v: Any) -> int:
+    if isinstance(v, (bool, int)):
+        return int(bool(v))
+    s = str(v).strip().lower()
+    if s in _TRUE:
+        return 1
+    if s in _FALSE:
+        return 0
+    raise ValueError(f"not a boolean: {v!r}")
+
+
+def _to_int(v: Any) -> int:
+    if isinstance(v, float) and not v.is_integer():
+        return int(round(v))
+    return int(float(v)) if isinstance(v, str) else int(v)
+
+
+# events 可导入列 → 转换函数；缺失列保持库中原值
+EVENT_COLUMNS: Dict[str, Callable[[Any], Any]] = {
+    "sleep_hours":      float,
+    "sleep_start":      str,
+    "sleep_end":        str,
+    "veggie_servings":  _to_int,
+    "high_fat_meals":   _to_int,
+    "water_ml":         _to_int,
+    "exercise_minutes": _to_int,
+    "steps":            _to_int,
+    "mood_score":       _to_int,
+    "mood_note":        str,
+    "screen_hours":     float,
+    "alcohol":          _to_bool,
+    "caffeine":         _to_bool,
+}
+
+# 明显不合理的值直接拒绝，防止穿戴设备脏数据进入周统计；
+# series_store 按这些上限选数组类型，新增数值列须同时在这里给出范围
+_RANGES = {
+    "sleep_hours":      (0, 24),
+    "screen_hours":     (0, 24),
+    "mood_score":       (1, 5),
+    "steps":            (0, 200_000),
+    "water_ml":         (0, 20_000),
+    "exercise_minutes": (0, 1440),
+    "veggie_servings":  (0, 50),
+    "high_fat_meals":   (0, 20),
+    "alcohol":          (0, 1),
+    "caffeine":         (0, 1),
+}
+
+
+def check_range(col: str, v: Any) -> None:
+    """v 超出该列 _RANGES 时抛 ValueError；缺失值（None / 空串）和没有范围的列不检查。"""
+    lo_hi = _RANGES.get(col)
+    if lo_hi is None or v is None or v == "":
+        return
+    try:
+        ok = lo_hi[0] <= float(v) <= lo_hi[1]
+    except (TypeError, ValueError):
+        raise ValueError(f"{col}: not a number: {v!r}") from None
+    if not ok:
+        raise ValueError(f"{col}={v} out of range {lo_hi}")
+
+
+def _parse_date(v: Any) -> dt.date:
+    if isinstance(v, dt.datetime):
+        return v.date()
+    if isinstance(v, dt.date):
+        return v
+    return dt.datetime.strptime(str(v).strip()[:10], DATE_FMT).date()
+
+
+def validate_event_row(raw: Dict[str, Any], default_user: int) -> Dict[str, Any]:
+    """把一行原始记录规整为 events 列；不合法时抛 ValueError。"""
+    if raw.get("date") in (None, ""):
+        raise ValueError("missing date")
+    row: Dict[str, Any] = {
+        "user_id": _to_int(raw["user_id"]) if raw.get("user_id") not in (None, "")
+                   else default_user,
+        "date": _parse_date(raw["date"]),
+    }
+    for col, conv in EVENT_COLUMNS.items():
+        v = raw.get(col)
+        if v is None or (isinstance(v, str) and v.strip() == "" and conv is not str):
+            row[col] = None
+            continue
+        try:
+            row[col] = conv(v)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"{col}: {e}") from None
+        check_range(col, row[col])
+    return row
+
+
+# ─────────────────────── 文件读取（流式） ───────────────────────
+def _iter_csv(path: Path) -> Iterator[Dict[str, Any]]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        yield from csv.DictReader(f)
+
+
+def _iter_jsonl(path: Path) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _iter_parquet(path: Path, batch_size: int = 10_000) -> Iterator[Dict[str, Any]]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:                # 可选依赖
+        raise RuntimeError("读取 Parquet 需要安装 pyarrow：pip install pyarrow") from e
+    pf = pq.ParquetFile(path)
+    for batch in pf.iter_batches(batch_size=batch_size):
+        yield from batch.to_pylist()
+
+
+_READERS = {"csv": _iter_csv, "jsonl": _iter_jsonl, "parquet": _iter_parquet}
+
+
+def iter_records(path: Path | str, fmt: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """按扩展名（或显式 fmt）选择读取器，逐行产出原始字典。"""
+    path = Path(path)
+    fmt = fmt or {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl",
+                  ".parquet": "parquet", ".pq": "parquet"}.get(path.suffix.lower())
+    if fmt not in _READERS:
+        raise ValueError(f"无法识别的导入格式：{path.name}（可用 --format 指定）")
+    return _READERS[fmt](path)
+
+
+def iter_valid_rows(records: Iterable[Dict[str, Any]], default_user: int,
+                    errors: list) -> Iterator[Dict[str, Any]]:
+    """校验并产出合法行；不合法行记入 errors = [(行号, 原因), ...]。"""
+    for lineno, raw in enumerate(records, start=1):
+        try:
+            yield validate_event_row(raw, default_user)
+        except (ValueError, KeyError) as e:
+            errors.append((lineno, str(e)))
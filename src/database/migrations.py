@@ -0,0 +1,529 @@
+"""库结构版本化迁移：PRAGMA user_version 记录已应用到的版本。
+
+建连时（连接池创建写连接时）调用 migrate()：已是最新版本只读一次 user_version，不执行任何 DDL；
+否则按顺序补跑缺失的迁移。每个迁移都可重复执行（IF NOT EXISTS / 先查列），
+旧代码建出的 user_version=0 库也能直接升上来。新增表结构 → 在 MIGRATIONS 末尾追加一项。
+"""
+from __future__ import annotations
+import re, sqlite3
+from typing import Callable, List, Tuple
+
+from database.read_cache import (CREATE_EVENTS_VERSION_SQL, CREATE_VERSION_SQL,
+                                 version_triggers_sql)
+
+DEFAULT_USER_ID = 1                                      # 单用户部署 / 旧数据迁移后的归属用户
+
+# weekly_summary 的周指标列，以及同表存放的趋势列：4 / 12 周滚动均值 + 周环比差值
+WEEKLY_METRICS = ["avg_sleep", "total_steps", "mood_avg", "exercise_total",
+                  "veggie_avg", "water_total", "alcohol_days"]
+TREND_WINDOWS  = (4, 12)
+TREND_COLS     = ([f"{m}_ma{w}" for m in WEEKLY_METRICS for w in TREND_WINDOWS]
+                  + [f"{m}_wow" for m in WEEKLY_METRICS])
+
+# 长周期汇总：粒度 → (表名, 每期月数)；按自然月 / 季直接从 events 聚合，不足整期的也保留（n_days 标明覆盖天数）
+ROLLUPS = {"month": ("monthly_summary", 1), "quarter": ("quarterly_summary", 3)}
+
+# 进行中 / 不足 7 天的周的实时汇总：weekly_summary 列 → (events 列, 归约)。
+# 触发器按差量维护各指标的 和 + 非空计数（写入时 O(1)），均值在 weekly_live 视图里由 和 / 计数 得出
+LIVE_METRICS = {
+    "avg_sleep":      ("sleep_hours",      "mean"),
+    "total_steps":    ("steps",            "sum"),
+    "mood_avg":       ("mood_score",       "mean"),
+    "exercise_total": ("exercise_minutes", "sum"),
+    "veggie_avg":     ("veggie_servings",  "mean"),
+    "water_total":    ("water_ml",         "sum"),
+    "alcohol_days":   ("alcohol",          "sum"),
+}
+
+# (user_id, date) 复合主键 + WITHOUT ROWID：表本身按用户聚簇，按用户的范围扫描即索引扫描
+_EVENTS_SQL = """
+CREATE TABLE IF NOT EXISTS events (
+    user_id         INTEGER NOT NULL DEFAULT 1,
+    date            DATE NOT NULL,
+    sleep_hours     REAL,
+    sleep_start     TEXT,
+    sleep_end       TEXT,
+    veggie_servings INTEGER,
+    high_fat_meals  INTEGER,
+    water_ml        INTEGER,
+    exercise_minutes INTEGER,
+    steps           INTEGER,
+    mood_score      INTEGER,
+    mood_note       TEXT,
+    screen_hours    REAL,
+    alcohol         INTEGER,
+    caffeine        INTEGER,
+    created_at      TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, date)
+) WITHOUT ROWID;
+"""
+
+_WEEKLY_SQL = """
+CREATE TABLE IF NOT EXISTS weekly_summary (
+    user_id         INTEGER NOT NULL DEFAULT 1,
+    week_start      DATE NOT NULL,
+    avg_sleep       REAL,
+    total_steps     INTEGER,
+    mood_avg        REAL,
+    exercise_total  INTEGER,
+
+    veggie_avg      REAL,
+    water_total     INTEGER,
+    alcohol_days    INTEGER,
+
+    suggestions     TEXT,
+    created_at      TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, week_start)
+) WITHOUT ROWID;
+"""
+
+_PROFILE_SQL = """
+CREATE TABLE IF NOT EXISTS user_profile (
+    user_id     INTEGER PRIMARY KEY,
+    name        TEXT,
+    gender      TEXT CHECK (gender IN ('男','女','其他')),
+    age         INTEGER,
+    height_cm   INTEGER,
+    weight_kg   REAL,
+    occupation  TEXT,
+    updated_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# 增量聚合：水位线 + 脏周表，事件的任何增 / 改 / 删都由触发器标记所在周
+# （触发器里用 ON CONFLICT DO NOTHING，OR IGNORE 会被外层 upsert 覆盖）
+_AGG_STATE_SQL = """
+CREATE TABLE IF NOT EXISTS agg_watermark (
+    id              INTEGER PRIMARY KEY CHECK (id = 1),
+    last_created_at TEXT,
+    last_event_date DATE,
+    updated_at      TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS agg_dirty_weeks (
+    user_id         INTEGER NOT NULL,
+    week_start      DATE NOT NULL,
+    PRIMARY KEY (user_id, week_start)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS trg_events_dirty_ins AFTER INSERT ON events
+BEGIN
+    INSERT INTO agg_dirty_weeks(user_id, week_start)
+    VALUES (NEW.user_id, date(NEW.date, 'weekday 0', '-6 days'))
+    ON CONFLICT DO NOTHING;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_events_dirty_upd AFTER UPDATE ON events
+BEGIN
+    INSERT INTO agg_dirty_weeks(user_id, week_start)
+    VALUES (OLD.user_id, date(OLD.date, 'weekday 0', '-6 days')),
+           (NEW.user_id, date(NEW.date, 'weekday 0', '-6 days'))
+    ON CONFLICT DO NOTHING;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_events_dirty_del AFTER DELETE ON events
+BEGIN
+    INSERT INTO agg_dirty_weeks(user_id, week_start)
+    VALUES (OLD.user_id, date(OLD.date, 'weekday 0', '-6 days'))
+    ON CONFLICT DO NOTHING;
+END;
+"""
+
+# 连击物化状态：当前连击区间 + 历史最长 + 每月打卡天数
+_STREAK_SQL = """
+CREATE TABLE IF NOT EXISTS streak_state (
+    user_id     INTEGER PRIMARY KEY,
+    run_start   DATE,
+    run_end     DATE,
+    current_len INTEGER NOT NULL DEFAULT 0,
+    longest     INTEGER NOT NULL DEFAULT 0,
+    updated_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS streak_month_fill (
+    user_id     INTEGER NOT NULL,
+    month       TEXT NOT NULL,             -- YYYY-MM
+    filled      INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, month)
+) WITHOUT ROWID;
+"""
+
+_ROLLUP_COLS = """
+    user_id         INTEGER NOT NULL,
+    period_start    DATE NOT NULL,
+    n_days          INTEGER NOT NULL,
+    avg_sleep       REAL,
+    total_steps     INTEGER,
+    mood_avg        REAL,
+    exercise_total  INTEGER,
+    veggie_avg      REAL,
+    water_total     INTEGER,
+    alcohol_days    INTEGER,
+    updated_at      TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, period_start)
+"""
+
+# 月汇总的脏月表与 agg_dirty_weeks 同一思路；季度由脏月推出，不单独标记
+_ROLLUP_STATE_SQL = """
+CREATE TABLE IF NOT EXISTS agg_dirty_months (
+    user_id         INTEGER NOT NULL,
+    month_start     DATE NOT NULL,
+    PRIMARY KEY (user_id, month_start)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS trg_events_dirty_month_ins AFTER INSERT ON events
+BEGIN
+    INSERT INTO agg_dirty_months(user_id, month_start)
+    VALUES (NEW.user_id, date(NEW.date, 'start of month'))
+    ON CONFLICT DO NOTHING;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_events_dirty_month_upd AFTER UPDATE ON events
+BEGIN
+    INSERT INTO agg_dirty_months(user_id, month_start)
+    VALUES (OLD.user_id, date(OLD.date, 'start of month')),
+           (NEW.user_id, date(NEW.date, 'start of month'))
+    ON CONFLICT DO NOTHING;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_events_dirty_month_del AFTER DELETE ON events
+BEGIN
+    INSERT INTO agg_dirty_months(user_id, month_start)
+    VALUES (OLD.user_id, date(OLD.date, 'start of month'))
+    ON CONFLICT DO NOTHING;
+END;
+INSERT INTO agg_dirty_months(user_id, month_start)
+SELECT DISTINCT user_id, date(date, 'start of month') FROM events WHERE true
+ON CONFLICT DO NOTHING;
+"""
+
+_WEEK_OF = "date({}.date, 'weekday 0', '-6 days')"
+
+
+def _running_sql() -> str:
+    """weekly_running 表 + 增 / 改 / 删触发器 + weekly_live 视图。改 = 先减旧行再加新行，周计数归零即删。"""
+    srcs = [src for src, _ in LIVE_METRICS.values()]
+    types = dict(re.findall(r"^\s+(\w+)\s+(REAL|INTEGER)", _EVENTS_SQL, re.M))
+    cols = "".join(f"    {c}_sum {types[c]} NOT NULL DEFAULT 0,\n"
+                   f"    {c}_n INTEGER NOT NULL DEFAULT 0,\n" for c in srcs)
+    add_cols = ",".join(f"{c}_sum,{c}_n" for c in srcs)
+    add_vals = ",".join(f"COALESCE(NEW.{c}, 0),(NEW.{c} IS NOT NULL)" for c in srcs)
+    add_set = ",".join(f"{c}_sum = {c}_sum + excluded.{c}_sum,{c}_n = {c}_n + excluded.{c}_n"
+                       for c in srcs)
+    sub_set = ",".join(f"{c}_sum = {c}_sum - COALESCE(OLD.{c}, 0),"
+                       f"{c}_n = {c}_n - (OLD.{c} IS NOT NULL)" for c in srcs)
+    add = (f"INSERT INTO weekly_running(user_id, week_start, days_covered,{add_cols}) "
+           f"VALUES (NEW.user_id, {_WEEK_OF.format('NEW')}, 1,{add_vals}) "
+           f"ON CONFLICT(user_id, week_start) DO UPDATE SET "
+           f"days_covered = days_covered + 1,{add_set};")
+    old_key = f"user_id = OLD.user_id AND week_start = {_WEEK_OF.format('OLD')}"
+    sub = (f"UPDATE weekly_running SET days_covered = days_covered - 1,{sub_set} "
+           f"WHERE {old_key};")
+    prune = f"DELETE FROM weekly_running WHERE {old_key} AND days_covered <= 0;"
+    derived = ",\n       ".join(
+        f"COALESCE({src}_sum * 1.0 / NULLIF({src}_n, 0), 0) AS {name}" if how == "mean"
+        else f"{src}_sum AS {name}" for name, (src, how) in LIVE_METRICS.items())
+    return f"""
+CREATE TABLE IF NOT EXISTS weekly_running (
+    user_id         INTEGER NOT NULL,
+    week_start      DATE NOT NULL,
+    days_covered    INTEGER NOT NULL DEFAULT 0,
+{cols}    PRIMARY KEY (user_id, week_start)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS trg_events_running_ins AFTER INSERT ON events
+BEGIN
+    {add}
+END;
+CREATE TRIGGER IF NOT EXISTS trg_events_running_upd
+AFTER UPDATE OF user_id, date, {','.join(srcs)} ON events
+BEGIN
+    {sub}
+    {add}
+    {prune}
+END;
+CREATE TRIGGER IF NOT EXISTS trg_events_running_del AFTER DELETE ON events
+BEGIN
+    {sub}
+    {prune}
+END;
+CREATE VIEW IF NOT EXISTS weekly_live AS
+SELECT user_id, week_start, days_covered,
+       CASE WHEN days_covered >= 7 THEN 'final' ELSE 'provisional' END AS status,
+       {derived}
+FROM weekly_running;
+"""
+
+
+def _rebuild_running_sql() -> str:
+    srcs = [src for src, _ in LIVE_METRICS.values()]
+    return (f"DELETE FROM weekly_running;\n"
+            f"INSERT INTO weekly_running(user_id, week_start, days_covered,"
+            f"{','.join(f'{c}_sum,{c}_n' for c in srcs)}) "
+            f"SELECT user_id, {_WEEK_OF.format('events')}, COUNT(*),"
+            f"{','.join(f'COALESCE(SUM({c}), 0),COUNT({c})' for c in srcs)} "
+            f"FROM events GROUP BY 1, 2;\n")
+
+
+# 按日期而非用户的查询：水位线 MAX(created_at) / MAX(date)、全体用户按月范围扫描
+_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_events_created_at ON events(created_at);
+CREATE INDEX IF NOT EXISTS idx_events_date ON events(date);
+"""
+
+
+# 周报 LLM 响应缓存（agent/llm_cache.py）
+_LLM_CACHE_SQL = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key         TEXT PRIMARY KEY,
+    model       TEXT,
+    response    TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits        INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access);
+"""
+
+# 周报生成任务（agent/report_jobs.py）：状态 + 跨进程租约
+_REPORT_JOBS_SQL = """
+CREATE TABLE IF NOT EXISTS report_jobs (
+    user_id      INTEGER NOT NULL,
+    week_start   DATE NOT NULL,
+    status       TEXT NOT NULL CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    error        TEXT,
+    lease_owner  TEXT,
+    lease_until  TIMESTAMP,
+    created_at   TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at   TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, week_start)
+) WITHOUT ROWID;
+"""
+
+# 周报补生成的断点（agent/backfill.py）
+_BACKFILL_SQL = """
+CREATE TABLE IF NOT EXISTS report_backfill (
+    run_id      TEXT NOT NULL,
+    user_id     INTEGER NOT NULL,
+    week_start  DATE NOT NULL,
+    status      TEXT NOT NULL DEFAULT 'pending'
+                CHECK (status IN ('pending', 'done', 'failed')),
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    error       TEXT,
+    updated_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (run_id, user_id, week_start)
+);
+"""
+
+# 调度进程（scheduler/jobs.py）：任务排期 / 租约 + 心跳
+_SCHEDULER_SQL = """
+CREATE TABLE IF NOT EXISTS scheduler_jobs (
+    name             TEXT PRIMARY KEY,
+    trigger          TEXT NOT NULL,
+    next_run_at      TIMESTAMP NOT NULL,
+    last_started_at  TIMESTAMP,
+    last_finished_at TIMESTAMP,
+    last_status      TEXT,               -- running / ok / failed / missed
+    last_error       TEXT,
+    run_count        INTEGER NOT NULL DEFAULT 0,
+    lease_owner      TEXT,
+    lease_until      TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS scheduler_heartbeat (
+    id           INTEGER PRIMARY KEY CHECK (id = 1),
+    owner        TEXT,
+    beat_at      TIMESTAMP
+);
+"""
+
+# 列式快照（database/snapshot.py）：表 → 分区所依据的日期列；已导出分区清单 + 脏分区
+SNAPSHOT_TABLES = {"events": "date", "weekly_summary": "week_start"}
+
+_SNAPSHOT_SQL = """
+CREATE TABLE IF NOT EXISTS snapshot_manifest (
+    table_name  TEXT NOT NULL,
+    user_id     INTEGER NOT NULL,
+    month       TEXT NOT NULL,
+    rows        INTEGER NOT NULL,
+    path        TEXT NOT NULL,
+    written_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (table_name, user_id, month)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS snapshot_dirty (
+    table_name  TEXT NOT NULL,
+    user_id     INTEGER NOT NULL,
+    month       TEXT NOT NULL,
+    PRIMARY KEY (table_name, user_id, month)
+) WITHOUT ROWID;
+"""
+
+
+def _snapshot_triggers_sql() -> str:
+    """与 agg_dirty_weeks 同一思路：任何增 / 改 / 删都标记所在 (用户, 月) 分区。"""
+    out = []
+    for table, col in SNAPSHOT_TABLES.items():
+        for op, refs in (("INSERT", ("NEW",)), ("UPDATE", ("OLD", "NEW")),
+                         ("DELETE", ("OLD",))):
+            values = ", ".join(f"('{table}', {r}.user_id, strftime('%Y-%m', {r}.{col}))"
+                               for r in refs)
+            out.append(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_{table}_snap_{op.lower()[:3]} AFTER {op} ON {table}
+    BEGIN
+        INSERT INTO snapshot_dirty(table_name, user_id, month) VALUES {values}
+        ON CONFLICT DO NOTHING;
+    END;""")
+    return "".join(out)
+
+
+def _table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [r["name"] for r in conn.execute(f"PRAGMA table_info({table});")]
+
+
+def _migrate_single_user(conn: sqlite3.Connection) -> None:
+    """旧版单用户表（无 user_id）→ 多用户表，原数据归 DEFAULT_USER_ID。"""
+    conn.executescript("""
+    DROP TRIGGER IF EXISTS trg_events_dirty_ins;
+    DROP TRIGGER IF EXISTS trg_events_dirty_upd;
+    DROP TRIGGER IF EXISTS trg_events_dirty_del;
+    DROP TABLE IF EXISTS agg_watermark;
+    DROP TABLE IF EXISTS agg_dirty_weeks;
+    DROP TABLE IF EXISTS streak_state;
+    DROP TABLE IF EXISTS streak_month_fill;
+    ALTER TABLE events RENAME TO events_v0;
+    """)
+    for table in ("weekly_summary", "user_profile"):
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+                        (table,)).fetchone():
+            conn.execute(f"ALTER TABLE {table} RENAME TO {table}_v0;")
+
+
+def _copy_single_user(conn: sqlite3.Connection) -> None:
+    legacy = {r["name"] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE '%_v0';")}
+    for table in ("events", "weekly_summary", "user_profile"):
+        old = f"{table}_v0"
+        if old not in legacy:
+            continue
+        cols = [c for c in _table_columns(conn, old) if c != "id"]
+        col_sql = ",".join(cols)
+        conn.execute(f"INSERT INTO {table} (user_id,{col_sql}) "
+                     f"SELECT {DEFAULT_USER_ID},{col_sql} FROM {old};")
+        conn.execute(f"DROP TABLE {old};")
+
+
+# ─────────────────────── 迁移 ───────────────────────
+def _m1_base(conn: sqlite3.Connection) -> None:
+    """多用户基础表；发现旧版单用户表则迁移到多用户分区表。"""
+    legacy = "events" in {r["name"] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table';")} \
+        and "user_id" not in _table_columns(conn, "events")
+    if legacy:
+        _migrate_single_user(conn)
+    conn.execute(_EVENTS_SQL)
+    conn.execute(_WEEKLY_SQL)
+    conn.execute(_PROFILE_SQL)
+    if legacy:
+        _copy_single_user(conn)
+    conn.executescript(_AGG_STATE_SQL)
+    conn.executescript(_STREAK_SQL)
+
+
+def _m2_trend_columns(conn: sqlite3.Connection) -> None:
+    weekly_cols = _table_columns(conn, "weekly_summary")
+    for col in TREND_COLS:
+        if col not in weekly_cols:
+            conn.execute(f"ALTER TABLE weekly_summary ADD COLUMN {col} REAL;")
+
+
+def _m3_user_versions(conn: sqlite3.Connection) -> None:
+    # 汇总表到 v5 才建，它们的版本触发器随 v5 一起建
+    conn.executescript(CREATE_VERSION_SQL + version_triggers_sql(
+        ("events", "weekly_summary", "user_profile")))
+
+
+def _m4_indexes(conn: sqlite3.Connection) -> None:
+    conn.executescript(_INDEX_SQL)
+
+
+def _m5_rollups(conn: sqlite3.Connection) -> None:
+    """月 / 季汇总表；已有事件全部标脏，下次增量聚合时补算历史。"""
+    for table, _ in ROLLUPS.values():
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({_ROLLUP_COLS}) WITHOUT ROWID;")
+    conn.executescript(_ROLLUP_STATE_SQL + version_triggers_sql(
+        [t for t, _ in ROLLUPS.values()]))
+
+
+def _m6_live_weeks(conn: sqlite3.Connection) -> None:
+    """进行中周的实时汇总；已有事件一次性重算进 weekly_running。"""
+    conn.executescript(_running_sql() + _rebuild_running_sql())
+
+
+def _m7_llm_cache(conn: sqlite3.Connection) -> None:
+    conn.executescript(_LLM_CACHE_SQL)
+
+
+def _m8_report_jobs(conn: sqlite3.Connection) -> None:
+    conn.executescript(_REPORT_JOBS_SQL)
+
+
+def _m9_report_backfill(conn: sqlite3.Connection) -> None:
+    conn.executescript(_BACKFILL_SQL)
+
+
+def _m10_scheduler(conn: sqlite3.Connection) -> None:
+    conn.executescript(_SCHEDULER_SQL)
+
+
+def _m11_snapshots(conn: sqlite3.Connection) -> None:
+    """快照清单与脏分区标记；清单为空时首次导出按全量处理，此前的标记不影响结果。"""
+    conn.executescript(_SNAPSHOT_SQL + _snapshot_triggers_sql())
+
+
+def _m12_events_versions(conn: sqlite3.Connection) -> None:
+    """只随 events 变化的用户版本；已有数据的用户记为 1，各进程的日粒度数组 / DuckDB 镜像据此重载一次。"""
+    conn.executescript(
+        CREATE_EVENTS_VERSION_SQL
+        + version_triggers_sql(("events",), "user_events_version", "evver")
+        + "INSERT OR IGNORE INTO user_events_version (user_id, version) "
+          "SELECT DISTINCT user_id, 1 FROM events;")
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "multi-user base tables", _m1_base),
+    (2, "weekly trend columns", _m2_trend_columns),
+    (3, "per-user data version counters", _m3_user_versions),
+    (4, "date indexes on events", _m4_indexes),
+    (5, "monthly / quarterly rollups", _m5_rollups),
+    (6, "live running aggregates for partial weeks", _m6_live_weeks),
+    # 以下各表原先由各模块首次使用时自行建表，已存在的库上 IF NOT EXISTS 直接跳过
+    (7, "llm response cache", _m7_llm_cache),
+    (8, "report generation jobs", _m8_report_jobs),
+    (9, "report backfill checkpoints", _m9_report_backfill),
+    (10, "scheduler jobs and heartbeat", _m10_scheduler),
+    (11, "snapshot manifest and dirty partitions", _m11_snapshots),
+    (12, "events-only per-user version counters", _m12_events_versions),
+]
+LATEST = MIGRATIONS[-1][0]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> List[Tuple[int, str]]:
+    """把库升级到 LATEST，返回本次应用的 [(版本, 说明), ...]。逐个提交：中途失败时已完成的版本保留。"""
+    current = schema_version(conn)
+    if current >= LATEST:
+        return []
+    applied = []
+    for version, desc, fn in MIGRATIONS:
+        if version <= current:
+            continue
+        fn(conn)
+        conn.execute(f"PRAGMA user_version = {version};")
+        conn.commit()
+        applied.append((version, desc))
+    return applied
+
+
+if __name__ == "__main__":
+    """python -m database.migrations    # 显示当前版本并升级到最新"""
+    from database.db_adapter import DB_PATH
+    with sqlite3.connect(DB_PATH) as c:
+        c.row_factory = sqlite3.Row
+        before = schema_version(c)
+        for version, desc in migrate(c):
+            print(f"schema migrated to v{version}: {desc}")
+        print(f"{DB_PATH}: schema v{schema_version(c)} (was v{before}, latest v{LATEST})")
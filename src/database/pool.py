@@ -0,0 +1,153 @@
+from __future__ import annotations
+import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional
+
+from telemetry import instrument
+
+# 连接级 PRAGMA：每条连接建立时只执行一次
+MMAP_SIZE       = 256 * 1024 * 1024      # 256 MB 内存映射读
+CACHE_SIZE_KB   = 16 * 1024              # 16 MB page cache（负数=KB）
+BUSY_TIMEOUT_MS = 5000                   # 写锁等待上限
+SYNCHRONOUS     = "NORMAL"               # WAL 模式下 NORMAL 已足够安全
+
+
+class ConnectionPool:
+    """线程感知的 SQLite 连接池：每个线程一条只读连接 + 全局唯一写连接。
+
+    - 读连接存放在 threading.local 中，Streamlit 每个会话线程各自复用；线程结束时自动关闭并注销
+      （Streamlit 每次 rerun 都换新线程，不回收会每次 rerun 泄漏一条连接 / 文件句柄）；
+    - 写连接全进程共享，由 RLock 串行化，避免多条连接争抢 SQLite 写锁；
+    - WAL 下读写互不阻塞，读连接总能看到最近一次已提交的数据。
+    """
+
+    def __init__(self, db_path: Path | str,
+                 on_connect: Optional[Callable[[sqlite3.Connection], object]] = None):
+        self.db_path = Path(db_path)
+        self.on_connect = on_connect     # 写连接建立后调用一次（库结构迁移），早于任何读连接
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._writer_owner: Optional[int] = None
+        self._writer_depth = 0
+        self.commits = 0                 # 本进程写连接提交次数，供读缓存判断失效
+        self._tx_hooks: List[Callable[[bool], None]] = []
+        self._readers: List[sqlite3.Connection] = []
+        self._registry_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    def _connect(self, readonly: bool) -> sqlite3.Connection:
+        # 埋点开启时换成按语句计时的连接类；关闭时零额外开销
+        factory = instrument.TimedConnection if instrument.ENABLED else sqlite3.Connection
+        conn = sqlite3.connect(self.db_path, detect_types=sqlite3.PARSE_DECLTYPES,
+                               check_same_thread=False,
+                               timeout=BUSY_TIMEOUT_MS / 1000, factory=factory)
+        conn.row_factory = sqlite3.Row
+        if not readonly:
+            # journal_mode 持久化在库文件里，只需写连接设置一次
+            conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS};")
+        conn.execute(f"PRAGMA synchronous={SYNCHRONOUS};")
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE};")
+        conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB};")
+        if readonly:
+            conn.execute("PRAGMA query_only=ON;")
+        return conn
+
+    def _get_writer(self) -> sqlite3.Connection:
+        if self._writer is None:
+            conn = self._connect(readonly=False)
+            if self.on_connect is not None:
+                self.on_connect(conn)
+            self._writer = conn
+        return self._writer
+
+    def _get_reader(self) -> sqlite3.Connection:
+        holder = getattr(self._local, "reader", None)
+        if holder is None:
+            # 先确保写连接把库切到 WAL，再建读连接
+            with self._write_lock:
+                self._get_writer()
+            conn = self._connect(readonly=True)
+            holder = self._local.reader = _ReaderHolder(conn)
+            with self._registry_lock:
+                self._readers.append(conn)
+            # 线程结束时 threading.local 释放 holder，随即关闭并注销这条连接
+            weakref.finalize(holder, self._drop_reader, conn)
+        return holder.conn
+
+    def _drop_reader(self, conn: sqlite3.Connection) -> None:
+        with self._registry_lock:
+            try:
+                self._readers.remove(conn)
+            except ValueError:           # close_all 已经关闭并清空
+                return
+        conn.close()
+
+    def reader_count(self) -> int:
+        with self._registry_lock:
+            return len(self._readers)
+
+    # ------------------------------------------------------------------
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """当前线程的只读连接；持有写锁的线程直接复用写连接以读到未提交数据。"""
+        if self._writer_owner == threading.get_ident():
+            yield self._writer
+            return
+        yield self._get_reader()
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """独占写连接；最外层退出时提交，异常时回滚。可在同一线程内嵌套。"""
+        with self._write_lock:
+            conn = self._get_writer()
+            self._writer_owner = threading.get_ident()
+            self._writer_depth += 1
+            committed = False
+            try:
+                yield conn
+            except BaseException:
+                if self._writer_depth == 1:
+                    conn.rollback()
+                raise
+            else:
+                if self._writer_depth == 1:
+                    conn.commit()
+                    self.commits += 1
+                    committed = True
+            finally:
+                self._writer_depth -= 1
+                if self._writer_depth == 0:
+                    self._writer_owner = None
+                    hooks, self._tx_hooks = self._tx_hooks, []
+                    for fn in hooks:
+                        fn(committed)
+
+    def on_tx_end(self, fn: Callable[[bool], None]) -> None:
+        """在当前写事务结束时调用 fn(是否已提交)；须在持有写连接的线程里调用，同一 fn 只登记一次。"""
+        if fn not in self._tx_hooks:
+            self._tx_hooks.append(fn)
+
+    def close_all(self) -> None:
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        with self._registry_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        self._local = threading.local()
+
+
+class _ReaderHolder:
+    """每线程一个，仅作 weakref.finalize 的挂载点（sqlite3.Connection 不支持弱引用）。"""
+
+    __slots__ = ("conn", "__weakref__")
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
@@ -0,0 +1,181 @@
+from __future__ import annotations
+import copy, functools, inspect, sys, threading, time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from database.pool import ConnectionPool
+
+# 仪表盘读缓存：进程级（跨 Streamlit 会话共享），两级失效信号
+#   1. PRAGMA data_version —— 任何连接（含其他进程）提交后都会变，一次查询判断"库是否动过"
+#   2. user_data_version 表 —— 触发器按用户累加，库动过时再查一次，只失效该用户的条目
+# 另有只随 events 变化的 user_events_version：日粒度数组与 DuckDB 镜像只镜像 events，
+# 周汇总 / 档案 / 周报写回不应让它们整用户重载
+
+PROBE_INTERVAL_SEC = 0.5         # 外部进程写入最多延迟这么久可见；本进程写入立即可见
+MAX_ENTRIES        = 1024
+
+CREATE_VERSION_SQL = """
+CREATE TABLE IF NOT EXISTS user_data_version (
+    user_id     INTEGER PRIMARY KEY,
+    version     INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+CREATE_EVENTS_VERSION_SQL = """
+CREATE TABLE IF NOT EXISTS user_events_version (
+    user_id     INTEGER PRIMARY KEY,
+    version     INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# 会影响仪表盘读结果的表；连击状态表、weekly_running 总与 events 同事务更新，无需单独计数
+VERSIONED_TABLES = ("events", "weekly_summary", "user_profile",
+                    "monthly_summary", "quarterly_summary")
+
+
+def version_triggers_sql(tables: Sequence[str] = VERSIONED_TABLES,
+                         counter: str = "user_data_version", tag: str = "ver") -> str:
+    out = []
+    for table in tables:
+        for op, ref in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            out.append(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_{table}_{tag}_{op.lower()[:3]} AFTER {op} ON {table}
+    BEGIN
+        INSERT INTO {counter}(user_id, version) VALUES ({ref}.user_id, 1)
+        ON CONFLICT(user_id) DO UPDATE SET version = version + 1;
+    END;""")
+    return "".join(out)
+
+
+class ReadCache:
+    """按 (函数, 参数) 缓存读结果，条目记录写入时的全局 / 用户版本。"""
+
+    def __init__(self, pool: ConnectionPool, max_entries: int = MAX_ENTRIES,
+                 probe_interval: float = PROBE_INTERVAL_SEC, enabled: bool = True):
+        self.pool = pool
+        self.max_entries = max_entries
+        self.probe_interval = probe_interval
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, Tuple[tuple, int, Any]]" = OrderedDict()
+        self._user_seen: Dict[int, Tuple[tuple, int]] = {}      # user -> (全局 token, 用户版本)
+        self._events_seen: Dict[int, Tuple[tuple, int]] = {}    # user -> (全局 token, events 版本)
+        self._probe_conn = None
+        self._probe_at = 0.0
+        self._probe_commits = -1
+        self._data_version = 0
+        self.stats = {"hits": 0, "misses": 0, "probes": 0, "user_checks": 0}
+
+    # ------------------------------------------------------------------
+    def _global_token(self) -> tuple:
+        """(本进程提交计数, data_version)；本进程无新提交时按间隔节流探测。"""
+        now = time.monotonic()
+        commits = self.pool.commits
+        if commits != self._probe_commits or now - self._probe_at >= self.probe_interval:
+            if self._probe_conn is None:
+                # 专用连接：data_version 只对"其他连接"的提交变化，它自己从不写
+                self._probe_conn = self.pool._connect(readonly=True)
+            self._data_version = self._probe_conn.execute(
+                "PRAGMA data_version;").fetchone()[0]
+            self._probe_commits, self._probe_at = commits, now
+            self.stats["probes"] += 1
+        return commits, self._data_version
+
+    def _user_version(self, user_id: int, token: tuple) -> int:
+        seen = self._user_seen.get(user_id)
+        if seen and seen[0] == token:
+            return seen[1]
+        with self.pool.reader() as conn:
+            version = read_user_version(conn, user_id)
+        self._user_seen[user_id] = (token, version)
+        self.stats["user_checks"] += 1
+        return version
+
+    def events_version(self, user_id: int) -> int:
+        """当前可见的用户 events 版本（与缓存条目同一套节流探测），供日粒度数组判断是否需要重新加载。"""
+        with self._lock:
+            token = self._global_token()
+            seen = self._events_seen.get(user_id)
+            if seen and seen[0] == token:
+                return seen[1]
+            with self.pool.reader() as conn:
+                version = read_events_version(conn, user_id)
+            self._events_seen[user_id] = (token, version)
+            return version
+
+    def get(self, key: tuple, user_id: int, load: Callable[[], Any]) -> Any:
+        if not self.enabled or self.pool._writer_owner == threading.get_ident():
+            return load()                   # 写事务内可能读到未提交数据，不入缓存
+        with self._lock:
+            token = self._global_token()
+            entry = self._entries.get(key)
+            if entry and entry[0] == token:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return _copy(entry[2])
+            # 版本先于数据读取：中间若有写入，下次必然判为过期，不会把旧数据当新数据
+            uver = self._user_version(user_id, token)
+            if entry and entry[1] == uver:
+                self._entries[key] = (token, uver, entry[2])
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return _copy(entry[2])
+            self.stats["misses"] += 1
+
+        value = load()
+        with self._lock:
+            self._entries[key] = (token, uver, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return _copy(value)
+
+    def cached(self, fn: Callable) -> Callable:
+        """装饰器：被装饰函数须有 user_id 参数，其余参数需可哈希。"""
+        sig = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (fn.__qualname__,) + tuple(bound.arguments.items())
+            return self.get(key, bound.arguments["user_id"], lambda: fn(*args, **kwargs))
+
+        wrapper.uncached = fn
+        return wrapper
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._user_seen.clear()
+            self._events_seen.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.stats["hits"] + self.stats["misses"]
+            return {**self.stats, "entries": len(self._entries),
+                    "hit_rate": self.stats["hits"] / total if total else 0.0}
+
+
+def read_user_version(conn, user_id: int) -> int:
+    """用给定连接读取用户版本（写事务内看得到本事务的改动）。"""
+    row = conn.execute("SELECT version FROM user_data_version WHERE user_id = ?;",
+                       (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def read_events_version(conn, user_id: int) -> int:
+    """同上，只随该用户 events 变化的版本。"""
+    row = conn.execute("SELECT version FROM user_events_version WHERE user_id = ?;",
+                       (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def _copy(value: Any) -> Any:
+    """返回副本，调用方原地修改不会污染缓存。"""
+    pd = sys.modules.get("pandas")             # 缓存里有 DataFrame 时 pandas 必已导入；不为此提前加载
+    if pd is not None and isinstance(value, pd.DataFrame):
+        return value.copy()
+    if isinstance(value, (dict, list)):
+        return copy.copy(value)
+    return value
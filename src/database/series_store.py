@@ -0,0 +1,306 @@
+from __future__ import annotations
+import datetime as dt, threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from database.ingest import _RANGES
+from database.pool import ConnectionPool
+from database.read_cache import ReadCache
+
+# 日粒度指标的进程内列式存储：每个用户每个指标一条按"距起始日天数"索引的定长数组，
+# 另配一张有效位图标记缺失日。仪表盘取任意一周 / 区间是数组切片，不再经 SQL → DataFrame。
+#   - insert_event 提交后原地更新对应的一格；需要扩容时复制到新对象再换引用，读者手里的旧对象不变
+#   - 其他写入（批量导入、外部进程）通过 user_events_version 发现，整用户重新加载；
+#     汇总 / 档案等其他表的写入不影响它
+
+# 指标 → 存储类型：取能容纳 ingest._RANGES 上限的最小类型
+METRICS: Dict[str, np.dtype] = {
+    "sleep_hours":      np.dtype(np.float32),
+    "screen_hours":     np.dtype(np.float32),
+    "steps":            np.dtype(np.int32),
+    "water_ml":         np.dtype(np.int16),
+    "exercise_minutes": np.dtype(np.int16),
+    "veggie_servings":  np.dtype(np.int8),
+    "high_fat_meals":   np.dtype(np.int8),
+    "mood_score":       np.dtype(np.int8),
+    "alcohol":          np.dtype(np.int8),
+    "caffeine":         np.dtype(np.int8),
+}
+
+# 每个整数列都须有入库范围且装得下，否则越界值会在数组里回绕，图表与库中数据对不上
+for _m, _t in METRICS.items():
+    if _t.kind == "i":
+        assert _m in _RANGES and np.iinfo(_t).min <= _RANGES[_m][0] \
+            and _RANGES[_m][1] <= np.iinfo(_t).max, f"{_m}: {_t} cannot hold ingest range"
+
+CHUNK_DAYS = 64                  # 容量按 64 天对齐，位图按字节整除
+
+
+def _as_day(v: Any) -> dt.date:
+    if isinstance(v, dt.datetime):
+        return v.date()
+    if isinstance(v, dt.date):
+        return v
+    return dt.date.fromisoformat(str(v)[:10])
+
+
+def _round_up(n: int) -> int:
+    return -(-n // CHUNK_DAYS) * CHUNK_DAYS
+
+
+class UserSeries:
+    """单个用户的日粒度数组；end 一律为开区间。"""
+
+    __slots__ = ("origin", "capacity", "version", "_values", "_valid")
+
+    def __init__(self, origin: dt.date, capacity: int = CHUNK_DAYS, version: int = 0):
+        self.origin = origin
+        self.capacity = _round_up(max(capacity, 1))
+        self.version = version
+        self._values = {m: np.zeros(self.capacity, dtype=t) for m, t in METRICS.items()}
+        self._valid = {m: np.zeros(self.capacity // 8, dtype=np.uint8) for m in METRICS}
+
+    # ---------------------------- 容量 ----------------------------
+    def _grown(self, lo: dt.date, hi: dt.date) -> "UserSeries":
+        """[lo, hi] 落在数组内时返回自身，否则返回复制了全部数据的更大的新对象（自身不动）。
+
+        向前扩展按 56 天（整周且整字节）右移，起始日仍是周一。"""
+        shift = -(-(self.origin - lo).days // 56) * 56 if lo < self.origin else 0
+        need = shift + max((hi - self.origin).days + 1, self.capacity)
+        if need <= self.capacity:
+            return self
+        cap = _round_up(max(need, self.capacity + (self.capacity >> 1)))
+        s = UserSeries(self.origin - dt.timedelta(days=shift), cap, self.version)
+        for m in METRICS:
+            s._values[m][shift:shift + self.capacity] = self._values[m]
+            s._valid[m][shift // 8:(shift + self.capacity) // 8] = self._valid[m]
+        return s
+
+    # ---------------------------- 写入 ----------------------------
+    def set_day(self, day: dt.date, values: Dict[str, Any]) -> "UserSeries":
+        """写入一天的若干指标；值为 None 时清掉有效位。未出现的指标保持原值。
+
+        放得下时原地写一格并返回自身；放不下时写进扩容后的新对象并返回它，由调用方换引用——
+        其他线程正在读的旧对象不会被改动，不会看到起始日 / 数组不一致的中间状态。"""
+        day = _as_day(day)
+        s = self._grown(day, day)
+        i = (day - s.origin).days
+        byte, bit = i >> 3, np.uint8(1 << (i & 7))
+        for m, v in values.items():
+            if m not in METRICS:
+                continue
+            if v is None:
+                s._valid[m][byte] &= ~bit
+            else:
+                s._values[m][i] = v             # 先写值再置有效位：读者不会读到未写入的值
+                s._valid[m][byte] |= bit
+        return s
+
+    def _load_column(self, m: str, offsets: np.ndarray, col: List[Any]) -> None:
+        raw = np.array(col, dtype=object)
+        ok = raw != None                                    # noqa: E711 —— 逐元素比较
+        idx = offsets[ok]
+        self._values[m][idx] = raw[ok].astype(np.float64).round() \
+            if self._values[m].dtype.kind == "i" else raw[ok].astype(np.float64)
+        bits = np.zeros(self.capacity, dtype=bool)
+        bits[idx] = True
+        self._valid[m] = np.packbits(bits, bitorder="little")
+
+    # ---------------------------- 读取 ----------------------------
+    def _bounds(self, start: dt.date, end: dt.date) -> Tuple[int, int]:
+        return (_as_day(start) - self.origin).days, (_as_day(end) - self.origin).days
+
+    def _mask(self, m: str, lo: int, hi: int) -> np.ndarray:
+        bm = self._valid[m][lo >> 3:(hi + 7) >> 3]
+        return np.unpackbits(bm, bitorder="little")[lo & 7:(lo & 7) + hi - lo].view(bool)
+
+    def slice(self, metric: str, start: dt.date, end: dt.date) -> Tuple[np.ndarray, np.ndarray]:
+        """(值, 有效掩码)。区间完全落在数组内时值为视图，不复制；越界部分补 0 且掩码为 False。"""
+        lo, hi = self._bounds(start, end)
+        n = max(hi - lo, 0)
+        if 0 <= lo and hi <= self.capacity:
+            return self._values[metric][lo:hi], self._mask(metric, lo, hi)
+        vals = np.zeros(n, dtype=METRICS[metric])
+        mask = np.zeros(n, dtype=bool)
+        a, b = max(lo, 0), min(hi, self.capacity)
+        if a < b:
+            vals[a - lo:b - lo] = self._values[metric][a:b]
+            mask[a - lo:b - lo] = self._mask(metric, a, b)
+        return vals, mask
+
+    def week(self, metric: str, week_start: dt.date) -> Tuple[np.ndarray, np.ndarray]:
+        return self.slice(metric, week_start, _as_day(week_start) + dt.timedelta(days=7))
+
+    def masked(self, metric: str, start: dt.date, end: dt.date) -> np.ndarray:
+        """float64 副本，缺失日为 NaN，便于直接交给图表 / nan* 归约。"""
+        vals, mask = self.slice(metric, start, end)
+        return np.where(mask, vals, np.nan)
+
+    # ---------------------------- 归约 ----------------------------
+    def count(self, metric: str, start: dt.date, end: dt.date) -> int:
+        return int(self.slice(metric, start, end)[1].sum())
+
+    def total(self, metric: str, start: dt.date, end: dt.date) -> float:
+        vals, mask = self.slice(metric, start, end)
+        return float(vals.sum(where=mask, dtype=np.float64))
+
+    def mean(self, metric: str, start: dt.date, end: dt.date) -> Optional[float]:
+        vals, mask = self.slice(metric, start, end)
+        n = int(mask.sum())
+        return float(vals.sum(where=mask, dtype=np.float64)) / n if n else None
+
+    def weekly(self, metric: str, first_week: dt.date, n_weeks: int,
+               how: str = "mean") -> np.ndarray:
+        """连续 n_weeks 周的逐周归约（mean / sum / count），缺整周的 mean 为 NaN。"""
+        end = _as_day(first_week) + dt.timedelta(weeks=n_weeks)
+        vals, mask = self.slice(metric, first_week, end)
+        vals, mask = vals.reshape(n_weeks, 7), mask.reshape(n_weeks, 7)
+        cnt = mask.sum(axis=1)
+        if how == "count":
+            return cnt
+        tot = vals.sum(axis=1, where=mask, dtype=np.float64)
+        if how == "sum":
+            return tot
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(cnt > 0, tot / cnt, np.nan)
+
+    def frame(self, start: dt.date, end: dt.date,
+              metrics: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """区间内至少一个指标有值的日子 → 小 DataFrame（date + 各指标，缺失为 NaN），供图表用。"""
+        metrics = list(metrics or METRICS)
+        start = _as_day(start)
+        cols = {m: self.masked(m, start, end) for m in metrics}
+        keep = ~np.isnan(np.vstack(list(cols.values()))).all(axis=0)
+        dates = np.datetime64(start, "D") + np.arange(len(keep))
+        return pd.DataFrame({"date": dates[keep].astype("datetime64[ns]"),
+                             **{m: v[keep] for m, v in cols.items()}})
+
+    def points(self, metric: str, start: dt.date, end: dt.date,
+               max_points: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """区间内有值的日子 (日期 datetime64[D], float64 值)；超过 max_points 时按 LTTB 降采样。"""
+        start = _as_day(start)
+        vals, mask = self.slice(metric, start, end)
+        idx = np.flatnonzero(mask)
+        y = vals[idx].astype(np.float64)
+        if max_points is not None and len(idx) > max_points:
+            keep = lttb(idx, y, max_points)
+            idx, y = idx[keep], y[keep]
+        return np.datetime64(start, "D") + idx, y
+
+    def bounds(self) -> Optional[Tuple[dt.date, dt.date]]:
+        """任一指标有值的最早 / 最晚日期；没有数据时为 None。"""
+        bits = np.bitwise_or.reduce(np.vstack(list(self._valid.values())), axis=0)
+        days = np.flatnonzero(np.unpackbits(bits, bitorder="little"))
+        if not len(days):
+            return None
+        return (self.origin + dt.timedelta(days=int(days[0])),
+                self.origin + dt.timedelta(days=int(days[-1])))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self._values.values()) + \
+            sum(b.nbytes for b in self._valid.values())
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets：从 (x, y) 中选 n_out 个点的下标，保留峰谷形状。
+
+    首尾点必选；中间按 x 的顺序等分成 n_out - 2 个桶，每桶选与"上一个已选点、
+    下一桶均值点"围成三角形面积最大的点。x 须升序。"""
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1])
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)     # 中间 n_out - 2 个桶的边界
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+
+_LOAD_SQL = (f"SELECT date, {','.join(METRICS)} FROM events WHERE user_id = ? "
+             "ORDER BY date;")
+
+
+class SeriesStore:
+    """进程级、按用户懒加载；用 ReadCache 的版本信号判断是否需要重新加载。"""
+
+    def __init__(self, pool: ConnectionPool, cache: ReadCache):
+        self.pool = pool
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._users: Dict[int, UserSeries] = {}
+        self.stats = {"hits": 0, "loads": 0, "applied": 0}
+
+    def _load(self, user_id: int, version: int) -> UserSeries:
+        with self.pool.reader() as conn:
+            rows = conn.execute(_LOAD_SQL, (user_id,)).fetchall()
+        if not rows:
+            return UserSeries(dt.date.today() - dt.timedelta(days=dt.date.today().weekday()),
+                              version=version)
+        days = [_as_day(r[0]) for r in rows]
+        # 起始日对齐到周一：整周切片的偏移都是 7 的倍数
+        origin = days[0] - dt.timedelta(days=days[0].weekday())
+        s = UserSeries(origin, (days[-1] - origin).days + 1, version)
+        offsets = np.fromiter(((d - origin).days for d in days), dtype=np.int64,
+                              count=len(days))
+        for j, m in enumerate(METRICS, start=1):
+            s._load_column(m, offsets, [r[j] for r in rows])
+        return s
+
+    def get(self, user_id: int) -> UserSeries:
+        if self.pool._writer_owner == threading.get_ident():
+            return self._load(user_id, -1)        # 写事务内的读取不入库
+        with self._lock:
+            version = self.cache.events_version(user_id)
+            s = self._users.get(user_id)
+            if s is not None and s.version == version:
+                self.stats["hits"] += 1
+                return s
+            # 与 ReadCache 相同：先取版本再读数据，期间有写入时下次必然重新加载
+            s = self._users[user_id] = self._load(user_id, version)
+            self.stats["loads"] += 1
+            return s
+
+    def apply(self, user_id: int, day: dt.date, values: Dict[str, Any],
+              before: int, after: int) -> None:
+        """insert_event 提交后调用：内存中的版本正好是写入前版本时原地更新，否则留待重新加载。
+        扩容时换成新对象，已经 get() 到旧对象的读者继续读旧数据，下次 get() 拿到新的。"""
+        with self._lock:
+            s = self._users.get(user_id)
+            if s is None or s.version != before:
+                return
+            s = self._users[user_id] = s.set_day(
+                day, {m: _coerce(m, v) for m, v in values.items() if m in METRICS})
+            s.version = after
+            self.stats["applied"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._users.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "users": len(self._users),
+                    "bytes": sum(s.nbytes for s in self._users.values())}
+
+
+def _coerce(metric: str, v: Any) -> Any:
+    if v is None or v == "":
+        return None
+    if METRICS[metric].kind == "f":
+        return float(v)
+    return int(round(float(v))) if not isinstance(v, bool) else int(v)
+
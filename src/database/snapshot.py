@@ -0,0 +1,228 @@
+"""列式快照：events / weekly_summary 按 (用户, 月) 分区导出为 Arrow IPC / Parquet，
+增量只重写有变化的分区；读取端内存映射 + 列投影，长周期分析不经 SQLite 逐行转对象。
+
+    python -m database.snapshot export [--format arrow|parquet] [--full]
+    python -m database.snapshot read events --user 1 --columns date,steps --start 2023-01-01
+
+目录布局：{HC_SNAPSHOT_DIR}/{table}/user_id={uid}/month=YYYY-MM/part.{arrow|parquet}
+"""
+from __future__ import annotations
+import datetime as dt, os, threading, time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from database.db_adapter import DATA_DIR, read_conn, write_conn, _table_columns
+from database.migrations import SNAPSHOT_TABLES
+
+SNAPSHOT_DIR = Path(os.getenv("HC_SNAPSHOT_DIR", DATA_DIR / "snapshots"))
+
+# 表 → 分区所依据的日期列；清单表 / 脏分区触发器见 database/migrations.py
+TABLES = SNAPSHOT_TABLES
+FORMATS = {"arrow": ".arrow", "parquet": ".parquet"}
+
+Partition = Tuple[int, str]            # (user_id, "YYYY-MM")
+
+_EXPORT_LOCK = threading.Lock()        # 同进程内的导出串行：文件写在事务外，避免旧数据覆盖新数据
+
+def _pa():
+    try:
+        import pyarrow as pa
+    except ImportError as e:                # 可选依赖
+        raise RuntimeError("列式快照需要安装 pyarrow：pip install pyarrow") from e
+    return pa
+
+
+_ARROW_TYPES = {"INTEGER": "int64", "REAL": "float64", "TEXT": "string",
+                "DATE": "date32", "TIMESTAMP": "timestamp"}
+
+
+def _schema(table: str):
+    """按 SQLite 声明类型推导 Arrow schema。"""
+    pa = _pa()
+    with read_conn() as c:
+        info = c.execute(f"PRAGMA table_info({table});").fetchall()
+    fields = []
+    for r in info:
+        t = _ARROW_TYPES.get((r["type"] or "TEXT").upper(), "string")
+        typ = pa.timestamp("us") if t == "timestamp" else getattr(pa, t)()
+        fields.append(pa.field(r["name"], typ))
+    return pa.schema(fields)
+
+
+def _partition_path(root: Path, table: str, part: Partition, fmt: str) -> Path:
+    uid, month = part
+    return root / table / f"user_id={uid}" / f"month={month}" / f"part{FORMATS[fmt]}"
+
+
+def _write_partition(path: Path, table_pa, fmt: str) -> None:
+    pa = _pa()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    if fmt == "arrow":
+        # 不压缩的 IPC 文件才能零拷贝内存映射
+        with pa.OSFile(str(tmp), "wb") as sink, \
+                pa.ipc.new_file(sink, table_pa.schema) as writer:
+            writer.write_table(table_pa)
+    else:
+        import pyarrow.parquet as pq
+        pq.write_table(table_pa, tmp, compression="zstd")
+    os.replace(tmp, path)
+    for suffix in FORMATS.values():          # 换格式导出时清掉同分区的旧文件，避免读到重复行
+        if suffix != path.suffix:
+            path.with_suffix(suffix).unlink(missing_ok=True)
+
+
+def _pending_partitions(conn, table: str, full: bool) -> List[Partition]:
+    col = TABLES[table]
+    if full or not conn.execute("SELECT 1 FROM snapshot_manifest WHERE table_name = ? "
+                                "LIMIT 1;", (table,)).fetchone():
+        sql = (f"SELECT DISTINCT user_id, strftime('%Y-%m', {col}) AS month FROM {table} "
+               "UNION SELECT user_id, month FROM snapshot_manifest WHERE table_name = ?")
+    else:
+        sql = "SELECT user_id, month FROM snapshot_dirty WHERE table_name = ?"
+    return [(r["user_id"], r["month"]) for r in conn.execute(sql + ";", (table,))]
+
+
+def export_snapshots(root: Path | str = SNAPSHOT_DIR, fmt: str = "arrow",
+                     full: bool = False) -> Dict[str, int]:
+    """增量导出：只重写有变化（或从未导出）的分区，返回 {表: 重写分区数}。"""
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown snapshot format: {fmt}")
+    with _EXPORT_LOCK:
+        return _export(Path(root), fmt, full)
+
+
+def _export(root: Path, fmt: str, full: bool) -> Dict[str, int]:
+    pa = _pa()
+    written: Dict[str, int] = {}
+
+    for table, col in TABLES.items():
+        schema = _schema(table)
+        cols = _table_columns_ro(table)
+        with read_conn() as conn:
+            parts = _pending_partitions(conn, table, full)
+
+        n = 0
+        for part in parts:
+            uid, month = part
+            first = dt.date.fromisoformat(f"{month}-01")
+            nxt = (first + dt.timedelta(days=32)).replace(day=1)
+            path = _partition_path(root, table, part, fmt)
+            with write_conn() as conn:
+                # 同一写事务内清脏标记并读取分区：之后的新改动会重新打标，下次导出补上。
+                # 事务里只做这两步，建 Arrow 表与写文件都在写锁之外，不挡打卡 / 写队列 / 聚合
+                conn.execute("DELETE FROM snapshot_dirty WHERE table_name = ? "
+                             "AND user_id = ? AND month = ?;", (table, uid, month))
+                rows = conn.execute(
+                    f"SELECT {','.join(cols)} FROM {table} "
+                    f"WHERE user_id = ? AND {col} >= ? AND {col} < ? ORDER BY {col};",
+                    (uid, first, nxt)).fetchall()
+            try:
+                if rows:
+                    data = pa.Table.from_pydict(
+                        {c: [r[i] for r in rows] for i, c in enumerate(cols)}, schema=schema)
+                    _write_partition(path, data, fmt)
+                else:
+                    path.unlink(missing_ok=True)
+            except BaseException:
+                _mark_dirty(table, part)         # 文件没写成：恢复脏标记，下次导出重试
+                raise
+            with write_conn() as conn:
+                if rows:
+                    conn.execute(
+                        "INSERT INTO snapshot_manifest (table_name, user_id, month, rows, path) "
+                        "VALUES (?, ?, ?, ?, ?) ON CONFLICT(table_name, user_id, month) DO "
+                        "UPDATE SET rows=excluded.rows, path=excluded.path, "
+                        "written_at=CURRENT_TIMESTAMP;",
+                        (table, uid, month, len(rows), str(path.relative_to(root))))
+                else:
+                    conn.execute("DELETE FROM snapshot_manifest WHERE table_name = ? "
+                                 "AND user_id = ? AND month = ?;", (table, uid, month))
+            if rows:
+                n += 1
+        written[table] = n
+    return written
+
+
+def _mark_dirty(table: str, part: Partition) -> None:
+    with write_conn() as conn:
+        conn.execute("INSERT INTO snapshot_dirty (table_name, user_id, month) VALUES (?, ?, ?) "
+                     "ON CONFLICT DO NOTHING;", (table, *part))
+
+
+def _table_columns_ro(table: str) -> List[str]:
+    with read_conn() as c:
+        return _table_columns(c, table)
+
+
+# ─────────────────────── 读取 ───────────────────────
+def _months_between(start: Optional[dt.date], end: Optional[dt.date]):
+    lo = start.strftime("%Y-%m") if start else None
+    hi = end.strftime("%Y-%m") if end else None
+    return lambda m: (lo is None or m >= lo) and (hi is None or m <= hi)
+
+
+def read_history(table: str, user_id: int,
+                 columns: Optional[Sequence[str]] = None,
+                 start: Optional[dt.date] = None, end: Optional[dt.date] = None,
+                 root: Path | str = SNAPSHOT_DIR):
+    """读取某用户的快照为 pyarrow.Table：按月目录裁剪分区，Arrow 文件内存映射零拷贝，
+    只保留 columns 指定的列；start / end（含）按日期列精确过滤。"""
+    pa = _pa()
+    import pyarrow.compute as pc
+    col = TABLES[table]
+    base = Path(root) / table / f"user_id={user_id}"
+    keep = _months_between(start, end)
+    proj = None if columns is None else list(dict.fromkeys([*columns, col]))
+
+    tables = []
+    for d in sorted(base.glob("month=*")) if base.exists() else []:
+        if not keep(d.name[len("month="):]):
+            continue
+        for f in d.glob("part.*"):
+            if f.suffix == ".arrow":
+                with pa.memory_map(str(f), "r") as src:
+                    t = pa.ipc.open_file(src).read_all()
+                tables.append(t.select(proj) if proj else t)
+            elif f.suffix == ".parquet":
+                import pyarrow.parquet as pq
+                tables.append(pq.read_table(f, columns=proj, memory_map=True))
+    if not tables:
+        return _schema(table).empty_table().select(proj) if proj \
+            else _schema(table).empty_table()
+
+    out = pa.concat_tables(tables)
+    if start is not None:
+        out = out.filter(pc.greater_equal(out[col], pa.scalar(start, out.schema.field(col).type)))
+    if end is not None:
+        out = out.filter(pc.less_equal(out[col], pa.scalar(end, out.schema.field(col).type)))
+    if columns is not None and col not in columns:
+        out = out.drop_columns([col])
+    return out
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="列式快照导出 / 读取")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    ex = sub.add_parser("export")
+    ex.add_argument("--format", choices=sorted(FORMATS), default="arrow")
+    ex.add_argument("--full", action="store_true", help="忽略脏标记，全部分区重写")
+    ex.add_argument("--root", default=str(SNAPSHOT_DIR))
+    rd = sub.add_parser("read")
+    rd.add_argument("table", choices=sorted(TABLES))
+    rd.add_argument("--user", type=int, required=True)
+    rd.add_argument("--columns", help="逗号分隔")
+    rd.add_argument("--start", type=dt.date.fromisoformat)
+    rd.add_argument("--end", type=dt.date.fromisoformat)
+    rd.add_argument("--root", default=str(SNAPSHOT_DIR))
+    args = parser.parse_args()
+
+    if args.cmd == "export":
+        t0 = time.perf_counter()
+        res = export_snapshots(args.root, args.format, args.full)
+        print(f"rewrote partitions {res} in {time.perf_counter() - t0:.2f}s → {args.root}")
+    else:
+        cols = args.columns.split(",") if args.columns else None
+        t = read_history(args.table, args.user, cols, args.start, args.end, args.root)
+        print(t.to_pandas())
@@ -0,0 +1,224 @@
+"""写后台队列 + 组提交：打卡 / 档案 / 周报写回不再各自开事务、各自提交。
+
+调用方把写操作（接收写连接的函数）放进有界队列，专用写线程取出后把一批操作放进同一个事务：
+每个操作包在 SAVEPOINT 里，单个失败只回滚它自己；整批一次 COMMIT（一次 WAL 写入 / fsync），
+提交成功后才完成各自的 Future。并发写入越多、每批越大，单次提交的开销摊得越薄。
+
+    HC_WRITE_QUEUE=0              # 关闭：在调用线程里直接写（排查问题 / 单测时用）
+    HC_WRITE_DURABILITY=commit    # 缺省持久化级别，见 DURABILITY
+    HC_WRITE_QUEUE_SIZE=1024      # 队列容量，满了按 HC_WRITE_QUEUE_POLICY 处理
+    HC_WRITE_QUEUE_POLICY=block   # block：最多等 HC_WRITE_QUEUE_TIMEOUT 秒；reject：立即抛 WriteQueueFull
+    HC_WRITE_QUEUE_TIMEOUT=5
+    HC_WRITE_BATCH=256            # 每批最多操作数
+    HC_WRITE_FLUSH_MS=0           # 取到第一条后最多再等这么久凑批
+
+FLUSH_MS=0 时每批带上上一次提交期间排进来的全部写入（自然组提交），等待提交的调用方不会白等；
+写入以 async 为主、生产者远多于一批时，设几毫秒可把提交次数再压低。
+
+调用方已持有写连接（嵌套在 write_conn() 里）或本身就是写线程时直接执行，避免自等死锁；
+此时随调用方的事务一起提交，持久化级别也以调用方为准。
+"""
+from __future__ import annotations
+import atexit, os, queue, threading, time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+from database.pool import ConnectionPool, SYNCHRONOUS
+from telemetry.instrument import inc, observe, timer
+
+# 持久化级别：
+#   async   入队即返回，不等提交；进程崩溃会丢失尚未提交的写入
+#   commit  等到所在批次提交（WAL + synchronous=NORMAL：应用崩溃不丢，断电可能丢最近的提交）
+#   fsync   等到提交且 WAL 已落盘（该批次临时切到 synchronous=FULL）
+DURABILITY = ("async", "commit", "fsync")
+
+DEFAULT_DURABILITY = os.getenv("HC_WRITE_DURABILITY", "commit")
+QUEUE_SIZE         = int(os.getenv("HC_WRITE_QUEUE_SIZE", "1024"))
+QUEUE_POLICY       = os.getenv("HC_WRITE_QUEUE_POLICY", "block")
+QUEUE_TIMEOUT_SEC  = float(os.getenv("HC_WRITE_QUEUE_TIMEOUT", "5"))
+MAX_BATCH          = int(os.getenv("HC_WRITE_BATCH", "256"))
+FLUSH_SEC          = float(os.getenv("HC_WRITE_FLUSH_MS", "0")) / 1000
+
+WriteFn = Callable[[Any], Any]
+_Op = Tuple[WriteFn, str, Future]
+_STOP = object()
+
+
+class WriteQueueFull(RuntimeError):
+    """队列已满（reject 策略，或 block 策略等待超时）。"""
+
+
+class WriteQueue:
+    def __init__(self, pool: ConnectionPool, enabled: bool = True,
+                 max_size: int = QUEUE_SIZE, policy: str = QUEUE_POLICY,
+                 put_timeout: float = QUEUE_TIMEOUT_SEC, max_batch: int = MAX_BATCH,
+                 flush_sec: float = FLUSH_SEC, durability: str = DEFAULT_DURABILITY):
+        if policy not in ("block", "reject"):
+            raise ValueError(f"unknown write queue policy: {policy}")
+        self.pool = pool
+        self.enabled = enabled
+        self.policy = policy
+        self.put_timeout = put_timeout
+        self.max_batch = max_batch
+        self.flush_sec = flush_sec
+        self.durability = _check(durability)
+        self._q: "queue.Queue[Any]" = queue.Queue(max_size)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.stats = {"ops": 0, "batches": 0, "failed": 0, "rejected": 0, "max_batch": 0}
+
+    # ---------------------------- 提交 ----------------------------
+    def submit(self, fn: WriteFn, durability: Optional[str] = None) -> Future:
+        """入队并立即返回 Future（提交后完成，结果为 fn 的返回值）；不等待。"""
+        durability = _check(durability or self.durability)
+        if (not self.enabled or self.pool._writer_owner == threading.get_ident()
+                or threading.current_thread() is self._thread):
+            return self._run_inline(fn, durability)
+        self._ensure_thread()
+        fut: Future = Future()
+        try:
+            self._q.put((fn, durability, fut), block=self.policy == "block",
+                        timeout=self.put_timeout)
+        except queue.Full:
+            self.stats["rejected"] += 1
+            inc("write_queue_rejected_total")
+            raise WriteQueueFull(f"write queue full ({self._q.maxsize} pending)") from None
+        return fut
+
+    def write(self, fn: WriteFn, durability: Optional[str] = None) -> Future:
+        """按持久化级别提交：async 不等；commit / fsync 等到提交，失败时在调用方抛出原异常。"""
+        durability = durability or self.durability
+        fut = self.submit(fn, durability)
+        if durability != "async":
+            fut.result()
+        return fut
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """等到此前入队的写入全部提交（队列按 FIFO 处理）。"""
+        if self._thread is not None:
+            fut: Future = Future()
+            self._q.put((lambda conn: None, "commit", fut))     # 不受 reject 策略限制
+            fut.result(timeout)
+
+    def close(self) -> None:
+        """处理完已入队的写入后停止写线程。"""
+        with self._start_lock:
+            t, self._thread = self._thread, None
+        if t is not None:
+            self._q.put(_STOP)
+            t.join()
+
+    def pending(self) -> int:
+        return self._q.qsize()
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "pending": self.pending()}
+
+    # ---------------------------- 写线程 ----------------------------
+    def _run_inline(self, fn: WriteFn, durability: str) -> Future:
+        fut: Future = Future()
+        try:
+            with _writer(self.pool, durability == "fsync") as conn:
+                fut.set_result(fn(conn))
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="hc-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _loop(self) -> None:
+        while True:
+            first = self._q.get()
+            if first is _STOP:
+                return
+            batch: List[_Op] = [first]
+            stop = False
+            deadline = time.monotonic() + self.flush_sec
+            while len(batch) < self.max_batch:
+                try:
+                    left = deadline - time.monotonic()
+                    item = self._q.get(timeout=left) if left > 0 else self._q.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+            if stop:
+                return
+
+    def _commit(self, batch: List[_Op]) -> None:
+        results: List[Tuple[Future, bool, Any]] = []
+        full = any(d == "fsync" for _, d, _ in batch)
+        try:
+            with timer("write_commit_seconds", durability="fsync" if full else "commit"), \
+                    _writer(self.pool, full) as conn:
+                if not conn.in_transaction:
+                    conn.execute("BEGIN IMMEDIATE;")      # 整批一个事务
+                for fn, _, fut in batch:
+                    if not fut.set_running_or_notify_cancel():
+                        continue
+                    conn.execute("SAVEPOINT wq_op;")
+                    try:
+                        res = fn(conn)
+                    except Exception as e:             # 只回滚这一条，同批其他写入照常提交
+                        conn.execute("ROLLBACK TO wq_op;")
+                        conn.execute("RELEASE wq_op;")
+                        results.append((fut, False, e))
+                    else:
+                        conn.execute("RELEASE wq_op;")
+                        results.append((fut, True, res))
+        except Exception as e:                         # 提交失败：整批都没写进去，异常经 Future 交给调用方
+            for _, _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            self.stats["failed"] += len(batch)
+            inc("write_queue_errors_total", error=type(e).__name__)
+            inc("write_ops_total", len(batch), status="failed")
+            return
+
+        n_failed = sum(1 for _, ok, _ in results if not ok)
+        self.stats["ops"] += len(batch)
+        self.stats["failed"] += n_failed
+        self.stats["batches"] += 1
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+        observe("write_batch_size", len(batch))
+        inc("write_ops_total", len(results) - n_failed, status="ok")
+        if n_failed:
+            inc("write_ops_total", n_failed, status="error")
+        for fut, ok, value in results:
+            if ok:
+                fut.set_result(value)
+            else:
+                fut.set_exception(value)
+
+
+@contextmanager
+def _writer(pool: ConnectionPool, full: bool) -> Iterator[Any]:
+    """pool.writer()；full 时本次提交临时切到 synchronous=FULL（提交即 WAL 落盘），提交后恢复。
+    切换到恢复之间一直持有写锁，其他线程的提交不会混进来。"""
+    conn = None
+    with pool._write_lock:
+        try:
+            with pool.writer() as conn:
+                if full:
+                    conn.execute("PRAGMA synchronous=FULL;")
+                yield conn
+        finally:
+            if full and conn is not None:
+                conn.execute(f"PRAGMA synchronous={SYNCHRONOUS};")
+
+
+def _check(durability: str) -> str:
+    if durability not in DURABILITY:
+        raise ValueError(f"unknown durability level: {durability} (expected one of {DURABILITY})")
+    return durability
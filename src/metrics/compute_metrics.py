@@ -1,102 +1,266 @@
 from __future__ import annotations
 import datetime as dt
-from typing import Dict, List
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
 import pandas as pd
-from database.db_adapter import _get_conn
+
+from telemetry.instrument import timer, timed
+from database.db_adapter import (write_conn, BACKEND, DEFAULT_USER_ID, WEEKLY_METRICS,
+                                 TREND_WINDOWS, TREND_COLS, ROLLUPS)
 
 def _week_start(date: dt.date) -> dt.date:
     return date - dt.timedelta(days=date.weekday())
 
 
-def _compute_metrics(df: pd.DataFrame) -> Dict[str, float | int]:
-    return dict(
-        avg_sleep      = df["sleep_hours"].mean()          or 0,
-        total_steps    = int(df["steps"].sum()             or 0),
-        mood_avg       = df["mood_score"].mean()           or 0,
-        exercise_total = int(df["exercise_minutes"].sum()  or 0),
-        veggie_avg     = df["veggie_servings"].mean()      or 0,
-        water_total    = int(df["water_ml"].sum()          or 0),
-        alcohol_days   = int(df["alcohol"].sum()           or 0),
-    )
+# 周聚合 SQL 见 database/backend.py；单条 GROUP BY 算完所有目标周
+_METRIC_COLS = WEEKLY_METRICS
+_TREND_LOOKBACK = dt.timedelta(weeks=max(TREND_WINDOWS) - 1)
+
+
+def _aggregate_weeks(conn, weeks_sql: str, params: Sequence = ()):
+    """按 weeks_sql 给出的 (user_id, week_start) 列表重算完整周并写回 weekly_summary。
+
+    分组聚合交给存储后端（SQLite 或 DuckDB），写回始终在当前 SQLite 写事务内。
+    不再满 7 天的周（如删掉了某天）删除其汇总行，之后各周的趋势列一并重算。"""
+    weeks = [(r[0], _as_date(r[1])) for r in conn.execute(weeks_sql + ";", params)]
+    with timer("aggregate_phase_seconds", phase="group_by", backend=BACKEND.name):
+        rows = BACKEND.weekly_aggregates(conn, weeks)
+    done = [(r["user_id"], _as_date(r["week_start"])) for r in rows]
+    stale = sorted(set(weeks) - set(done))
+    with timer("aggregate_phase_seconds", phase="upsert"):
+        _upsert_weeks(conn, rows)
+        conn.executemany("DELETE FROM weekly_summary WHERE user_id = ? AND week_start = ?;",
+                         stale)
+    with timer("aggregate_phase_seconds", phase="trends"):
+        _refresh_trends(conn, done + stale)
+    return done
+
+
+def _compute_trends(df: pd.DataFrame) -> pd.DataFrame:
+    """一次向量化计算所有用户所有周的滚动均值与周环比。
+
+    df 需含 user_id / week_start / 各周指标列。滚动窗口按日历周（28D / 84D）
+    而非行数，缺周不会把更早的数据拉进窗口；上一自然周缺失时环比为 NaN。
+    """
+    df = df.sort_values(["user_id", "week_start"]).reset_index(drop=True)
+    df["week_start"] = pd.to_datetime(df["week_start"])
+    g = df.groupby("user_id", sort=False)
+
+    out = df[["user_id", "week_start"]].copy()
+    for w in TREND_WINDOWS:
+        rolled = (g.rolling(f"{7 * w}D", on="week_start")[_METRIC_COLS]
+                  .mean().reset_index(drop=True))
+        for m in _METRIC_COLS:
+            out[f"{m}_ma{w}"] = rolled[m].to_numpy()
+
+    prev = g[_METRIC_COLS].shift(1)
+    consecutive = (g["week_start"].diff() == pd.Timedelta(days=7)).to_numpy()
+    for m in _METRIC_COLS:
+        out[f"{m}_wow"] = (df[m] - prev[m]).where(consecutive)
+    return out
+
+
+def _refresh_trends(conn, weeks: Iterable[Tuple[int, dt.date]]) -> None:
+    """重算受影响周及其后所有周的趋势列（向前多读 11 周作窗口上下文）。"""
+    since: Dict[int, dt.date] = {}
+    for uid, ws in weeks:
+        since[uid] = min(since.get(uid, ws), ws)
+    if not since:
+        return
+
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS trend_scope "
+                 "(user_id INTEGER PRIMARY KEY, since DATE);")
+    conn.execute("DELETE FROM trend_scope;")
+    conn.executemany("INSERT INTO trend_scope VALUES (?, ?);",
+                     [(u, d - _TREND_LOOKBACK) for u, d in since.items()])
+    df = pd.read_sql_query(
+        f"SELECT s.user_id, s.week_start, {','.join('s.' + c for c in _METRIC_COLS)} "
+        "FROM weekly_summary AS s JOIN trend_scope AS t "
+        "  ON s.user_id = t.user_id AND s.week_start >= t.since;",
+        conn)
+    if df.empty:
+        return
+
+    trends = _compute_trends(df)
+    cutoff = pd.to_datetime(trends["user_id"].map(since))
+    trends = trends[trends["week_start"] >= cutoff]
+    vals = trends[TREND_COLS]
+    vals = vals.astype(object).where(vals.notna(), None).to_numpy().tolist()
+    keys = zip(trends["user_id"].tolist(), trends["week_start"].dt.date.tolist())
 
+    set_clause = ",".join(f"{c}=?" for c in TREND_COLS)
+    conn.executemany(
+        f"UPDATE weekly_summary SET {set_clause} WHERE user_id = ? AND week_start = ?;",
+        [(*v, uid, ws) for v, (uid, ws) in zip(vals, keys)])
 
-def aggregate_unprocessed_weeks() -> List[dt.date]:
-    processed: List[dt.date] = []
 
-    with _get_conn() as conn:
-        df_events = pd.read_sql_query("SELECT * FROM events;", conn,
-                                      parse_dates=["date"])
-        if df_events.empty:
-            return processed
+def rebuild_trends(user_id: Optional[int] = None) -> int:
+    """全量重算趋势列（升级后补历史数据用）；user_id=None 时处理所有用户。"""
+    with write_conn() as conn:
+        sql = "SELECT user_id, MIN(week_start) AS ws FROM weekly_summary"
+        params: Sequence = ()
+        if user_id is not None:
+            sql += " WHERE user_id = ?"
+            params = (user_id,)
+        firsts = [(r["user_id"], _as_date(r["ws"])) for r in
+                  conn.execute(sql + " GROUP BY user_id;", params)]
+        _refresh_trends(conn, firsts)
+    return len(firsts)
 
-        df_events["week_start"] = df_events["date"].apply(_week_start)
-        complete_weeks = (
-            df_events.groupby("week_start")["date"].nunique()
-            .loc[lambda s: s == 7]
-            .index
-            .tolist()
-        )
 
-        existing_weeks = pd.read_sql_query(
-            "SELECT week_start FROM weekly_summary;", conn,
-            parse_dates=["week_start"]
-        )["week_start"].tolist()
+def _period_start(month: dt.date, months: int) -> dt.date:
+    return month.replace(month=(month.month - 1) // months * months + 1, day=1)
 
-        to_process = [w for w in complete_weeks if w not in existing_weeks]
-        if not to_process:
-            return processed
 
-        for ws in to_process:
-            df_week = df_events[df_events["week_start"] == ws]
-            metrics = _compute_metrics(df_week)
-            _upsert_week(conn, ws, metrics)
-            processed.append(ws)
+@timed("aggregate_phase_seconds", phase="rollups")
+def _aggregate_rollups(conn, user_id: Optional[int] = None) -> int:
+    """重算脏月及其所在季度的月 / 季汇总，返回处理的脏月数。
 
+    整期删掉再写入：期内事件全部删除后，汇总行也随之消失。"""
+    sql, params = "SELECT user_id, month_start FROM agg_dirty_months", ()
+    if user_id is not None:
+        sql, params = sql + " WHERE user_id = ?", (user_id,)
+    dirty = [(r[0], _as_date(r[1])) for r in conn.execute(sql + ";", params)]
+    if not dirty:
+        return 0
+    cols = ["user_id", "period_start", "n_days"] + _METRIC_COLS
+    for table, months in ROLLUPS.values():
+        periods = sorted({(u, _period_start(m, months)) for u, m in dirty})
+        rows = BACKEND.period_aggregates(conn, periods, months)
+        conn.executemany(f"DELETE FROM {table} WHERE user_id = ? AND period_start = ?;",
+                         periods)
+        conn.executemany(
+            f"INSERT INTO {table} ({','.join(cols)}) VALUES ({','.join('?' * len(cols))});",
+            [[r["user_id"], _as_date(r["period_start"])] + [r[c] for c in cols[2:]]
+             for r in rows])
+    conn.executemany("DELETE FROM agg_dirty_months WHERE user_id = ? AND month_start = ?;",
+                     dirty)
+    return len(dirty)
+
+
+@timed("aggregate_phase_seconds", phase="sweep")
+def _sweep_watermark(conn) -> None:
+    """水位线之后的新事件（含触发器建立前的历史数据）补标脏周。"""
+    wm = conn.execute(
+        "SELECT last_created_at FROM agg_watermark WHERE id = 1"
+    ).fetchone()
+    last_created = wm["last_created_at"] if wm and wm["last_created_at"] else ""
+    conn.execute(
+        "INSERT OR IGNORE INTO agg_dirty_weeks(user_id, week_start) "
+        "SELECT DISTINCT user_id, date(date, 'weekday 0', '-6 days') FROM events "
+        "WHERE created_at > ?;",
+        (last_created,)
+    )
+
+
+@timed("aggregate_seconds", scope="all_users")
+def aggregate_all_users() -> Dict[int, List[dt.date]]:
+    """增量聚合全部用户的脏周（连同脏月的月 / 季汇总），返回 {user_id: [week_start, ...]}。"""
+    processed: Dict[int, List[dt.date]] = {}
+    with write_conn() as conn:
+        _sweep_watermark(conn)
+        _aggregate_rollups(conn)
+        dirty = conn.execute("SELECT user_id, week_start FROM agg_dirty_weeks;").fetchall()
+        if dirty:
+            for uid, ws in _aggregate_weeks(
+                    conn, "SELECT user_id, week_start FROM agg_dirty_weeks"):
+                processed.setdefault(uid, []).append(ws)
+            conn.executemany(
+                "DELETE FROM agg_dirty_weeks WHERE user_id = ? AND week_start = ?;",
+                [(r["user_id"], r["week_start"]) for r in dirty])
+        _advance_watermark(conn)
     return processed
 
-def aggregate_last_full_week() -> bool:
+
+@timed("aggregate_seconds", scope="user")
+def aggregate_unprocessed_weeks(user_id: int = DEFAULT_USER_ID) -> List[dt.date]:
+    """增量聚合：只重算该用户水位线之后新增、或被触发器标记为脏的周，以及脏月的月 / 季汇总。"""
+    with write_conn() as conn:
+        _sweep_watermark(conn)
+        _aggregate_rollups(conn, user_id)
+        dirty = [r["week_start"] for r in conn.execute(
+            "SELECT week_start FROM agg_dirty_weeks WHERE user_id = ?;", (user_id,))]
+        if not dirty:
+            _advance_watermark(conn)
+            return []
+
+        processed = [ws for _, ws in _aggregate_weeks(
+            conn, "SELECT user_id, week_start FROM agg_dirty_weeks WHERE user_id = ?",
+            (user_id,))]
+
+        conn.executemany(
+            "DELETE FROM agg_dirty_weeks WHERE user_id = ? AND week_start = ?;",
+            [(user_id, w) for w in dirty])
+        _advance_watermark(conn)
+    return processed
+
+
+@timed("aggregate_phase_seconds", phase="watermark")
+def _advance_watermark(conn) -> None:
+    conn.execute(
+        "INSERT INTO agg_watermark (id, last_created_at, last_event_date) "
+        "SELECT 1, MAX(created_at), MAX(date) FROM events WHERE true "
+        "ON CONFLICT(id) DO UPDATE SET "
+        "last_created_at=excluded.last_created_at, "
+        "last_event_date=excluded.last_event_date, "
+        "updated_at=CURRENT_TIMESTAMP;"
+    )
+
+@timed("aggregate_seconds", scope="last_full_week")
+def aggregate_last_full_week(user_id: int = DEFAULT_USER_ID) -> bool:
     today = dt.date.today()
     last_week_start = _week_start(today) - dt.timedelta(days=7)
 
-    with _get_conn() as conn:
-        df_week = pd.read_sql_query(
-            "SELECT * FROM events WHERE date >= ? AND date < ?;",
-            conn,
-            params=(last_week_start, last_week_start + dt.timedelta(days=7)),
-            parse_dates=["date"]
-        )
-
-        if df_week.shape[0] < 7:          # 不够 7 天，说明数据还没补齐
+    with write_conn() as conn:
+        done = _aggregate_weeks(conn, "SELECT ? AS user_id, ? AS week_start",
+                                (user_id, last_week_start))
+        if not done:                      # 不够 7 天，说明数据还没补齐
             return False
-
-        metrics = _compute_metrics(df_week)
-        _upsert_week(conn, last_week_start, metrics)
+        conn.execute("DELETE FROM agg_dirty_weeks WHERE user_id = ? AND week_start = ?;",
+                     (user_id, last_week_start))
         return True
 
-def _upsert_week(conn, week_start, metrics):
-    week_start = week_start.date() if hasattr(week_start, "date") else week_start
+def _as_date(v) -> dt.date:
+    if isinstance(v, dt.datetime):
+        return v.date()
+    if isinstance(v, dt.date):
+        return v
+    return dt.date.fromisoformat(str(v)[:10])
 
-    cols = ["week_start"] + list(metrics.keys())
+def _upsert_weeks(conn, rows) -> None:
+    cols = ["user_id", "week_start"] + _METRIC_COLS
     placeholders = ",".join(["?"] * len(cols))
-    update_clause = ",".join([f"{c}=excluded.{c}" for c in cols[1:]])
+    update_clause = ",".join([f"{c}=excluded.{c}" for c in cols[2:]])
+    # 指标有变化（补录 / 修改了某天）时旧周报已不对应新数字：清空 suggestions，
+    # 补生成任务（backfill）会把它当作缺失的周报重新生成。SET 右侧读到的都是更新前的值
+    changed = " OR ".join(f"weekly_summary.{c} IS NOT excluded.{c}" for c in cols[2:])
     sql = (f"INSERT INTO weekly_summary ({','.join(cols)}) "
            f"VALUES ({placeholders}) "
-           f"ON CONFLICT(week_start) DO UPDATE SET {update_clause};")
+           f"ON CONFLICT(user_id, week_start) DO UPDATE SET {update_clause}, "
+           f"suggestions = CASE WHEN {changed} THEN NULL ELSE weekly_summary.suggestions END;")
 
-    values = [week_start] + list(metrics.values())
-    conn.execute(sql, values)
-    conn.commit()
+    values = [[r["user_id"], _as_date(r["week_start"])] + [r[c] for c in _METRIC_COLS]
+              for r in rows]
+    conn.executemany(sql, values)
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("--all", action="store_true",
                         help="聚合所有未处理完整周")
+    parser.add_argument("--user", type=int, default=None,
+                        help="只处理该用户；缺省 --all 时处理全部用户")
+    parser.add_argument("--rebuild-trends", action="store_true",
+                        help="全量重算 4 / 12 周滚动均值与周环比")
     args = parser.parse_args()
 
-    if args.all:
-        weeks = aggregate_unprocessed_weeks()
-        print(f"processed {weeks}")
+    if args.rebuild_trends:
+        print(f"rebuilt trends for {rebuild_trends(args.user)} users")
+    elif args.all:
+        if args.user is None:
+            print(f"processed {aggregate_all_users()}")
+        else:
+            print(f"processed {aggregate_unprocessed_weeks(args.user)}")
     else:
-        ok = aggregate_last_full_week()
+        ok = aggregate_last_full_week(args.user or DEFAULT_USER_ID)
         print("updated last full week:", ok)
@@ -0,0 +1,292 @@
+"""独立调度进程：增量聚合 + 低峰期预生成周报，仪表盘只读预计算结果。
+
+    python -m scheduler.jobs                  # 常驻运行
+    python -m scheduler.jobs --once           # 执行一次所有到期任务后退出（cron / CI）
+    python -m scheduler.jobs --run pregenerate_reports
+    python -m scheduler.jobs --list
+
+任务状态持久化在 scheduler_jobs 表：进程重启后按表中 next_run_at 继续；
+多个调度进程同时运行时靠租约（lease_until）保证同一任务只有一个在跑。
+"""
+from __future__ import annotations
+import datetime as dt, os, random, socket, sys, threading, time, traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from database.db_adapter import read_conn, write_conn, list_users
+
+POLL_SEC            = 30                 # 空闲时最长睡眠；到期任务会提前唤醒
+MAX_CONCURRENT_JOBS = int(os.getenv("SCHEDULER_MAX_JOBS", "2"))
+REPORT_WORKERS      = int(os.getenv("SCHEDULER_REPORT_WORKERS", "4"))
+HEARTBEAT_STALE_SEC = 5 * 60             # 心跳超过这么久视为调度进程已停
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+# ─────────────────────── 触发规则 ───────────────────────
+_WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+
+def next_fire(trigger: str, after: dt.datetime) -> dt.datetime:
+    """trigger: "every <秒>" / "daily HH:MM" / "weekly <mon..sun> HH:MM"。"""
+    kind, *args = trigger.split()
+    if kind == "every":
+        return after + dt.timedelta(seconds=int(args[0]))
+
+    hh, mm = map(int, args[-1].split(":"))
+    cand = after.replace(hour=hh, minute=mm, second=0, microsecond=0)
+    if kind == "daily":
+        return cand if cand > after else cand + dt.timedelta(days=1)
+    if kind == "weekly":
+        cand += dt.timedelta(days=(_WEEKDAYS.index(args[0]) - after.weekday()) % 7)
+        return cand if cand > after else cand + dt.timedelta(days=7)
+    raise ValueError(f"unknown trigger: {trigger!r}")
+
+
+# ─────────────────────── 任务定义 ───────────────────────
+def _job_aggregate() -> str:
+    from metrics.compute_metrics import aggregate_all_users
+    done = aggregate_all_users()
+    return f"{sum(map(len, done.values()))} weeks / {len(done)} users"
+
+
+def _job_close_last_week() -> str:
+    from metrics.compute_metrics import aggregate_last_full_week
+    users = list_users()
+    closed = sum(aggregate_last_full_week(uid) for uid in users)
+    return f"{closed}/{len(users)} users closed last week"
+
+
+def _job_pregenerate_reports() -> str:
+    from metrics.compute_metrics import aggregate_all_users
+    from agent.backfill import backfill_reports
+    aggregate_all_users()
+    run_id, ok, failed = backfill_reports(workers=REPORT_WORKERS, revalidate=False)
+    return f"run {run_id}: ok={ok} failed={failed}"
+
+
+@dataclass
+class Job:
+    name: str
+    func: Callable[[], str]
+    trigger: str
+    jitter_sec: int = 0                  # 每次排期随机后移，避免多实例 / 多任务同时打满
+    misfire_grace_sec: int = 3600        # 迟到超过该值则跳过本次，直接排下一次
+    max_runtime_sec: int = 3600          # 租约时长；进程崩溃后租约过期即可被接管
+
+
+JOBS: Dict[str, Job] = {j.name: j for j in [
+    Job("aggregate", _job_aggregate, "every 600",
+        jitter_sec=60, misfire_grace_sec=24 * 3600, max_runtime_sec=600),
+    Job("close_last_week", _job_close_last_week, "daily 00:05",
+        jitter_sec=120, misfire_grace_sec=24 * 3600, max_runtime_sec=1800),
+    # 周一凌晨低峰期批量生成上周周报，早上打开仪表盘直接读结果
+    Job("pregenerate_reports", _job_pregenerate_reports, "weekly mon 02:00",
+        jitter_sec=1800, misfire_grace_sec=4 * 3600, max_runtime_sec=3 * 3600),
+]}
+
+
+# ─────────────────────── 持久化状态 ───────────────────────
+def _now() -> dt.datetime:
+    return dt.datetime.now().replace(microsecond=0)
+
+
+def _schedule(job: Job, after: dt.datetime) -> dt.datetime:
+    return (next_fire(job.trigger, after) + dt.timedelta(
+        seconds=random.uniform(0, job.jitter_sec))).replace(microsecond=0)
+
+
+def _ensure_jobs() -> None:
+    """登记代码中定义的任务（表见 database/migrations.py）；trigger 变更时按新规则重新排期。"""
+    now = _now()
+    with write_conn() as c:
+        known = {r["name"]: r["trigger"] for r in
+                 c.execute("SELECT name, trigger FROM scheduler_jobs;")}
+        for job in JOBS.values():
+            if known.get(job.name) != job.trigger:
+                c.execute(
+                    "INSERT INTO scheduler_jobs (name, trigger, next_run_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET trigger=excluded.trigger, "
+                    "next_run_at=excluded.next_run_at;",
+                    (job.name, job.trigger, _schedule(job, now)))
+
+
+def _claim_due(now: dt.datetime, limit: int = len(JOBS)) -> List[tuple]:
+    """认领至多 limit 个到期且无有效租约的任务，返回 [(Job, 计划时间), ...]；
+    迟到过久的记为 missed。"""
+    claimed = []
+    with write_conn() as c:
+        rows = c.execute(
+            "SELECT name, next_run_at FROM scheduler_jobs WHERE next_run_at <= ? "
+            "AND (lease_until IS NULL OR lease_until < ?) ORDER BY next_run_at;",
+            (now, now)).fetchall()
+        for r in rows:
+            job = JOBS.get(r["name"])
+            if job is None or len(claimed) >= limit:
+                continue
+            planned = r["next_run_at"]
+            if (now - planned).total_seconds() > job.misfire_grace_sec:
+                # 错过的多次触发合并成一条 missed 记录，不补跑
+                c.execute(
+                    "UPDATE scheduler_jobs SET last_status='missed', next_run_at=? "
+                    "WHERE name=?;", (_schedule(job, now), job.name))
+                print(f"[scheduler] {job.name} missed run planned at {planned}")
+                continue
+            cur = c.execute(
+                "UPDATE scheduler_jobs SET lease_owner=?, lease_until=?, "
+                "last_started_at=?, last_status='running' "
+                "WHERE name=? AND (lease_until IS NULL OR lease_until < ?);",
+                (_OWNER, now + dt.timedelta(seconds=job.max_runtime_sec), now,
+                 job.name, now))
+            if cur.rowcount == 1:
+                claimed.append((job, planned))
+    return claimed
+
+
+def _finish(job: Job, status: str, error: Optional[str]) -> None:
+    now = _now()
+    with write_conn() as c:
+        c.execute(
+            "UPDATE scheduler_jobs SET last_status=?, last_error=?, last_finished_at=?, "
+            "run_count=run_count+1, next_run_at=?, lease_owner=NULL, lease_until=NULL "
+            "WHERE name=? AND lease_owner=?;",
+            (status, error, now, _schedule(job, now), job.name, _OWNER))
+
+
+def _beat() -> None:
+    """常驻模式每轮写一次心跳；--once / --run 不写——它们跑完就退出，不会持续聚合，
+    仪表盘不能因此跳过页面内聚合。"""
+    with write_conn() as c:
+        c.execute(
+            "INSERT INTO scheduler_heartbeat (id, owner, beat_at) VALUES (1, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET owner=excluded.owner, beat_at=excluded.beat_at;",
+            (_OWNER, _now()))
+
+
+def _clear_beat() -> None:
+    """常驻进程退出时删掉自己的心跳，仪表盘立刻退回页面内聚合，不必等心跳过期。"""
+    with write_conn() as c:
+        c.execute("DELETE FROM scheduler_heartbeat WHERE id = 1 AND owner = ?;", (_OWNER,))
+
+
+_alive_cache = (float("-inf"), False)
+
+
+def scheduler_alive(max_age_sec: int = HEARTBEAT_STALE_SEC) -> bool:
+    """调度进程是否在运行（心跳足够新）；结果缓存 60 秒，仪表盘每次重跑可放心调用。"""
+    global _alive_cache
+    checked_at, alive = _alive_cache
+    if time.monotonic() - checked_at < 60:
+        return alive
+    try:
+        with read_conn() as c:
+            row = c.execute("SELECT beat_at FROM scheduler_heartbeat WHERE id = 1;").fetchone()
+        alive = bool(row) and (_now() - row["beat_at"]).total_seconds() < max_age_sec
+    except Exception:                    # 表还不存在：从未启动过调度
+        alive = False
+    _alive_cache = (time.monotonic(), alive)
+    return alive
+
+
+# ─────────────────────── 执行 ───────────────────────
+def _run(job: Job, planned: Optional[dt.datetime] = None) -> bool:
+    t0 = time.perf_counter()
+    late = f" (planned {planned}, late {(_now() - planned).total_seconds():.0f}s)" \
+        if planned else ""
+    print(f"[scheduler] ▶ {job.name}{late}", flush=True)
+    try:
+        result = job.func()
+    except Exception as e:
+        traceback.print_exc()
+        _finish(job, "failed", f"{type(e).__name__}: {e}"[:500])
+        print(f"[scheduler] ✗ {job.name} failed after {time.perf_counter() - t0:.1f}s")
+        return False
+    _finish(job, "ok", None)
+    print(f"[scheduler] ✓ {job.name} {result} in {time.perf_counter() - t0:.1f}s", flush=True)
+    return True
+
+
+def run_now(name: str) -> bool:
+    """手动触发（仍走租约，避免和调度进程里的同名任务并发）。"""
+    _ensure_jobs()
+    job = JOBS[name]
+    now = _now()
+    with write_conn() as c:
+        cur = c.execute(
+            "UPDATE scheduler_jobs SET lease_owner=?, lease_until=?, "
+            "last_started_at=?, last_status='running' "
+            "WHERE name=? AND (lease_until IS NULL OR lease_until < ?);",
+            (_OWNER, now + dt.timedelta(seconds=job.max_runtime_sec), now, name, now))
+    if cur.rowcount != 1:
+        print(f"[scheduler] {name} is already running elsewhere")
+        return False
+    return _run(job)
+
+
+def run_due_once() -> int:
+    """执行所有到期任务（串行）后返回执行数。不写心跳：见 _beat。"""
+    _ensure_jobs()
+    due = _claim_due(_now())
+    for job, planned in due:
+        _run(job, planned)
+    return len(due)
+
+
+def serve_forever(stop: Optional[threading.Event] = None) -> None:
+    _ensure_jobs()
+    stop = stop or threading.Event()
+    running: Dict[str, object] = {}
+    print(f"[scheduler] {_OWNER} started, jobs: {', '.join(JOBS)}")
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS,
+                                thread_name_prefix="job") as pool:
+            while not stop.is_set():
+                _beat()
+                for name in [n for n, f in running.items() if f.done()]:
+                    running.pop(name)
+                if len(running) < MAX_CONCURRENT_JOBS:
+                    for job, planned in _claim_due(_now(), MAX_CONCURRENT_JOBS - len(running)):
+                        running[job.name] = pool.submit(_run, job, planned)
+
+                with read_conn() as c:
+                    nxt = c.execute("SELECT MIN(next_run_at) FROM scheduler_jobs "
+                                    "WHERE lease_until IS NULL;").fetchone()[0]
+                wait = POLL_SEC
+                if nxt is not None:
+                    nxt = dt.datetime.fromisoformat(str(nxt))
+                    wait = min(POLL_SEC, max(1.0, (nxt - _now()).total_seconds()))
+                stop.wait(wait)
+    finally:
+        _clear_beat()
+
+
+def _list() -> None:
+    _ensure_jobs()
+    with read_conn() as c:
+        rows = c.execute("SELECT * FROM scheduler_jobs ORDER BY next_run_at;").fetchall()
+    for r in rows:
+        print(f"{r['name']:<22} {r['trigger']:<18} next={r['next_run_at']}  "
+              f"last={r['last_status'] or '-'} @ {r['last_finished_at'] or '-'}  "
+              f"runs={r['run_count']}" + (f"  err={r['last_error']}" if r["last_error"] else ""))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="健康教练后台调度进程")
+    parser.add_argument("--once", action="store_true", help="执行一次到期任务后退出")
+    parser.add_argument("--run", choices=sorted(JOBS), help="立即执行指定任务")
+    parser.add_argument("--list", action="store_true", help="查看任务状态")
+    args = parser.parse_args()
+
+    if args.list:
+        _list()
+    elif args.run:
+        sys.exit(0 if run_now(args.run) else 1)
+    elif args.once:
+        print(f"[scheduler] ran {run_due_once()} due jobs")
+    else:
+        try:
+            serve_forever()
+        except KeyboardInterrupt:
+            print("[scheduler] stopped")
@@ -0,0 +1,267 @@
+"""轻量埋点：计数器 + 直方图，导出 Prometheus 文本或 JSON 快照。
+
+    HC_METRICS=1 python ...                 # 开启（默认关闭，关闭时埋点为空操作）
+    HC_METRICS_PORT=9108                    # 可选：后台线程提供 /metrics 与 /metrics.json
+
+    with timer("llm_request_seconds", model="deepseek-chat"): ...
+    @timed("prompt_build_seconds")
+    inc("llm_tokens_total", 512, kind="prompt")
+"""
+from __future__ import annotations
+import bisect, functools, inspect, json, os, re, sqlite3, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ENABLED = os.getenv("HC_METRICS", "0") != "0"
+
+# 秒级延迟桶：覆盖 0.1 ms 的 SQLite 点查到 60 s 的模型调用
+BUCKETS: Tuple[float, ...] = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                              0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+_lock = threading.Lock()
+_counters: Dict[str, Dict[LabelKey, float]] = {}
+_hists: Dict[str, Dict[LabelKey, List[float]]] = {}    # [桶计数..., +Inf 计数, sum, max]
+
+
+def enable(on: bool = True) -> None:
+    """运行期开关（测试 / 压测用）；数据库语句级埋点只对开启后新建的连接生效。"""
+    global ENABLED
+    ENABLED = on
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _hists.clear()
+
+
+def _key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels: Any) -> None:
+    if not ENABLED:
+        return
+    key = _key(labels)
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + value
+
+
+def observe(name: str, value: float, **labels: Any) -> None:
+    if not ENABLED:
+        return
+    key = _key(labels)
+    with _lock:
+        h = _hists.setdefault(name, {}).get(key)
+        if h is None:
+            h = _hists[name][key] = [0.0] * (len(BUCKETS) + 3)
+        h[bisect.bisect_left(BUCKETS, value)] += 1
+        h[-2] += value
+        h[-1] = max(h[-1], value)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "t0")
+
+    def __init__(self, name: str, labels: Dict[str, Any]):
+        self.name, self.labels = name, labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        labels = self.labels
+        if exc_type is not None:
+            labels = {**labels, "error": exc_type.__name__}
+        observe(self.name, time.perf_counter() - self.t0, **labels)
+        return False
+
+
+def timer(name: str, **labels: Any):
+    """计时上下文；关闭时返回共享的空对象，开销只有一次布尔判断。"""
+    return _Timer(name, labels) if ENABLED else _NULL
+
+
+def timed(name: str, **labels: Any) -> Callable:
+    """函数计时装饰器（同步 / 异步均可）。"""
+    def deco(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(*args, **kwargs):
+                if not ENABLED:
+                    return await fn(*args, **kwargs)
+                with _Timer(name, labels):
+                    return await fn(*args, **kwargs)
+            return awrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with _Timer(name, labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+# ─────────────────────── SQLite 语句级埋点 ───────────────────────
+_WS = re.compile(r"\s+")
+_STMT_MAX = 80
+
+
+@functools.lru_cache(maxsize=512)
+def statement_label(sql: str) -> str:
+    """压缩空白并截断，作为语句维度的标签。"""
+    s = _WS.sub(" ", sql).strip()
+    return s if len(s) <= _STMT_MAX else s[:_STMT_MAX - 1] + "…"
+
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        with timer("db_query_seconds", stmt=statement_label(sql), op="execute"):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        with timer("db_query_seconds", stmt=statement_label(sql), op="executemany"):
+            return super().executemany(sql, seq_of_parameters)
+
+    def fetchall(self):
+        with timer("db_fetch_seconds"):
+            return super().fetchall()
+
+
+class TimedConnection(sqlite3.Connection):
+    """开启埋点时连接池使用的连接类：所有 execute 都经过 TimedCursor。"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor().executemany(sql, parameters)
+
+
+# ─────────────────────── 导出 ───────────────────────
+def _quantile(h: List[float], q: float) -> Optional[float]:
+    """按桶线性插值估算分位数。"""
+    total = sum(h[:len(BUCKETS) + 1])
+    if not total:
+        return None
+    rank, acc = q * total, 0.0
+    for i, n in enumerate(h[:len(BUCKETS) + 1]):
+        if acc + n >= rank and n:
+            lo = BUCKETS[i - 1] if i else 0.0
+            hi = BUCKETS[i] if i < len(BUCKETS) else h[-1]
+            return lo + (hi - lo) * (rank - acc) / n
+        acc += n
+    return h[-1]
+
+
+def snapshot() -> Dict[str, Any]:
+    """JSON 友好的快照：计数器原值；直方图给 count / sum / mean / max / p50 / p95 / p99。"""
+    with _lock:
+        counters = {n: [{"labels": dict(k), "value": v} for k, v in s.items()]
+                    for n, s in _counters.items()}
+        hists = {n: {k: list(h) for k, h in s.items()} for n, s in _hists.items()}
+    out_h = {}
+    for name, series in hists.items():
+        rows = []
+        for k, h in series.items():
+            count = sum(h[:len(BUCKETS) + 1])
+            rows.append({"labels": dict(k), "count": int(count), "sum": h[-2],
+                         "mean": h[-2] / count if count else None, "max": h[-1],
+                         **{f"p{int(q * 100)}": _quantile(h, q) for q in (0.5, 0.95, 0.99)}})
+        rows.sort(key=lambda r: -r["sum"])
+        out_h[name] = rows
+    return {"enabled": ENABLED, "counters": counters, "histograms": out_h}
+
+
+def _esc(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(k: LabelKey, le: Optional[str] = None) -> str:
+    parts = [f'{n}="{_esc(v)}"' for n, v in k]
+    if le is not None:
+        parts.append(f'le="{le}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def to_prometheus() -> str:
+    """Prometheus text exposition format 0.0.4。"""
+    lines: List[str] = []
+    with _lock:
+        for name, series in sorted(_counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            lines += [f"{name}{_fmt_labels(k)} {v}" for k, v in series.items()]
+        for name, series in sorted(_hists.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for k, h in series.items():
+                acc = 0.0
+                for b, n in zip(BUCKETS, h):
+                    acc += n
+                    lines.append(f"{name}_bucket{_fmt_labels(k, f'{b:g}')} {acc:g}")
+                acc += h[len(BUCKETS)]
+                lines.append(f"{name}_bucket{_fmt_labels(k, '+Inf')} {acc:g}")
+                lines.append(f"{name}_sum{_fmt_labels(k)} {h[-2]}")
+                lines.append(f"{name}_count{_fmt_labels(k)} {acc:g}")
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.startswith("/metrics.json"):
+            body, ctype = json.dumps(snapshot(), ensure_ascii=False).encode(), \
+                "application/json"
+        elif self.path.startswith("/metrics"):
+            body, ctype = to_prometheus().encode(), "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def serve(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """后台线程暴露 /metrics（Prometheus）与 /metrics.json；同一进程只启动一次。"""
+    global _server
+    with _lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _Handler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics-http",
+                             daemon=True).start()
+    return _server
+
+
+if ENABLED and os.getenv("HC_METRICS_PORT"):
+    try:
+        serve(int(os.environ["HC_METRICS_PORT"]))
+    except OSError as e:                 # Streamlit 热重载时端口已被占用
+        print(f"metrics endpoint not started: {e}")
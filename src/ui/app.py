@@ -3,13 +3,12 @@ import sys, pathlib
 ROOT = pathlib.Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
-from dotenv import load_dotenv
-load_dotenv(ROOT.parent / ".env")
+import config  # noqa: F401  —— 唯一加载 .env 的地方
 
 import streamlit as st
 from form import render_form
-from ui.dashboard import render_dashboard
 from ui.profile_form import render_profile_form
+from ui.session import current_user_id
 
 st.set_page_config(
     page_title="健康习惯教练",
@@ -17,6 +16,10 @@ st.set_page_config(
     layout="wide",
 )
 
-render_profile_form()
-render_form()
-render_dashboard()
+user_id = current_user_id()
+render_profile_form(user_id)
+render_form(user_id)
+
+# 表单先出首屏；仪表盘（pandas / numpy / altair）在其后才导入
+from ui.dashboard import render_dashboard  # noqa: E402
+render_dashboard(user_id)
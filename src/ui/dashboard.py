@@ -1,9 +1,37 @@
-import streamlit as st, pandas as pd, altair as alt, datetime as dt
-import json
-from database.db_adapter import fetch_recent_summaries, fetch_events_of_week
-from metrics.compute_metrics import aggregate_unprocessed_weeks
-from agent.feedback_agent import generate_weekly_report
-from database.db_adapter import get_profile
+import streamlit as st, pandas as pd, datetime as dt
+import json, time
+import numpy as np
+from typing import Optional, Tuple
+from database.db_adapter import (fetch_recent_summaries, fetch_rollups, fetch_live_week,
+                                 get_series)
+from scheduler.jobs import scheduler_alive
+from telemetry.instrument import timed, timer
+from database.db_adapter import get_profile, DEFAULT_USER_ID, TREND_WINDOWS, LIVE_METRICS
+# altair 与周报链路（LLM 客户端 / pydantic）在用到时才导入：没有图表、没点生成时不为它们付冷启动
+# ─────────────────────── 时间范围 ───────────────────────
+# 范围 → (日粒度图回看天数, 概览粒度)；None 为全部历史，"auto" 按跨度在月 / 季之间选
+RANGES = {
+    "本周":      (7,    "week"),
+    "近 6 个月": (182,  "week"),
+    "近 1 年":   (365,  "month"),
+    "全部":      (None, "auto"),
+}
+MAX_DAILY_POINTS     = 240      # 每张日粒度图写进 Vega spec 的点数上限，超出按 LTTB 降采样
+MAX_MONTHLY_POINTS   = 36       # "全部" 超过 3 年改用季度汇总
+_GRAIN_LABEL = {"week": "周", "month": "月", "quarter": "季"}
+
+def _daily_window(user_id: int, days: Optional[int],
+                  week_start: dt.date) -> Tuple[dt.date, dt.date]:
+    """日粒度图的 [start, end)：本周沿用最新完整周，其余以最后一个有数据的日子为终点。"""
+    if days == 7:
+        return week_start, week_start + dt.timedelta(days=7)
+    bounds = get_series(user_id).bounds()
+    if bounds is None:
+        return week_start, week_start + dt.timedelta(days=7)
+    first, last = bounds
+    end = last + dt.timedelta(days=1)
+    return (first if days is None else max(first, end - dt.timedelta(days=days))), end
+
 # ─────────────────────── 日粒度多图 ───────────────────────
 METRIC_MAP = {
     "sleep_hours":      "睡眠时长 (h)",
@@ -12,18 +40,27 @@ METRIC_MAP = {
     "exercise_minutes": "运动时长 (min)",
 }
 
-def _render_daily_charts(week_start: dt.date) -> None:
-    df_day = fetch_events_of_week(week_start)
-    if df_day.empty:
-        st.info("该周日粒度数据不足。")
+def _render_daily_charts(start: dt.date, end: dt.date,
+                         user_id: int = DEFAULT_USER_ID) -> None:
+    # 直接切日粒度数组，不查库；长区间在服务端降到 MAX_DAILY_POINTS 个点再交给 Altair，
+    # 否则每次重跑都要把逐日的全部点序列化进 spec 发给浏览器
+    series = get_series(user_id)
+    frames = {}
+    for col in METRIC_MAP:
+        dates, vals = series.points(col, start, end, MAX_DAILY_POINTS)
+        frames[col] = pd.DataFrame({"date": dates.astype("datetime64[ns]"), col: vals})
+    if all(df.empty for df in frames.values()):
+        st.info("该时间段日粒度数据不足。")
         return
 
+    import altair as alt
     cols = st.columns(2)
     for i, (col, title) in enumerate(METRIC_MAP.items()):
         c = cols[i % 2]
+        df_day = frames[col]
         chart = (
             alt.Chart(df_day)
-            .mark_line(point=True)
+            .mark_line(point=len(df_day) <= 31)
             .encode(
                 x=alt.X("date:T", title="日期"),
                 y=alt.Y(f"{col}:Q", title=title),
@@ -45,49 +82,194 @@ _RENAME = {
     "mood_avg":        "情绪评分",
 }
 
-def _plot_week_group(df_week: pd.DataFrame, cols, title):
-    df_long = df_week.melt(
-        id_vars="week_start",
-        value_vars=cols,
-        var_name="metric",
-        value_name="value"
-    )
-    df_long["metric"] = df_long["metric"].map(_RENAME)
+_SUM_COLS  = ["total_steps", "exercise_total"]
+
+def _per_week(df_roll: pd.DataFrame) -> pd.DataFrame:
+    """月 / 季汇总的累计量换算成周均（按有记录的天数），与周粒度同口径，未满的当月不会显得偏低。"""
+    df = df_roll.copy()
+    for c in _SUM_COLS:
+        df[c] = df[c] * 7 / df["n_days"]
+    return df
+
+def _overview_frame(grain: str, days: Optional[int], df_week: pd.DataFrame,
+                    user_id: int) -> Tuple[pd.DataFrame, str, str]:
+    """(概览数据, x 列, 实际粒度)：周粒度读 weekly_summary，月 / 季读物化汇总表。"""
+    if grain == "week":
+        if days == 7:
+            return df_week, "week_start", "week"
+        return fetch_recent_summaries(limit=days // 7, user_id=user_id), "week_start", "week"
+    since = None
+    if days is not None:
+        since = (dt.date.today() - dt.timedelta(days=days)).replace(day=1)
+    df = fetch_rollups("month", user_id, since)
+    if grain == "auto" and len(df) > MAX_MONTHLY_POINTS:
+        grain, df = "quarter", fetch_rollups("quarter", user_id, since)
+    else:
+        grain = "month"
+    return _per_week(df), "period_start", grain
+
+def _week_group_long(df_week: pd.DataFrame, cols, x: str = "week_start") -> pd.DataFrame:
+    # 长表直接由列数组拼出（tile / repeat / concatenate），免去每次渲染的 melt + map
+    n = len(df_week)
+    return pd.DataFrame({
+        x:        np.tile(df_week[x].to_numpy(), len(cols)),
+        "metric": np.repeat([_RENAME[c] for c in cols], n),
+        "value":  np.concatenate([df_week[c].to_numpy(dtype=float) for c in cols]),
+    })
+
+def _plot_week_group(df_week: pd.DataFrame, cols, title, x: str = "week_start",
+                     x_title: str = "周起始"):
+    df_long = _week_group_long(df_week, cols, x)
+    import altair as alt
     chart = (
         alt.Chart(df_long)
-        .mark_line(point=True)
+        .mark_line(point=len(df_week) <= 31)
         .encode(
-            x=alt.X("week_start:T", title="周起始"),
+            x=alt.X(f"{x}:T", title=x_title),
             y=alt.Y("value:Q", title="数值"),
             color="metric:N",
-            tooltip=["week_start", "metric", "value"]
+            tooltip=[x, "metric", "value"]
         )
         .properties(height=250, title=title)
     )
     st.altair_chart(chart, use_container_width=True)
 
+# ─────────────────────── KPI 趋势 ───────────────────────
+def _kpi(col, label: str, row: pd.Series, metric: str, fmt: str) -> None:
+    """KPI 卡片：delta 显示周环比，悬浮提示显示滚动均值（均来自 weekly_summary 趋势列）。"""
+    wow = row.get(f"{metric}_wow")
+    delta = None if pd.isna(wow) else f"{wow:+{fmt}}"
+    mas = [f"近 {w} 周均值 {row[f'{metric}_ma{w}']:{fmt}}" for w in TREND_WINDOWS
+           if not pd.isna(row.get(f"{metric}_ma{w}"))]
+    col.metric(label, f"{row[metric]:{fmt}}", delta=delta,
+               help="；".join(mas) or None)
+
+def _live_row(live: dict, prev: Optional[pd.Series]) -> pd.Series:
+    """实时汇总 → 与 weekly_summary 行同形的 KPI 数据：均值类与上一完整周比较，
+    累计类（步数 / 运动）未满一周不可比，不给 delta；滚动均值沿用上一完整周。"""
+    row = {m: live[m] for m in LIVE_METRICS}
+    for m, (_, how) in LIVE_METRICS.items():
+        last = None if prev is None else prev.get(m)
+        row[f"{m}_wow"] = live[m] - last if how == "mean" and last is not None else None
+        for w in TREND_WINDOWS:
+            row[f"{m}_ma{w}"] = None if prev is None else prev.get(f"{m}_ma{w}")
+    return pd.Series(row)
+
+def _live_caption(live: dict) -> str:
+    ws, days = live["week_start"], live["days_covered"]
+    if live["status"] == "final":
+        return f"✅ {ws:%m-%d} 起的一周已记满 7 天，完整周汇总与趋势稍后更新"
+    if ws + dt.timedelta(days=7) > dt.date.today():
+        return f"⏳ 本周（{ws:%m-%d} 起）已记录 {days}/7 天，数值为暂定，随打卡实时更新"
+    return f"⚠️ {ws:%m-%d} 起的一周只记录了 {days}/7 天，未生成完整周汇总，数值为暂定"
+
+# ─────────────────────── 建议卡片 ───────────────────────
+def _action_card_html(it: dict, week_start: dt.date) -> str:
+    # ── 周期兼容：优先 period_weeks；否则 by_date 退回计算 ──
+    if "period_weeks" in it:
+        weeks = it["period_weeks"]
+    else:
+        end = dt.datetime.strptime(it["by_date"], "%Y-%m-%d").date()
+        weeks = max(1, round((end - week_start).days / 7))
+
+    motivation = it.get("motivation", "")
+    return f"""<div style="border:1px solid #DDD; border-radius:8px; padding:0.7rem">
+    <strong>{it['goal']}</strong><br>
+    目标值：{it['target']}<br>
+    目标周期：{weeks} 周<br>
+    <em>{motivation}</em>
+    </div>"""
+
+JOB_POLL_SEC = 1.0
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+
+def _render_job_progress(job: dict, week_start: dt.date) -> None:
+    """按任务已产出的流式事件渲染：summary 与每张行动卡片一完成就先展示出来。"""
+    st.markdown("---")
+    st.subheader("📝 本周健康建议（生成中…）")
+    summary, items, retries, repairing = None, [], 0, False
+    for kind, payload in job["events"]:
+        if kind == "summary":
+            summary = payload
+        elif kind == "action_item":
+            items.append(payload)
+        elif kind == "repair":                    # 已展示的部分仍有效，只补缺的
+            repairing = True
+        elif kind == "retry":
+            summary, items, retries, repairing = None, [], payload, False
+
+    if summary:
+        st.markdown(f"> **{summary}**")
+    for col, it in zip(st.columns(3), items):
+        col.markdown(_action_card_html(it, week_start), unsafe_allow_html=True)
+
+    if repairing:
+        st.caption("🔧 输出不完整，正在补全缺少的部分…")
+    elif retries:
+        st.caption(f"⚠️ 输出不符合格式，正在重试（第 {retries + 1} 次）…")
+    elif job["status"] == "queued":
+        st.caption("⏳ 已排队，等待生成…")
+    elif not summary:
+        st.caption("⏳ 正在连接模型…")
+    else:
+        st.caption("⏳ 正在生成行动计划…")
+
+def _job_panel(user_id: int, week_start: dt.date) -> None:
+    """轮询任务状态：进行中只刷新本面板；结束后整页重跑以展示写回的建议。"""
+    from agent.report_jobs import get_report_job, TERMINAL
+    job = get_report_job(user_id, week_start)
+    if job["status"] in TERMINAL or job["status"] is None:
+        st.session_state["report_job_result"] = job["status"], job["error"]
+        st.session_state.pop("report_job", None)
+        _rerun()
+        return
+    _render_job_progress(job, week_start)
+    if _fragment is None:                      # 旧版 Streamlit：退回整页定时重跑
+        time.sleep(JOB_POLL_SEC)
+        _rerun()
+
+if _fragment is not None:
+    _job_panel = _fragment(run_every=JOB_POLL_SEC)(_job_panel)
+
+def _rerun() -> None:
+    if hasattr(st, "rerun"):
+        st.rerun()
+    else:
+        st.experimental_rerun()
+
 # ───────────────────────── 主入口 ─────────────────────────
-def render_dashboard() -> None:
+@timed("dashboard_render_seconds")
+def render_dashboard(user_id: int = DEFAULT_USER_ID) -> None:
     st.title("📊 每周健康仪表盘")
 
-    aggregate_unprocessed_weeks()
+    # 调度进程在跑时周汇总已预先算好，这里只读；否则退回页面内增量聚合
+    if not scheduler_alive():
+        from metrics.compute_metrics import aggregate_unprocessed_weeks
+        aggregate_unprocessed_weeks(user_id)
 
-    df_week = fetch_recent_summaries(limit=4)
-    if df_week.empty:
+    with timer("dashboard_section_seconds", section="fetch_summaries"):
+        df_week = fetch_recent_summaries(limit=4, user_id=user_id)
+        live = fetch_live_week(user_id=user_id)
+    if df_week.empty and not live:
         st.info("暂无汇总数据，完成一周打卡后再来看吧！")
         return
 
     # ------- KPI -------
+    # 最近一周还没有完整周汇总（进行中 / 缺天）时，显示触发器维护的实时汇总
+    latest = None if df_week.empty else df_week.iloc[0]
+    kpi_row = latest
+    if live and (latest is None or live["week_start"] > latest.week_start):
+        kpi_row = _live_row(live, latest)
+        st.caption(_live_caption(live))
 
     cols = st.columns(5)          # 一次性生成 5 列
 
-    latest = df_week.iloc[0]
-    cols[0].metric("平均睡眠 (h)",  f"{latest.avg_sleep:.1f}")
-    cols[1].metric("总步数",        f"{latest.total_steps:,}")
-    cols[2].metric("平均情绪",      f"{latest.mood_avg:.1f}")
-    cols[3].metric("运动时间 (min)", f"{latest.exercise_total}")
+    _kpi(cols[0], "平均睡眠 (h)",   kpi_row, "avg_sleep",      ".1f")
+    _kpi(cols[1], "总步数",         kpi_row, "total_steps",    ",.0f")
+    _kpi(cols[2], "平均情绪",       kpi_row, "mood_avg",       ".1f")
+    _kpi(cols[3], "运动时间 (min)", kpi_row, "exercise_total", ".0f")
 
-    profile = get_profile()
+    profile = get_profile(user_id)
     if profile:
         try:
             bmi = round(profile["weight_kg"] / (profile["height_cm"]/100)**2, 1)
@@ -97,35 +279,55 @@ def render_dashboard() -> None:
     else:
         cols[4].metric("BMI", "—")
 
+    if latest is None:
+        st.info("完成第一个完整周的打卡后，就能看到趋势图和周报了。")
+        return
+
+    range_label = st.sidebar.radio("📅 时间范围", list(RANGES))
+    days, grain = RANGES[range_label]
 
-    # ------- 本周日粒度 --------
+    # ------- 日粒度 --------
     st.markdown("---")
-    st.subheader("🗓 本周逐日趋势")
-    _render_daily_charts(latest.week_start)
+    st.subheader("🗓 本周逐日趋势" if days == 7 else f"🗓 逐日趋势（{range_label}）")
+    with timer("dashboard_section_seconds", section="daily_charts"):
+        _render_daily_charts(*_daily_window(user_id, days, latest.week_start), user_id)
 
-    # ------- 最近 4 周概览（两张） --------
+    # ------- 周 / 月 / 季概览（两张） --------
     st.markdown("---")
-    st.subheader("📈 最近 4 周概览")
+    with timer("dashboard_section_seconds", section="fetch_overview"):
+        df_over, x, grain = _overview_frame(grain, days, df_week, user_id)
+    unit = _GRAIN_LABEL[grain]
+    st.subheader("📈 最近 4 周概览" if days == 7 else f"📈 {range_label}概览（按{unit}）")
+    if grain != "week":
+        st.caption("步数 / 运动为各期的周均值（按有记录的天数折算）")
 
     col1, col2 = st.columns(2)
-    with col1:
-        _plot_week_group(df_week, GROUP_HIGH, "高量级指标（步数 / 运动）")
-    with col2:
-        _plot_week_group(df_week, GROUP_LOW,  "低量级指标（睡眠 / 情绪）")
+    with timer("dashboard_section_seconds", section="weekly_charts"):
+        with col1:
+            _plot_week_group(df_over, GROUP_HIGH, "高量级指标（步数 / 运动）",
+                             x, f"{unit}起始")
+        with col2:
+            _plot_week_group(df_over, GROUP_LOW,  "低量级指标（睡眠 / 情绪）",
+                             x, f"{unit}起始")
 
     # ----- 生成周报按钮 -----
+    # 只提交任务不阻塞；同一用户同一周的重复点击 / 多会话请求都挂到同一个在途任务上
     if st.sidebar.button("📑 生成本周周报"):
-        with st.spinner("正在为您生成周报，请稍候…"):
-            ok = generate_weekly_report()
-        if ok:
+        from agent.report_jobs import submit_report_job
+        submit_report_job(user_id, latest.week_start, force=True)
+        st.session_state["report_job"] = (user_id, latest.week_start)
+
+    pending = st.session_state.get("report_job")
+    if pending and pending[0] == user_id:
+        _job_panel(user_id, pending[1])
+
+    result = st.session_state.pop("report_job_result", None)
+    if result:
+        status, error = result
+        if status == "done":
             st.success("周报已生成 ✅")
-            # 刷新页面，马上展示新建议
-            if hasattr(st, "rerun"):
-                st.rerun()
-            else:
-                st.experimental_rerun()
         else:
-            st.error("生成失败，请检查终端日志")
+            st.error(f"生成失败：{error or '未知错误'}，请检查终端日志")
 
     # ---------------- 健康建议渲染 ----------------
     suggest_raw = latest.get("suggestions")
@@ -143,25 +345,9 @@ def render_dashboard() -> None:
                 cols = st.columns(len(items))
                 week_start = latest.week_start
                 for col, it in zip(cols, items):
-                    # ── 周期兼容：优先 period_weeks；否则 by_date 退回计算 ──
-                    if "period_weeks" in it:
-                        weeks = it["period_weeks"]
-                    else:
-                        end = dt.datetime.strptime(it["by_date"], "%Y-%m-%d").date()
-                        weeks = max(1, round((end - week_start).days / 7))
-
-                    motivation = it.get("motivation", "")
-
                     with col:
-                        st.markdown(
-                            f"""<div style="border:1px solid #DDD; border-radius:8px; padding:0.7rem">
-    <strong>{it['goal']}</strong><br>
-    目标值：{it['target']}<br>
-    目标周期：{weeks} 周<br>
-    <em>{motivation}</em>
-    </div>""",
-                            unsafe_allow_html=True
-                        )
+                        st.markdown(_action_card_html(it, week_start),
+                                    unsafe_allow_html=True)
             else:
                 st.info("模型未返回行动项。")
 
@@ -1,12 +1,12 @@
 import datetime as dt
 import streamlit as st
 
-from database.db_adapter import insert_event, get_streak
+from database.db_adapter import insert_event, get_streak, DEFAULT_USER_ID
 
 def _today() -> dt.date:
     return dt.date.today()
 
-def render_form() -> None:
+def render_form(user_id: int = DEFAULT_USER_ID) -> None:
     st.sidebar.header("📅 每日健康打卡")
 
     with st.sidebar.form("daily_checkin", clear_on_submit=False):
@@ -44,6 +44,7 @@ def render_form() -> None:
         submitted = st.form_submit_button("✅ 提交打卡")
         if submitted:
             insert_event(
+                user_id,
                 date=date,
                 sleep_hours=float(sleep_hours),
                 sleep_start=str(sleep_start),
@@ -62,7 +63,7 @@ def render_form() -> None:
             st.success("🎉 打卡成功！")
 
     # ──────────── 连击天数展示 ────────────
-    streak_days, month_days, month_filled = get_streak()
+    streak_days, month_days, month_filled = get_streak(user_id)
     st.sidebar.markdown("---")
     st.sidebar.metric("连续打卡天数", f"{streak_days} 天")
     st.sidebar.progress(month_filled / month_days, text="本月打卡进度")
@@ -1,9 +1,9 @@
 import streamlit as st
-from database.db_adapter import get_profile, upsert_profile
+from database.db_adapter import get_profile, upsert_profile, DEFAULT_USER_ID
 
-def render_profile_form():
+def render_profile_form(user_id: int = DEFAULT_USER_ID):
     st.sidebar.markdown("## 👤 个人档案")
-    prof = get_profile()
+    prof = get_profile(user_id)
 
     with st.sidebar.form("profile_form"):
         name  = st.text_input("姓名", prof.get("name", ""))
@@ -15,7 +15,7 @@ def render_profile_form():
         occ   = st.text_input("职业", prof.get("occupation", "学生 / 上班族"))
         submitted = st.form_submit_button("保存")
         if submitted:
-            upsert_profile(name=name, gender=gender, age=int(age),
+            upsert_profile(user_id, name=name, gender=gender, age=int(age),
                            height_cm=int(height), weight_kg=float(weight),
                            occupation=occ)
             st.success("个人档案已保存！")
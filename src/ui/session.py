@@ -0,0 +1,79 @@
+import hashlib, hmac, os, time
+from typing import Optional
+
+import streamlit as st
+from database.db_adapter import DEFAULT_USER_ID
+
+# 用户身份绑定在会话上，不信任 URL 里的明文 uid：
+#   - 设置 HC_SESSION_SECRET 即为多用户部署，用户凭签名登录链接 ?token=<uid>.<过期时间>.<签名>
+#     进入（python -m ui.session sign 123 签发），校验通过后写入 st.session_state；
+#     没有有效凭据的会话不展示任何数据
+#   - 未设置时为单用户部署，固定为 DEFAULT_USER_ID
+#   - HC_ALLOW_UID_PARAM=1 仅供本地开发：接受明文 ?uid=123
+SESSION_SECRET  = os.getenv("HC_SESSION_SECRET", "")
+ALLOW_UID_PARAM = os.getenv("HC_ALLOW_UID_PARAM", "0") == "1"
+TOKEN_TTL_SEC   = int(os.getenv("HC_SESSION_TOKEN_TTL", str(30 * 86400)))
+
+_SESSION_KEY = "user_id"
+
+
+def _sign(payload: str) -> str:
+    return hmac.new(SESSION_SECRET.encode(), payload.encode(), hashlib.sha256).hexdigest()
+
+
+def sign_user_token(user_id: int, ttl_sec: int = TOKEN_TTL_SEC) -> str:
+    """签发登录凭据（放进 ?token=）。"""
+    if not SESSION_SECRET:
+        raise RuntimeError("签发登录链接需要设置 HC_SESSION_SECRET")
+    payload = f"{int(user_id)}.{int(time.time()) + ttl_sec}"
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify_user_token(token: str) -> Optional[int]:
+    """签名正确且未过期时返回 user_id，否则 None。"""
+    if not SESSION_SECRET:
+        return None
+    try:
+        uid, exp, sig = token.split(".")
+        # 按字节比较：str 版 compare_digest 遇到非 ASCII 字符会抛 TypeError
+        if not hmac.compare_digest(sig.encode(), _sign(f"{uid}.{exp}").encode()) \
+                or int(exp) < time.time():
+            return None
+        return int(uid)
+    except (ValueError, TypeError):
+        return None
+
+
+def current_user_id() -> int:
+    """当前会话的用户：登录链接校验通过后绑定到会话；单用户部署为默认用户。"""
+    token = st.query_params.get("token")
+    if token:
+        uid = verify_user_token(token)
+        if uid is not None:
+            st.session_state[_SESSION_KEY] = uid
+        del st.query_params["token"]          # 凭据不留在地址栏 / 浏览器历史里
+    elif ALLOW_UID_PARAM and st.query_params.get("uid"):
+        try:
+            st.session_state[_SESSION_KEY] = int(st.query_params["uid"])
+        except ValueError:
+            pass
+
+    uid = st.session_state.get(_SESSION_KEY)
+    if uid is not None:
+        return uid
+    if SESSION_SECRET:
+        st.warning("请使用登录链接访问（链接无效或已过期时请重新获取）。")
+        st.stop()
+    return DEFAULT_USER_ID
+
+
+if __name__ == "__main__":
+    """python -m ui.session sign 123 [--days 30]：打印登录链接参数"""
+    import argparse
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sp = sub.add_parser("sign")
+    sp.add_argument("user_id", type=int)
+    sp.add_argument("--days", type=float, default=TOKEN_TTL_SEC / 86400)
+    args = parser.parse_args()
+    print(f"?token={sign_user_token(args.user_id, int(args.days * 86400))}")
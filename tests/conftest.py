@@ -0,0 +1,13 @@
+"""单元 / 回归测试公共设置：src 加入 sys.path，数据库指向临时库。
+
+    pytest tests
+"""
+from __future__ import annotations
+import os, pathlib, sys, tempfile
+
+HERE = pathlib.Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "src"))
+
+# 须在导入 database.* 之前：DB_PATH 在 db_adapter 导入时确定
+os.environ.setdefault("HC_DB_PATH",
+                      str(pathlib.Path(tempfile.mkdtemp(prefix="hc-test-")) / "test.sqlite"))
@@ -0,0 +1,86 @@
+"""DuckDB 镜像：与 SQLite 结果一致；只在 events 变化时重载该用户，事务内的重载提交后才记版本。"""
+from __future__ import annotations
+import datetime as dt
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("duckdb")
+from database.backend import EVENT_SCAN_COLS, DuckDBBackend, SQLiteBackend          # noqa: E402
+from database.db_adapter import (_POOL, insert_event, read_conn, upsert_profile,     # noqa: E402
+                                 write_conn)
+from metrics.compute_metrics import aggregate_unprocessed_weeks         # noqa: E402
+
+WEEK = dt.date(2024, 1, 1)                 # 周一
+
+
+def test_mirror_reloads_only_on_event_writes():
+    uid = 900_601
+    for i in range(7):
+        insert_event(uid, date=WEEK + dt.timedelta(days=i), steps=1000)
+    duck = DuckDBBackend(_POOL)
+    assert duck.sync() >= 1
+
+    upsert_profile(uid, name="mirror")
+    aggregate_unprocessed_weeks(uid)
+    assert duck.sync() == 0
+
+    insert_event(uid, date=WEEK, steps=3000)
+    assert duck.sync() == 1
+
+
+def _rows(rows):
+    return sorted((r["user_id"], str(r[k])[:10], *(round(float(r[c]), 6) for c in r
+                   if c not in ("user_id", k))) for r in rows for k in
+                  [next(c for c in r if c in ("week_start", "period_start"))])
+
+
+def test_duckdb_matches_sqlite():
+    uids = (900_602, 900_603)
+    for n, uid in enumerate(uids):
+        for i in range(10 + n * 3):                    # 一周齐全 + 下一周不全
+            insert_event(uid, date=WEEK + dt.timedelta(days=i), steps=1000 + i * 7,
+                         sleep_hours=6.5 + (i % 3) * 0.5, mood_score=1 + i % 5,
+                         water_ml=None if i % 4 else 1500, alcohol=i % 2)
+    lite, duck = SQLiteBackend(_POOL), DuckDBBackend(_POOL)
+    weeks = [(u, WEEK + dt.timedelta(days=7 * k)) for u in uids for k in range(2)]
+    periods = [(u, WEEK) for u in uids]
+    with read_conn() as c:
+        assert _rows(duck.weekly_aggregates(c, weeks)) == _rows(lite.weekly_aggregates(c, weeks))
+        assert len(lite.weekly_aggregates(c, weeks)) == 2
+        assert _rows(duck.period_aggregates(c, periods, 1)) == \
+            _rows(lite.period_aggregates(c, periods, 1))
+
+    end = WEEK + dt.timedelta(days=11)
+    for uid in (uids[0], None):
+        a = lite.scan("events", uid, EVENT_SCAN_COLS, WEEK, end)
+        b = duck.scan("events", uid, EVENT_SCAN_COLS, WEEK, end)
+        # 整列为 NULL 时 SQLite 给 object(None)、DuckDB 给 float(NaN)：数值列统一成 float 再比
+        a, b = (df[df["user_id"].isin(uids)].reset_index(drop=True)
+                .astype({c: float for c in EVENT_SCAN_COLS if c != "date"}) for df in (a, b))
+        pd.testing.assert_frame_equal(a, b, check_dtype=False)
+    assert duck.stats["syncs"] == 1                    # 后续查询都不再重载
+
+
+def test_in_transaction_sync_recorded_after_commit():
+    uid = 900_604
+    for i in range(7):
+        insert_event(uid, date=WEEK + dt.timedelta(days=i), steps=1000)
+    duck = DuckDBBackend(_POOL)
+    duck.sync()
+
+    with write_conn() as c:                            # 聚合在写事务里调用
+        c.execute("UPDATE events SET steps = 2000 WHERE user_id = ? AND date = ?;", (uid, WEEK))
+        assert duck.weekly_aggregates(c, [(uid, WEEK)])[0]["total_steps"] == 8000
+        assert duck.sync(c) == 0                       # 同一事务里不重复重载
+    assert duck.sync() == 0                            # 提交后版本已记入，不再重载
+
+    with pytest.raises(RuntimeError):
+        with write_conn() as c:
+            c.execute("UPDATE events SET steps = 9000 WHERE user_id = ? AND date = ?;",
+                      (uid, WEEK))
+            duck.sync(c)
+            raise RuntimeError("abort")
+    assert duck.sync() == 1                            # 回滚：镜像里是未提交的数据，重新加载
+    with read_conn() as c:
+        assert duck.weekly_aggregates(c, [(uid, WEEK)])[0]["total_steps"] == 8000
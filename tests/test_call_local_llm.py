@@ -0,0 +1,65 @@
+"""DeepSeek 客户端：用量 / 延迟记入埋点，不往 stdout 打印。"""
+from __future__ import annotations
+import asyncio
+
+import pytest
+
+from agent import call_local_llm as llm
+from telemetry import instrument
+
+
+class _FakeClient:
+    def __init__(self, usage=None):
+        self.usage = usage
+
+    async def chat(self, payload, timeout):
+        return {"choices": [{"message": {"content": " 好的 "}}], "usage": self.usage}
+
+    async def stream_chat(self, payload, timeout):
+        for part in ("好", "的"):
+            yield {"choices": [{"delta": {"content": part}}]}
+        yield {"choices": [], "usage": self.usage}
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    monkeypatch.setattr(instrument, "ENABLED", True)
+    instrument.reset()
+
+    def counter(name):
+        return {tuple(sorted(r["labels"].items())): r["value"]
+                for r in instrument.snapshot()["counters"].get(name, [])}
+    return counter
+
+
+def _run(client, coro_fn, monkeypatch):
+    monkeypatch.setattr(llm, "get_client", lambda: client)
+    return asyncio.run(coro_fn())
+
+
+def test_chat_records_usage_without_printing(monkeypatch, capsys, metrics):
+    usage = {"prompt_tokens": 120, "completion_tokens": 30, "prompt_cache_hit_tokens": 100}
+    out = _run(_FakeClient(usage), lambda: llm.acall_llm("hi", model="m"), monkeypatch)
+    assert out == "好的"
+    assert capsys.readouterr().out == ""
+    tokens = metrics("llm_tokens_total")
+    assert tokens[(("kind", "prompt"), ("model", "m"))] == 120
+    assert tokens[(("kind", "prompt_cache_hit"), ("model", "m"))] == 100
+    assert instrument.snapshot()["histograms"]["llm_request_seconds"][0]["count"] == 1
+
+
+def test_chat_without_usage_counts_chars(monkeypatch, capsys, metrics):
+    _run(_FakeClient(), lambda: llm.acall_llm("hello", model="m"), monkeypatch)
+    assert capsys.readouterr().out == ""
+    assert metrics("llm_chars_total") == {(("kind", "prompt"), ("model", "m")): 5,
+                                          (("kind", "completion"), ("model", "m")): 4}
+
+
+def test_stream_records_first_token_without_printing(monkeypatch, capsys, metrics):
+    async def collect():
+        return [d async for d in llm.astream_llm("hi", model="m")]
+
+    assert _run(_FakeClient({"completion_tokens": 2}), collect, monkeypatch) == ["好", "的"]
+    assert capsys.readouterr().out == ""
+    first = instrument.snapshot()["histograms"]["llm_first_token_seconds"]
+    assert [r["count"] for r in first] == [1]
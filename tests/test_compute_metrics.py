@@ -0,0 +1,82 @@
+"""增量周聚合的回归测试。各用例使用各自的 user_id，互不干扰。"""
+from __future__ import annotations
+import datetime as dt
+
+from database.db_adapter import insert_event, read_conn, write_conn
+from metrics.compute_metrics import aggregate_unprocessed_weeks
+
+WEEK = dt.date(2024, 1, 1)                 # 周一
+
+
+def _fill(uid: int, week: dt.date, steps: int) -> None:
+    for i in range(7):
+        insert_event(uid, date=week + dt.timedelta(days=i), steps=steps, sleep_hours=7.0)
+
+
+def _summary(uid: int) -> dict:
+    with read_conn() as c:
+        return {dt.date.fromisoformat(str(r["week_start"])[:10]): dict(r) for r in c.execute(
+            "SELECT * FROM weekly_summary WHERE user_id = ?;", (uid,))}
+
+
+def test_deleting_a_day_drops_the_week_summary():
+    uid = 900_001
+    nxt = WEEK + dt.timedelta(days=7)
+    _fill(uid, WEEK, 1000)
+    _fill(uid, nxt, 3000)
+    assert sorted(aggregate_unprocessed_weeks(uid)) == [WEEK, nxt]
+    assert _summary(uid)[nxt]["total_steps_wow"] == 14000
+
+    with write_conn() as c:
+        c.execute("DELETE FROM events WHERE user_id = ? AND date = ?;",
+                  (uid, WEEK + dt.timedelta(days=3)))
+    assert aggregate_unprocessed_weeks(uid) == []
+
+    rows = _summary(uid)
+    assert WEEK not in rows                            # 不满 7 天：旧汇总行删除
+    assert rows[nxt]["total_steps_wow"] is None        # 后续周的趋势按缺周重算
+    assert rows[nxt]["total_steps_ma4"] == 21000
+    with read_conn() as c:
+        assert c.execute("SELECT COUNT(*) FROM agg_dirty_weeks WHERE user_id = ?;",
+                         (uid,)).fetchone()[0] == 0
+
+
+def test_refilled_day_restores_the_week_summary():
+    uid = 900_002
+    _fill(uid, WEEK, 1000)
+    aggregate_unprocessed_weeks(uid)
+    with write_conn() as c:
+        c.execute("DELETE FROM events WHERE user_id = ? AND date = ?;", (uid, WEEK))
+    aggregate_unprocessed_weeks(uid)
+    assert WEEK not in _summary(uid)
+
+    insert_event(uid, date=WEEK, steps=2000)
+    assert aggregate_unprocessed_weeks(uid) == [WEEK]
+    assert _summary(uid)[WEEK]["total_steps"] == 8000
+
+
+def _suggestions(uid: int, week: dt.date):
+    with read_conn() as c:
+        return c.execute("SELECT suggestions FROM weekly_summary "
+                         "WHERE user_id = ? AND week_start = ?;", (uid, week)).fetchone()[0]
+
+
+def test_edited_week_drops_stale_report():
+    uid = 900_003
+    _fill(uid, WEEK, 1000)
+    aggregate_unprocessed_weeks(uid)
+    with write_conn() as c:
+        c.execute("UPDATE weekly_summary SET suggestions = '{\"summary\": \"old\"}' "
+                  "WHERE user_id = ? AND week_start = ?;", (uid, WEEK))
+
+    insert_event(uid, date=WEEK, steps=1000)           # 重写同样的值：指标不变，周报保留
+    assert aggregate_unprocessed_weeks(uid) == [WEEK]
+    assert _suggestions(uid, WEEK) is not None
+
+    insert_event(uid, date=WEEK + dt.timedelta(days=2), steps=4000)
+    assert aggregate_unprocessed_weeks(uid) == [WEEK]
+    assert _summary(uid)[WEEK]["total_steps"] == 10000
+    assert _suggestions(uid, WEEK) is None              # 旧周报对应旧数字，清空待重新生成
+
+    from agent.backfill import find_missing_reports
+    assert (uid, WEEK) in find_missing_reports()
@@ -0,0 +1,41 @@
+"""按 user_id 分区：两个用户同日期打卡，各读取接口只返回自己的数据。"""
+from __future__ import annotations
+import datetime as dt
+
+from database.db_adapter import (fetch_events_of_week, fetch_live_week, fetch_recent_summaries,
+                                 fetch_rollups, get_profile, get_series,
+                                 insert_event, list_users, upsert_profile)
+from metrics.compute_metrics import aggregate_unprocessed_weeks
+
+WEEK = dt.date(2024, 1, 1)                 # 周一
+
+
+def test_reads_are_isolated_per_user():
+    a, b = 900_501, 900_502
+    for uid, steps, days in ((a, 1000, 7), (b, 9000, 3)):
+        for i in range(days):
+            insert_event(uid, date=WEEK + dt.timedelta(days=i), steps=steps)
+        upsert_profile(uid, name=f"user{uid}")
+    aggregate_unprocessed_weeks(a)
+    aggregate_unprocessed_weeks(b)
+
+    assert {a, b} <= set(list_users())
+    assert get_profile(a)["name"] == f"user{a}" and get_profile(b)["name"] == f"user{b}"
+
+    ev_a, ev_b = fetch_events_of_week(WEEK, user_id=a), fetch_events_of_week(WEEK, user_id=b)
+    assert len(ev_a) == 7 and set(ev_a["steps"]) == {1000}
+    assert len(ev_b) == 3 and set(ev_b["steps"]) == {9000}
+
+    weeks_a, weeks_b = fetch_recent_summaries(user_id=a), fetch_recent_summaries(user_id=b)
+    assert weeks_a["total_steps"].tolist() == [7000]
+    assert weeks_b.empty                                   # 不满 7 天，没有周汇总
+
+    assert fetch_live_week(a, WEEK)["total_steps"] == 7000
+    assert fetch_live_week(b, WEEK)["total_steps"] == 27000
+
+    assert fetch_rollups("month", a)["total_steps"].tolist() == [7000]
+    assert fetch_rollups("month", b)["total_steps"].tolist() == [27000]
+
+    end = WEEK + dt.timedelta(days=7)
+    assert get_series(a).total("steps", WEEK, end) == 7000
+    assert get_series(b).total("steps", WEEK, end) == 27000
@@ -0,0 +1,43 @@
+"""异步周报生成：读库 / 写回不在事件循环线程上执行。"""
+from __future__ import annotations
+import datetime as dt, json, threading
+
+from agent import feedback_agent as fa
+from database.db_adapter import insert_event, read_conn
+from metrics.compute_metrics import aggregate_unprocessed_weeks
+
+WEEK = dt.date(2024, 1, 1)
+REPORT = {"summary": "本周睡眠稳定，步数偏少。",
+          "action_items": [{"goal": f"目标{i}", "target": "每天 7000 步", "period_weeks": 2}
+                           for i in range(3)]}
+
+
+def test_concurrent_reports_keep_db_work_off_the_loop(monkeypatch):
+    uids = [900_201, 900_202, 900_203]
+    for n, uid in enumerate(uids):                     # 各用户数据不同，prompt 不会命中缓存
+        for i in range(7):
+            insert_event(uid, date=WEEK + dt.timedelta(days=i), steps=5000 + n * 100,
+                         sleep_hours=7.0)
+        aggregate_unprocessed_weeks(uid)
+
+    loop_thread, db_threads = [], []
+    for name in ("_prepare_report", "_save_report"):
+        orig = getattr(fa, name)
+        def spy(*a, _orig=orig, **kw):
+            db_threads.append(threading.get_ident())
+            return _orig(*a, **kw)
+        monkeypatch.setattr(fa, name, spy)
+
+    async def fake_llm(prompt, **kw):
+        loop_thread.append(threading.get_ident())
+        return json.dumps(REPORT, ensure_ascii=False)
+
+    monkeypatch.setattr(fa, "acall_llm", fake_llm)
+    assert fa.generate_weekly_reports([(uid, WEEK) for uid in uids]) == [True] * 3
+
+    assert len(db_threads) == 6 and loop_thread[0] not in db_threads
+    with read_conn() as c:
+        for uid in uids:
+            (raw,) = c.execute("SELECT suggestions FROM weekly_summary "
+                               "WHERE user_id = ? AND week_start = ?;", (uid, WEEK)).fetchone()
+            assert fa._validate_llm_output(raw)
@@ -0,0 +1,35 @@
+"""连接池：线程结束后读连接关闭并注销，不随 Streamlit rerun 线程数增长。"""
+from __future__ import annotations
+import gc, threading
+
+from database.db_adapter import _POOL, read_conn
+
+
+def test_reader_closed_when_thread_ends():
+    base = _POOL.reader_count()
+    conns = []
+
+    def rerun():
+        with read_conn() as c:
+            c.execute("SELECT 1;").fetchone()
+            conns.append(c)
+
+    for _ in range(200):
+        t = threading.Thread(target=rerun)
+        t.start()
+        t.join()
+    gc.collect()
+    assert _POOL.reader_count() <= base
+    assert len(conns) == 200
+    closed = 0
+    for c in conns:
+        try:
+            c.execute("SELECT 1;")
+        except Exception:
+            closed += 1
+    assert closed == 200
+
+
+def test_reader_reused_within_thread():
+    with read_conn() as a, read_conn() as b:
+        assert a is b
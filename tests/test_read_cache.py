@@ -0,0 +1,49 @@
+"""读缓存：命中统计，以及本进程 / 其他连接的写入都能让缓存失效。"""
+from __future__ import annotations
+import sqlite3
+
+from database import db_adapter
+from database.db_adapter import DB_PATH, get_profile, read_cache_stats, upsert_profile
+
+
+def _stats() -> dict:
+    return read_cache_stats()
+
+
+def test_repeat_read_is_a_hit():
+    uid = 900_701
+    upsert_profile(uid, name="a")
+    before = _stats()
+    assert get_profile(uid)["name"] == "a"
+    assert get_profile(uid)["name"] == "a"
+    after = _stats()
+    assert after["misses"] - before["misses"] == 1
+    assert after["hits"] - before["hits"] == 1
+
+
+def test_same_process_write_invalidates_only_that_user():
+    a, b = 900_702, 900_703
+    upsert_profile(a, name="a1")
+    upsert_profile(b, name="b1")
+    get_profile(a), get_profile(b)
+
+    upsert_profile(a, name="a2")
+    before = _stats()
+    assert get_profile(a)["name"] == "a2"              # 本进程写入立即可见
+    assert get_profile(b)["name"] == "b1"              # 其他用户的条目仍然命中
+    after = _stats()
+    assert after["misses"] - before["misses"] == 1
+    assert after["hits"] - before["hits"] == 1
+
+
+def test_write_from_another_connection_invalidates(monkeypatch):
+    uid = 900_704
+    upsert_profile(uid, name="before")
+    assert get_profile(uid)["name"] == "before"
+
+    # 模拟其他进程：独立连接直接写库，本进程提交计数不变，只能靠 PRAGMA data_version 发现
+    monkeypatch.setattr(db_adapter._READ_CACHE, "probe_interval", 0)
+    with sqlite3.connect(DB_PATH) as c:
+        c.execute("UPDATE user_profile SET name = 'after' WHERE user_id = ?;", (uid,))
+    c.close()
+    assert get_profile(uid)["name"] == "after"
@@ -0,0 +1,40 @@
+"""周报任务的租约抢占与进度清理。"""
+from __future__ import annotations
+import datetime as dt
+
+from agent import report_jobs as rj
+from database.db_adapter import write_conn
+
+WEEK = dt.date(2024, 1, 1)
+
+
+def _set(key, **cols) -> None:
+    sets = ", ".join(f"{c} = ?" for c in cols)
+    with write_conn() as c:
+        c.execute(f"UPDATE report_jobs SET {sets} WHERE user_id = ? AND week_start = ?;",
+                  (*cols.values(), *key))
+
+
+def test_claim_is_single_flight():
+    key = (900_101, WEEK)
+    assert rj._claim(key, force=False)
+    assert not rj._claim(key, force=True)             # 租约有效：任何人都抢不到
+
+    _set(key, lease_until=dt.datetime(2000, 1, 1))     # 所属进程崩溃、租约过期
+    assert rj._claim(key, force=False)
+
+    _set(key, status="done", lease_until=None)
+    assert not rj._claim(key, force=False)
+    assert rj._claim(key, force=True)
+
+
+def test_progress_dropped_when_job_finishes(monkeypatch):
+    def fake_stream(user_id, week_start=None):
+        yield ("summary", "ok")
+        yield ("done", True)
+
+    monkeypatch.setattr(rj, "stream_weekly_report", fake_stream)
+    rj.submit_report_job(900_102, WEEK)
+    assert rj.wait_report_job(900_102, WEEK, timeout=10)
+    assert (900_102, WEEK) not in rj._progress
+    assert rj.get_report_job(900_102, WEEK)["status"] == "done"
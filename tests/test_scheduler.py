@@ -0,0 +1,34 @@
+"""调度心跳：只有常驻进程写，退出时清掉；--once 不写。"""
+from __future__ import annotations
+import threading
+
+from database.db_adapter import read_conn, write_conn
+from scheduler import jobs
+
+
+def _heartbeat():
+    with read_conn() as c:
+        return c.execute("SELECT owner FROM scheduler_heartbeat WHERE id = 1;").fetchone()
+
+
+def test_once_does_not_beat(monkeypatch):
+    with write_conn() as c:
+        c.execute("DELETE FROM scheduler_heartbeat;")
+    monkeypatch.setattr(jobs, "_claim_due", lambda now, limit=None: [])
+    assert jobs.run_due_once() == 0
+    assert _heartbeat() is None
+
+
+def test_serve_forever_clears_its_heartbeat(monkeypatch):
+    stop = threading.Event()
+    seen = []
+
+    def claim_due(now, limit=None):
+        seen.append(_heartbeat()["owner"])
+        stop.set()
+        return []
+
+    monkeypatch.setattr(jobs, "_claim_due", claim_due)
+    jobs.serve_forever(stop)
+    assert seen == [jobs._OWNER]
+    assert _heartbeat() is None
@@ -0,0 +1,68 @@
+"""日粒度数组：提交后增量更新，扩容时不改动读者手里的旧对象。"""
+from __future__ import annotations
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from database.db_adapter import (get_series, insert_event, read_cache_stats, read_conn,
+                                 upsert_profile)
+from metrics.compute_metrics import aggregate_unprocessed_weeks
+
+WEEK = dt.date(2024, 1, 1)                 # 周一
+
+
+def test_growth_swaps_in_a_new_series():
+    uid = 900_301
+    for i in range(7):
+        insert_event(uid, date=WEEK + dt.timedelta(days=i), steps=1000 + i)
+    old = get_series(uid)
+    origin, cap = old.origin, old.capacity
+    steps = old.week("steps", WEEK)[0].copy()
+
+    insert_event(uid, date=WEEK + dt.timedelta(days=3), steps=5000)     # 放得下：原地更新
+    assert get_series(uid) is old
+    assert old.week("steps", WEEK)[0][3] == 5000
+    steps[3] = 5000
+
+    early = WEEK - dt.timedelta(days=100)                                  # 向前扩容
+    insert_event(uid, date=early, steps=42)
+    new = get_series(uid)
+    assert new is not old
+    assert (old.origin, old.capacity) == (origin, cap)                     # 旧对象原样
+    assert old.count("steps", early, early + dt.timedelta(days=1)) == 0
+    assert np.array_equal(old.week("steps", WEEK)[0], steps)
+    assert new.total("steps", early, early + dt.timedelta(days=1)) == 42
+    assert np.array_equal(new.week("steps", WEEK)[0], steps)
+
+
+def test_out_of_range_value_is_rejected():
+    uid = 900_302
+    insert_event(uid, date=WEEK, veggie_servings=5, high_fat_meals=1)
+    s = get_series(uid)
+    for col, bad in (("veggie_servings", 300), ("high_fat_meals", 128), ("water_ml", 40_000)):
+        with pytest.raises(ValueError, match=col):
+            insert_event(uid, date=WEEK, **{col: bad})
+    with read_conn() as c:
+        row = c.execute("SELECT veggie_servings, high_fat_meals FROM events "
+                        "WHERE user_id = ? AND date = ?;", (uid, WEEK)).fetchone()
+    assert tuple(row) == (5, 1)
+    assert get_series(uid) is s
+    assert s.points("veggie_servings", WEEK, WEEK + dt.timedelta(days=1))[1].tolist() == [5.0]
+
+
+def test_summary_and_profile_writes_keep_the_series():
+    uid = 900_303
+    for i in range(7):
+        insert_event(uid, date=WEEK + dt.timedelta(days=i), steps=1000)
+    s = get_series(uid)
+    loads = read_cache_stats()["series"]["loads"]
+
+    upsert_profile(uid, name="series")                 # 只动档案 / 周汇总：events 版本不变
+    aggregate_unprocessed_weeks(uid)
+    assert get_series(uid) is s
+
+    insert_event(uid, date=WEEK + dt.timedelta(days=7), steps=2000)   # 仍能原地增量更新
+    assert get_series(uid) is s
+    assert s.total("steps", WEEK, WEEK + dt.timedelta(days=8)) == 9000
+    assert read_cache_stats()["series"]["loads"] == loads
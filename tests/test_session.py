@@ -0,0 +1,33 @@
+"""登录凭据校验：篡改 / 过期 / 畸形凭据一律返回 None，不抛异常。"""
+from __future__ import annotations
+
+import pytest
+
+pytest.importorskip("streamlit")
+from ui import session                    # noqa: E402
+
+
+@pytest.fixture
+def secret(monkeypatch):
+    monkeypatch.setattr(session, "SESSION_SECRET", "test-secret")
+
+
+def test_valid_token_round_trips(secret):
+    assert session.verify_user_token(session.sign_user_token(900_401)) == 900_401
+
+
+def test_tampered_or_expired_token_is_rejected(secret):
+    uid, exp, sig = session.sign_user_token(900_401).split(".")
+    assert session.verify_user_token(f"900402.{exp}.{sig}") is None
+    assert session.verify_user_token(session.sign_user_token(900_401, ttl_sec=-1)) is None
+
+
+@pytest.mark.parametrize("token", ["", "abc", "1.2", "1.2.3.4", "1.9999999999.é",
+                                   "é.9999999999.00", "1.x.00", "1.9999999999.签名"])
+def test_malformed_token_is_rejected(secret, token):
+    assert session.verify_user_token(token) is None
+
+
+def test_no_secret_accepts_nothing(monkeypatch):
+    monkeypatch.setattr(session, "SESSION_SECRET", "")
+    assert session.verify_user_token("1.9999999999.00") is None
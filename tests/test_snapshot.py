@@ -0,0 +1,80 @@
+"""列式快照：增量导出只重写变化的分区，读取端列投影 / 日期过滤，写文件时不占写锁。"""
+from __future__ import annotations
+import datetime as dt
+
+import pytest
+
+pytest.importorskip("pyarrow")
+from database import snapshot                                          # noqa: E402
+from database.db_adapter import _POOL, insert_event, read_conn         # noqa: E402
+
+JAN, FEB = dt.date(2024, 1, 1), dt.date(2024, 2, 1)
+
+
+def _dirty(uid: int) -> set:
+    with read_conn() as c:
+        return {(r["table_name"], r["month"]) for r in c.execute(
+            "SELECT table_name, month FROM snapshot_dirty WHERE user_id = ?;", (uid,))}
+
+
+def _manifest(uid: int) -> dict:
+    with read_conn() as c:
+        return {(r["table_name"], r["month"]): r["rows"] for r in c.execute(
+            "SELECT table_name, month, rows FROM snapshot_manifest WHERE user_id = ?;", (uid,))}
+
+
+def test_incremental_export_and_projection(tmp_path):
+    uid = 900_801
+    for day in (JAN, JAN + dt.timedelta(days=1), FEB):
+        insert_event(uid, date=day, steps=1000, sleep_hours=7.0, mood_note="ok")
+    snapshot.export_snapshots(tmp_path)
+    assert _manifest(uid) == {("events", "2024-01"): 2, ("events", "2024-02"): 1}
+    assert not _dirty(uid)
+    assert snapshot.export_snapshots(tmp_path)["events"] == 0     # 没有改动：不重写
+
+    insert_event(uid, date=FEB + dt.timedelta(days=3), steps=3000)
+    assert _dirty(uid) == {("events", "2024-02")}
+    assert snapshot.export_snapshots(tmp_path)["events"] == 1     # 只重写 2 月分区
+    assert _manifest(uid)[("events", "2024-02")] == 2
+
+    t = snapshot.read_history("events", uid, columns=["steps"],
+                              start=JAN + dt.timedelta(days=1), end=FEB + dt.timedelta(days=3),
+                              root=tmp_path)
+    assert t.column_names == ["steps"]
+    assert t.column("steps").to_pylist() == [1000, 1000, 3000]
+
+
+def test_file_written_outside_write_lock(tmp_path, monkeypatch):
+    uid = 900_802
+    insert_event(uid, date=JAN, steps=1000)
+    owners = []
+    write = snapshot._write_partition
+
+    def spy(*a, **kw):
+        owners.append(_POOL._writer_owner)
+        return write(*a, **kw)
+
+    monkeypatch.setattr(snapshot, "_write_partition", spy)
+    snapshot.export_snapshots(tmp_path)
+    assert owners and set(owners) == {None}
+
+
+def test_failed_write_keeps_partition_dirty(tmp_path, monkeypatch):
+    uid = 900_803
+    insert_event(uid, date=JAN, steps=1000)
+    snapshot.export_snapshots(tmp_path)
+    insert_event(uid, date=JAN, steps=2000)
+
+    def boom(*a, **kw):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(snapshot, "_write_partition", boom)
+    with pytest.raises(OSError):
+        snapshot.export_snapshots(tmp_path)
+    assert ("events", "2024-01") in _dirty(uid)
+
+    monkeypatch.undo()
+    snapshot.export_snapshots(tmp_path)
+    assert not _dirty(uid)
+    t = snapshot.read_history("events", uid, ["steps"], root=tmp_path)
+    assert t.column("steps").to_pylist() == [2000]
@@ -0,0 +1,28 @@
+"""Prompt 预算：按优先级逐级压缩；压不进时计数而不打印。"""
+from __future__ import annotations
+
+from agent.token_budget import Section, count_tokens, fit
+from telemetry import instrument
+
+
+def _sections():
+    return [Section("档案", ["甲" * 40, "甲" * 10], priority=1),
+            Section("趋势", ["乙" * 40, "乙" * 10, ""], priority=0)]
+
+
+def test_lowest_priority_section_trimmed_first():
+    profile, trend = sections = _sections()
+    text = fit(sections, budget=40)
+    assert count_tokens(text) <= 40
+    assert (profile.level, trend.level) == (0, 1)      # 只压了低优先级的趋势段
+
+
+def test_over_budget_is_counted_not_printed(monkeypatch, capsys):
+    monkeypatch.setattr(instrument, "ENABLED", True)
+    instrument.reset()
+    text = fit(_sections(), budget=5)
+    assert "甲" * 10 in text                             # 全部压到最短后照常返回
+    assert capsys.readouterr().out == ""
+    snap = instrument.snapshot()
+    assert snap["counters"]["prompt_over_budget_total"][0]["value"] == 1
+    assert snap["histograms"]["prompt_over_budget_tokens"][0]["max"] == count_tokens(text) - 5
@@ -0,0 +1,77 @@
+"""写队列：同批单条失败隔离、整批失败经 Future 交给调用方、队列满时限流。"""
+from __future__ import annotations
+import sqlite3, threading
+
+import pytest
+
+from database.pool import ConnectionPool
+from database.write_queue import WriteQueue, WriteQueueFull
+from telemetry import instrument
+
+
+@pytest.fixture
+def pool(tmp_path):
+    p = ConnectionPool(tmp_path / "wq.sqlite")
+    with p.writer() as c:
+        c.execute("CREATE TABLE t (x INTEGER PRIMARY KEY);")
+    yield p
+    p.close_all()
+
+
+def _count(pool) -> int:
+    with pool.reader() as c:
+        return c.execute("SELECT COUNT(*) FROM t;").fetchone()[0]
+
+
+def _held_batch(q: WriteQueue, *fns):
+    """先用一条阻塞的写操作占住写线程，fns 在此期间入队，进入同一批（可能与占位操作同批）。"""
+    gate = threading.Event()
+    q.submit(lambda c: gate.wait(5))
+    futs = [q.submit(fn) for fn in fns]
+    gate.set()
+    return futs
+
+
+def test_failed_op_does_not_roll_back_its_batch(pool):
+    q = WriteQueue(pool)
+    ok1, bad, ok2 = _held_batch(q, lambda c: c.execute("INSERT INTO t VALUES (1);"),
+                                lambda c: c.execute("INSERT INTO t VALUES (1);"),
+                                lambda c: c.execute("INSERT INTO t VALUES (2);"))
+    ok1.result(5), ok2.result(5)
+    with pytest.raises(sqlite3.IntegrityError):
+        bad.result(5)
+    assert _count(pool) == 2
+    assert q.stats["batches"] <= 2
+    q.close()
+
+
+def test_batch_failure_reaches_every_future(pool, monkeypatch, capsys):
+    monkeypatch.setattr(instrument, "ENABLED", True)
+    instrument.reset()
+    q = WriteQueue(pool)
+    # 操作自行结束了事务：后续 RELEASE 失败，整批作废
+    futs = _held_batch(q, lambda c: c.execute("INSERT INTO t VALUES (1);"),
+                       lambda c: c.execute("ROLLBACK;"))
+    for f in futs:
+        with pytest.raises(sqlite3.OperationalError):
+            f.result(5)
+    assert _count(pool) == 0
+    assert capsys.readouterr().out == ""              # 库代码不打印，只计数
+    errors = instrument.snapshot()["counters"]["write_queue_errors_total"]
+    assert sum(e["value"] for e in errors) == 1
+    q.close()
+
+
+def test_reject_policy_raises_when_full(pool):
+    q = WriteQueue(pool, max_size=1, policy="reject")
+    gate = threading.Event()
+    q.submit(lambda c: gate.wait(5))
+    while q.pending():                                 # 写线程已取走第一条
+        pass
+    q.submit(lambda c: None)
+    with pytest.raises(WriteQueueFull):
+        q.submit(lambda c: None)
+    gate.set()
+    q.flush(5)
+    assert q.stats["rejected"] == 1
+    q.close()